@@ -0,0 +1,63 @@
+"""
+Startup memory benchmark for loading allgames.json.
+
+Writes a synthetic GetAppList file and compares the peak memory used by the
+old json.load based loading (plus the list of appid strings built by
+check_all_records) with the streaming parser in scraper/app_list.py.
+
+Usage: python3 benchmarks/app_list_memory.py [-a APPS]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from scraper import app_list  # noqa: E402
+
+
+def write_app_list(filename, apps):
+    appids = random.sample(range(10, apps * 8), apps)
+    with open(filename, "w") as f:
+        json.dump({"applist": {"apps": [{"appid": appid, "name": "Some Steam App Name #" + str(appid)}
+                                        for appid in appids]}}, f)
+
+
+def json_load(filename):
+    with open(filename, "r") as f:
+        games = json.load(f)["applist"]["apps"]
+    return sorted([str(game["appid"]) for game in games], key=int)
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()  # Measured separately, tracing slows everything down
+    result = function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-a", "--apps", type=int, default=150000, help="Number of apps in the app list.")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, "allgames.json")
+        write_app_list(filename, args.apps)
+        print("App list: %d apps, %.1f MB" % (args.apps, os.path.getsize(filename) / 1024 / 1024))
+
+        old, old_time, old_peak = measure(json_load, filename)
+        new, new_time, new_peak = measure(app_list.load_appids, filename)
+        assert [int(appid) for appid in old] == list(new), "Streaming parser returned a different list"
+        print("json.load: %7.1f MB peak  %6.3fs" % (old_peak, old_time))
+        print("streaming: %7.1f MB peak  %6.3fs" % (new_peak, new_time))
+        print("peak memory reduced %.1fx" % (old_peak / new_peak))
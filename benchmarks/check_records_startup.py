@@ -0,0 +1,83 @@
+"""
+Startup benchmark for GameScraper.check_all_records.
+
+Builds a temporary database holding 100k games (plus some inaccessible apps)
+and compares the old per-appid is_not_recorded() lookup with the set-based
+filtering used by check_all_records(). Without override_missing the old
+lookup scans the games/inaccessible union for every appid, so it is timed
+on a sample of the app list and extrapolated to the full list.
+
+Usage: python3 benchmarks/check_records_startup.py [-g GAMES] [-a APPS] [-s SAMPLE]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from scraper import db_handler, game_scraper  # noqa: E402
+
+
+def build_database(filename, games, inaccessible):
+    conn = sqlite3.connect(filename)
+    with conn:
+        c = conn.cursor()
+        db_handler.DBHandler.create_tables(c)
+        c.executemany("insert into games (id, name) values(?,?)",
+                      ((appid, "Game " + str(appid)) for appid in range(0, games * 2, 2)))
+        c.executemany("insert into inaccessible (id) values(?)",
+                      ((appid,) for appid in range(1, inaccessible * 2, 2)))
+    conn.close()
+
+
+def make_scraper(filename, override_missing):
+    # Skip Scraper.__init__, it would try to load allgames.json
+    scraper = game_scraper.GameScraper.__new__(game_scraper.GameScraper)
+    scraper.DATABASE_FILE = filename
+    scraper.override_missing = override_missing
+    return scraper
+
+
+def per_appid(scraper, appids):
+    conn = sqlite3.connect(scraper.DATABASE_FILE)
+    result = []
+    for appid in appids:
+        if scraper.is_not_recorded(conn, appid) is True:
+            result.append(appid)
+    return result
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-g", "--games", type=int, default=100000, help="Number of games in the database.")
+    arg_parser.add_argument("-a", "--apps", type=int, default=250000, help="Number of apps in the app list.")
+    arg_parser.add_argument("-s", "--sample", type=int, default=1000,
+                            help="Number of apps to time the per-appid lookup on.")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, "benchmark.db")
+        build_database(filename, args.games, args.games // 10)
+        appids = array("l", range(args.apps))
+
+        for override_missing in (False, True):
+            scraper = make_scraper(filename, override_missing)
+            sample = appids[::max(1, len(appids) // args.sample)]
+            old, old_time = timed(per_appid, scraper, sample)
+            old_time = old_time * len(appids) / len(sample)
+            new, new_time = timed(scraper.check_all_records, appids)
+            sampled = set(sample)
+            assert old == [appid for appid in new if appid in sampled], \
+                "Set-based filtering returned a different list"
+            print("override_missing=%-5s  per-appid (est.): %9.3fs  set-based: %7.3fs  speedup: %8.1fx  (%d to scrape)"
+                  % (override_missing, old_time, new_time, old_time / new_time, len(new)))
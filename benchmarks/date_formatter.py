@@ -0,0 +1,93 @@
+"""
+Benchmark of DateFormatter.format_date over a corpus of release dates.
+
+Compares the former implementation (every input format tried in turn with
+strptime) with the compiled fast path, with and without the memo, using the
+input formats configured by the scrapers. Results of every variant are
+checked against the former implementation.
+
+The default corpus mimics the release dates returned by the appdetails API:
+mostly "Oct 18, 2026" and "18 Oct, 2026" with a long tail of dates that are
+not parsed ("Coming soon", "Q3 2026", ...), each date repeated by many
+games. A real corpus, one release date per line, can be given with -f.
+
+Usage: python3 benchmarks/date_formatter.py [-n ENTRIES] [-f FILE]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from scraper.date_formatter import DateFormatter  # noqa: E402
+
+INPUT_FORMATS = ("%b %d, %Y", "%B %d, %Y", "%d %b, %Y", "%d %B, %Y", "%b %d %Y", "%B %d %Y", "%d %b %Y",
+                 "%d %B %Y", "%b %Y")
+UNPARSED = ("Coming soon", "To be announced", "TBA", "Q1 2027", "Q3 2026", "2026", "2027", "Winter 2026",
+            "Early Access", "When it's done")
+
+
+def generate_corpus(entries, seed=0):
+    rng = random.Random(seed)
+    first_day = datetime.date(2006, 1, 1).toordinal()
+    last_day = datetime.date(2026, 12, 31).toordinal()
+    corpus = []
+    for i in range(entries):
+        date = datetime.date.fromordinal(int(last_day - (last_day - first_day) * rng.random() ** 2))
+        shape = rng.random()
+        if shape < 0.70:
+            corpus.append(date.strftime("%b ") + str(date.day) + date.strftime(", %Y"))
+        elif shape < 0.90:
+            corpus.append(str(date.day) + date.strftime(" %b, %Y"))
+        elif shape < 0.94:
+            corpus.append(date.strftime("%b %Y"))
+        elif shape < 0.96:
+            corpus.append(date.strftime("%B %Y"))
+        else:
+            corpus.append(rng.choice(UNPARSED))
+    return corpus
+
+
+def strptime_only(entry):
+    """Former DateFormatter.format_date."""
+    for input_format in INPUT_FORMATS:
+        try:
+            return datetime.datetime.strptime(DateFormatter.trim(entry), input_format).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return entry
+
+
+def measure(name, function, corpus, expected):
+    results = [function(entry) for entry in corpus]
+    assert results == expected, name + " differs from strptime"
+    start = time.perf_counter()
+    for entry in corpus:
+        function(entry)
+    elapsed = time.perf_counter() - start
+    print("%-18s %10.0f dates/s" % (name, len(corpus) / elapsed))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-n", "--entries", type=int, default=100000, help="Number of generated release dates.")
+    arg_parser.add_argument("-f", "--file", help="File holding one release date per line, instead of a generated corpus.")
+    args = arg_parser.parse_args()
+
+    if args.file is not None:
+        with open(args.file, "r") as f:
+            corpus = [line.rstrip("\n") for line in f]
+    else:
+        corpus = generate_corpus(args.entries)
+    print("%d release dates, %d distinct" % (len(corpus), len(set(corpus))))
+
+    formatter = DateFormatter("%Y-%m-%d")
+    formatter.set_input_formats(list(INPUT_FORMATS))
+    expected = [strptime_only(entry) for entry in corpus]
+    measure("strptime", strptime_only, corpus, expected)
+    measure("fast path", formatter.convert, corpus, expected)
+    formatter.memo = {}
+    measure("fast path + memo", formatter.format_date, corpus, expected)
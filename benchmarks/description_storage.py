@@ -0,0 +1,107 @@
+"""
+Storage benchmark for the descriptions of the games.
+
+Builds a temporary database at the schema version preceding the
+description blobs, with the descriptions in the text columns of the games
+table, then migrates it. Compares the size of the file and the time taken
+to read every description before and after. Descriptions are generated
+HTML; as on Steam, about_the_game usually repeats detailed_description,
+and DLCs often share the texts of their game.
+
+Usage: python3 benchmarks/description_storage.py [-g GAMES] [-d DLC_SHARE]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from scraper import compression, db_handler, descriptions, migrations  # noqa: E402
+
+WORDS = ("explore build fight craft survive dungeon roguelike space station colony strategy story puzzle "
+         "deck cards turn based pixel art open world multiplayer co-op friends procedurally generated levels "
+         "weapons upgrades boss secrets soundtrack original hand drawn hours content achievements").split()
+
+
+def paragraph(rng, words):
+    return "<p>" + " ".join(rng.choice(WORDS) for _ in range(words)) + ".</p>"
+
+
+def description(rng):
+    parts = ['<h2 class="bb_tag">About</h2>']
+    for _ in range(rng.randint(3, 12)):
+        parts.append(paragraph(rng, rng.randint(30, 120)))
+        if rng.random() < 0.5:
+            parts.append('<img src="https://cdn.akamai.steamstatic.com/steam/apps/%d/extras/%d.gif" />'
+                         % (rng.randint(1, 2000000), rng.randint(1, 99)))
+    parts.append("<ul class=\"bb_ul\">" + "".join("<li>" + paragraph(rng, 8)[3:-4] + "</li>" for _ in range(6)) +
+                 "</ul>")
+    return "<br>".join(parts)
+
+
+def build_database(filename, games, dlc_share, seed=1):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(filename)
+    for version, name, script in migrations.MIGRATIONS:
+        if version < 8:
+            conn.executescript("BEGIN;" + script + "PRAGMA user_version = %d; COMMIT;" % version)
+    rows = []
+    previous = None
+    for appid in range(10, games * 10 + 10, 10):
+        if previous is not None and rng.random() < dlc_share:
+            detailed, about, short = previous
+        else:
+            detailed = description(rng)
+            about = detailed if rng.random() < 0.8 else description(rng)
+            short = paragraph(rng, 25)[3:-4]
+            previous = (detailed, about, short)
+        rows.append((appid, "Game " + str(appid), detailed, about, short))
+    with conn:
+        conn.executemany("insert into games (id, name, detailed_description, about_the_game, short_description) "
+                         "values(?,?,?,?,?)", rows)
+    conn.close()
+
+
+def read_all(filename, query):
+    conn = sqlite3.connect(filename)
+    descriptions.register(conn)
+    start = time.perf_counter()
+    total = sum(len(text or "") for row in conn.execute(query) for text in row)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return total, elapsed
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-g", "--games", type=int, default=20000, help="Number of games in the database.")
+    arg_parser.add_argument("-d", "--dlc-share", type=float, default=0.3,
+                            help="Share of the games repeating the descriptions of the previous one.")
+    args = arg_parser.parse_args()
+    columns = ", ".join(descriptions.COLUMNS)
+
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, "benchmark.db")
+        build_database(filename, args.games, args.dlc_share)
+        size_before = os.path.getsize(filename)
+        text_before, read_before = read_all(filename, "select %s from games" % columns)
+
+        start = time.perf_counter()
+        db_handler.DBHandler(filename)
+        migration_time = time.perf_counter() - start
+        size_after = os.path.getsize(filename)
+        text_after, read_after = read_all(filename, "select %s from game_descriptions" % columns)
+        assert text_before == text_after, "Descriptions differ after the migration"
+
+        conn = sqlite3.connect(filename)
+        blobs = conn.execute("select count(*) from description_blobs").fetchone()[0]
+        conn.close()
+        print("codec: %s  games: %d  distinct descriptions: %d  migration: %.1fs"
+              % (compression.CODEC, args.games, blobs, migration_time))
+        print("file size:   %8.1f MB -> %8.1f MB  (%.1fx smaller)"
+              % (size_before / 1e6, size_after / 1e6, size_before / size_after))
+        print("read all:    %8.3f s  -> %8.3f s   (%.1f MB of text)" % (read_before, read_after, text_before / 1e6))
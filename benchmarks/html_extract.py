@@ -0,0 +1,66 @@
+"""
+Microbenchmark of the store page extraction backends.
+
+Every page in scraper/testing/store_pages is padded to roughly the size of a
+real store page (about 1 MB, mostly descriptions, screenshots and scripts)
+and run through each available backend of scraper/html_extractor.py. The
+results of every backend are checked against BeautifulSoup.
+
+Usage: python3 benchmarks/html_extract.py [-n ROUNDS] [-s SIZE_KB]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from scraper import html_extractor  # noqa: E402
+
+FILLER = ('<div class="highlight_strip_item highlight_strip_screenshot" id="thumb_screenshot_%d">'
+          '<img src="https://cdn.akamai.steamstatic.com/steam/apps/105600/ss_%d.116x65.jpg" alt="Screenshot"></div>\n'
+          '<p class="game_area_description_para">Lorem ipsum dolor sit amet, <b>consectetur</b> adipiscing elit, '
+          'sed do eiusmod tempor incididunt ut labore et dolore magna aliqua &amp; more.</p>\n'
+          '<script>rgScreenshotURLs["ss_%d.jpg"] = "https:\\/\\/cdn.akamai.steamstatic.com\\/%d.jpg";</script>\n')
+
+
+def pad(page, size):
+    filler = []
+    length = len(page)
+    i = 0
+    while length < size:
+        block = FILLER % (i, i, i, i)
+        filler.append(block)
+        length += len(block)
+        i += 1
+    position = page.rfind(b"</body>")
+    return page[:position] + "".join(filler).encode("utf-8") + page[position:]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-n", "--rounds", type=int, default=5, help="Number of passes over the pages.")
+    arg_parser.add_argument("-s", "--size", type=int, default=1024, help="Size of a padded page in KB.")
+    args = arg_parser.parse_args()
+
+    pages = []
+    for filename in sorted(glob.glob(os.path.join(ROOT, "scraper", "testing", "store_pages", "*.html"))):
+        with open(filename, "rb") as f:
+            pages.append(pad(f.read(), args.size * 1024))
+
+    expected = [html_extractor.bs4_extract(page) for page in pages]
+    for backend in [html_extractor.AUTO] + html_extractor.available_backends():
+        extract = html_extractor.EXTRACTORS.get(backend, html_extractor.extract)
+        results = [extract(page) for page in pages]
+        for result, reference in zip(results, expected):
+            assert result is None or result == reference, backend + " backend differs from BeautifulSoup"
+        start = time.perf_counter()
+        for i in range(args.rounds):
+            for page in pages:
+                extract(page)
+        elapsed = time.perf_counter() - start
+        fallbacks = sum(1 for result in results if result is None)
+        print("%-6s %8.1f pages/s%s" % (backend, args.rounds * len(pages) / elapsed,
+                                        "  (%d of %d pages rejected)" % (fallbacks, len(pages)) if fallbacks else ""))
@@ -0,0 +1,332 @@
+"""
+Offline replay benchmark of the scraper.
+
+Starts a local HTTP server standing in for Steam, serving the recorded
+appdetails responses of benchmarks/fixtures/appdetails and the store pages of
+scraper/testing/store_pages, then runs the runtypes of main.py against it,
+each in a fresh process. The server can add latency and inject 429 and 500
+responses. Like Steam, it redirects the store pages of mature games to an age
+check unless the age gate cookies are sent, compresses responses when asked
+to, and keeps connections alive.
+
+For every runtype the harness reports the number of records per second, the
+median and 99th percentile latency of a record (from its request to its
+handover to the database writer) and the peak RSS of the scraper process.
+Results are saved as JSON; give the file of a previous run to --compare to
+see the changes.
+
+Runtypes other than api and all need games in the database, so api runs
+first (unreported if not selected).
+
+Usage: python3 benchmarks/replay.py [-n APPS] [-r RUNTYPE ...] [--latency MS] [--throttle-rate R]
+                                    [--error-rate R] [--mature-rate R] [-o FILE] [--compare FILE]
+"""
+import argparse
+import datetime
+import glob
+import gzip
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from html_extract import pad  # noqa: E402
+
+# Runtypes in the order they run, and whether they start from an empty database
+RUNTYPES = (
+    ("api", True),
+    ("webui", False),
+    ("store_page", False),
+    ("rating_update", False),
+    ("update", False),
+    ("price_update", False),
+    ("reprocess", False),  # Reads back the responses archived by the runtypes before it
+    ("all", True),
+)
+
+
+class SteamStandIn:
+    """Responses served by the stand-in server, and the faults it injects."""
+
+    def __init__(self, apps, latency, jitter, throttle_rate, error_rate, inaccessible_rate, change_rate, page_size,
+                 mature_rate=0.0, seed=0):
+        self.apps = apps
+        self.positions = dict((appid, position) for position, appid in enumerate(apps))
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.inaccessible_rate = inaccessible_rate
+        self.change_rate = change_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.mature = set(appid for appid in apps if self.random.random() < mature_rate)
+        self.details = []
+        for filename in sorted(glob.glob(os.path.join(FIXTURES, "appdetails", "*.json"))):
+            with open(filename, "r") as f:
+                self.details.append(json.load(f))
+        self.pages = []
+        for filename in sorted(glob.glob(os.path.join(ROOT, "scraper", "testing", "store_pages", "*.html"))):
+            with open(filename, "rb") as f:
+                page = f.read()
+            page = pad(page, page_size * 1024) if page_size > 0 else page
+            if os.path.basename(filename) == "agecheck.html":
+                self.agecheck_page = page
+            else:
+                self.pages.append(page)
+        self.compressed = dict((id(page), gzip.compress(page)) for page in self.pages + [self.agecheck_page])
+
+    def fixture(self, fixtures, appid):
+        """Fixture served for an app, the apps going through every fixture in turn."""
+        return fixtures[self.positions.get(appid, appid) % len(fixtures)]
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def app_list(self):
+        apps = [{"appid": appid, "name": "App " + str(appid)} for appid in self.apps]
+        return {"applist": {"apps": apps}}
+
+    def app_details(self, appid, price_only):
+        if self.roll(self.inaccessible_rate):
+            return {"success": False}
+        data = dict(self.fixture(self.details, appid))
+        data["steam_appid"] = appid
+        data["name"] = data["name"] + " " + str(appid)
+        if self.roll(self.change_rate) and "recommendations" in data:
+            data["recommendations"] = {"total": self.random.randint(0, 10 ** 6)}
+        if price_only:
+            data = {"price_overview": data["price_overview"]} if "price_overview" in data else []
+        return {"success": True, "data": data}
+
+    def store_page(self, appid):
+        return self.fixture(self.pages, appid)
+
+    def respond(self, path, query, request_headers):
+        """
+        :return: tuple (status, content type, body, extra headers)
+        """
+        status, content_type, body, headers = self.route(path, query, request_headers.get("Cookie", ""))
+        if status == 200 and "gzip" in request_headers.get("Accept-Encoding", ""):
+            compressed = self.compressed.get(id(body))
+            body = compressed if compressed is not None else gzip.compress(body, 1)
+            headers = dict(headers, **{"Content-Encoding": "gzip"})
+        return status, content_type, body, headers
+
+    def route(self, path, query, cookies):
+        with self.lock:
+            self.requests += 1
+        if self.latency > 0:
+            time.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)) / 1000)
+        if self.roll(self.throttle_rate):
+            return 429, "text/plain", b"Too Many Requests", {"Retry-After": "0"}
+        if self.roll(self.error_rate):
+            return 500, "text/plain", b"Internal Server Error", {}
+        if path.startswith("/api/appdetails"):
+            appids = [int(appid) for appid in query.get("appids", [""])[0].split(",") if appid]
+            price_only = query.get("filters", [""])[0] == "price_overview"
+            body = dict((str(appid), self.app_details(appid, price_only)) for appid in appids)
+            return 200, "application/json", json.dumps(body).encode("utf-8"), {}
+        if path.startswith("/app/"):
+            appid = int(path.split("/")[2])
+            if appid in self.mature and "birthtime=" not in cookies:
+                return 302, "text/plain", b"", {"Location": "/agecheck/app/" + str(appid) + "/"}
+            return 200, "text/html; charset=UTF-8", self.store_page(appid), {}
+        if path.startswith("/agecheck/app/"):
+            return 200, "text/html; charset=UTF-8", self.agecheck_page, {}
+        if path.startswith("/ISteamApps/GetAppList"):
+            return 200, "application/json", json.dumps(self.app_list()).encode("utf-8"), {}
+        return 404, "text/plain", b"Not Found", {}
+
+
+def start_server(stand_in):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            BaseHTTPRequestHandler.setup(self)
+            with stand_in.lock:
+                stand_in.connections += 1
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            status, content_type, body, headers = stand_in.respond(url.path, parse_qs(url.query), self.headers)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_config(filename, folder, url, args):
+    config = {
+        "DATABASE_FILENAME": os.path.join(folder, "db"),
+        "ALLGAMES_FILENAME": os.path.join(folder, "allgames.json"),
+        "TIMEOUT": 1,
+        "STARTING_APPID": 0,
+        "JSON_MAX_FILE_AGE": 7,
+        "LOGFILE_NAME": os.path.join(folder, "log"),
+        "CONCURRENT_REQUESTS": args.concurrency,
+        "PARSE_PROCESSES": args.parse_processes,
+        "RATE_LIMIT_APPDETAILS": args.rate,
+        "RATE_LIMIT_STORE_PAGE": args.rate,
+        "RATE_LIMIT_DEFAULT": args.rate,
+        "STORE_URL": url,
+        "API_URL": url,
+        "ARCHIVE_DIRECTORY": os.path.join(folder, "archive"),
+    }
+    with open(filename, "w") as f:
+        for key, value in config.items():
+            f.write("%s: %s\n" % (key, value))
+
+
+def run_runtype(runtype, config_file, report_file):
+    """
+    Runs main.py in a new process.
+    :return: tuple (list of scraper reports, peak RSS in MB or None)
+    """
+    command = [sys.executable, os.path.join(ROOT, "main.py"), runtype, "-c", config_file, "--report", report_file]
+    process = subprocess.Popen(command, cwd=ROOT, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    if hasattr(os, "wait4"):
+        pid, status, usage = os.wait4(process.pid, 0)
+        process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        peak_rss = usage.ru_maxrss / 1024  # KB on Linux
+    else:
+        process.wait()
+        peak_rss = None
+    if process.returncode != 0:
+        raise RuntimeError(runtype + " exited with code " + str(process.returncode))
+    with open(report_file, "r") as f:
+        return json.load(f), peak_rss
+
+
+def summarise(reports, peak_rss):
+    records = sum(report["records"] for report in reports)
+    elapsed = sum(report["elapsed"] for report in reports)
+    latencies = [report for report in reports if report.get("latency_p50") is not None]
+    return {
+        "records": records,
+        "elapsed": elapsed,
+        "records_per_second": records / elapsed if elapsed > 0 else 0,
+        # For runtypes made of several scrapers, the worst of them
+        "latency_p50": max(report["latency_p50"] for report in latencies) if latencies else None,
+        "latency_p99": max(report["latency_p99"] for report in latencies) if latencies else None,
+        "peak_rss_mb": peak_rss,
+        "scrapers": reports,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_row(runtype, result, previous=None):
+    def ms(value):
+        return "%8.1f" % (value * 1000) if value is not None else "       -"
+    line = "%-14s %7d records %9.1f rec/s  p50 %s ms  p99 %s ms  RSS %7s MB" % (
+        runtype, result["records"], result["records_per_second"], ms(result["latency_p50"]),
+        ms(result["latency_p99"]), "%.1f" % result["peak_rss_mb"] if result["peak_rss_mb"] is not None else "-")
+    if previous is not None and previous["records_per_second"] > 0:
+        line += "  (%+.1f%% rec/s)" % (100 * (result["records_per_second"] / previous["records_per_second"] - 1))
+    print(line)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-n", "--apps", type=int, default=500, help="Number of apps in the app list.")
+    arg_parser.add_argument("-r", "--runtype", action="append", choices=[runtype for runtype, fresh in RUNTYPES],
+                            help="Runtype to benchmark, can be repeated. All of them by default.")
+    arg_parser.add_argument("--latency", type=float, default=20, help="Mean latency of a response in ms.")
+    arg_parser.add_argument("--jitter", type=float, default=10, help="Maximum deviation from the mean latency in ms.")
+    arg_parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500.")
+    arg_parser.add_argument("--inaccessible-rate", type=float, default=0.05,
+                            help="Fraction of appdetails responses with success: false.")
+    arg_parser.add_argument("--change-rate", type=float, default=0.1,
+                            help="Fraction of appdetails responses that differ from the previous one.")
+    arg_parser.add_argument("--mature-rate", type=float, default=0.1,
+                            help="Fraction of store pages behind the age gate.")
+    arg_parser.add_argument("--page-size", type=int, default=256, help="Size store pages are padded to, in KB.")
+    arg_parser.add_argument("--concurrency", type=int, default=8, help="CONCURRENT_REQUESTS of the scraper.")
+    arg_parser.add_argument("--parse-processes", type=int, default=2, help="PARSE_PROCESSES of the scraper.")
+    arg_parser.add_argument("--rate", type=float, default=1000, help="Initial rate limit of the scraper, requests/s.")
+    arg_parser.add_argument("-o", "--output", help="File to save the results to, benchmark_<date>.json by default.")
+    arg_parser.add_argument("--compare", help="Results of a previous run to compare with.")
+    args = arg_parser.parse_args()
+
+    selected = args.runtype or [runtype for runtype, fresh in RUNTYPES]
+    previous = None
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)["runtypes"]
+
+    stand_in = SteamStandIn(list(range(10, 10 * (args.apps + 1), 10)), args.latency, args.jitter,
+                            args.throttle_rate, args.error_rate, args.inaccessible_rate, args.change_rate,
+                            args.page_size, args.mature_rate)
+    server = start_server(stand_in)
+    url = "http://127.0.0.1:%d" % server.server_address[1]
+    folder = tempfile.mkdtemp(prefix="steam_scraper_benchmark_")
+    results = {}
+    try:
+        config_file = os.path.join(folder, "config.yml")
+        write_config(config_file, folder, url, args)
+        with open(os.path.join(folder, "allgames.json"), "w") as f:
+            json.dump(stand_in.app_list(), f)
+
+        has_games = False
+        for runtype, fresh in RUNTYPES:
+            if runtype not in selected:
+                continue
+            if fresh:
+                for filename in glob.glob(os.path.join(folder, "db*")):
+                    os.remove(filename)
+            elif not has_games:
+                run_runtype("api", config_file, os.path.join(folder, "report.json"))
+            reports, peak_rss = run_runtype(runtype, config_file, os.path.join(folder, "report.json"))
+            has_games = True
+            results[runtype] = summarise(reports, peak_rss)
+            print_row(runtype, results[runtype], previous.get(runtype) if previous else None)
+    finally:
+        server.shutdown()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    print("%d requests over %d connections" % (stand_in.requests, stand_in.connections))
+    output = args.output or "benchmark_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + ".json"
+    with open(output, "w") as f:
+        json.dump({
+            "commit": git_commit(),
+            "date": datetime.datetime.now().isoformat(),
+            "options": vars(args),
+            "server_requests": stand_in.requests,
+            "server_connections": stand_in.connections,
+            "runtypes": results,
+        }, f, indent=2)
+    print("Results saved to " + output)
@@ -1,10 +1,18 @@
 import argparse
+import json
+import sqlite3
+import time
 from scraper import game_scraper
 from scraper import webui_scraper
 from scraper import db_handler
 from scraper import common
 from scraper import games_update_scraper
 from scraper import rating_scraper
+from scraper import price_scraper
+from scraper import store_page_scraper
+from scraper import export
+from scraper import search
+from scraper import reprocess_scraper
 
 DEFAULT_CONFIG_FILE = "config.yml"
 
@@ -22,9 +30,26 @@ if __name__ == "__main__":
                                  "so no tags will be parsed. - webui - Will only parse games tags from Steam Web UI. "
                                  "It will only run for the games that have been saved to the database but have no "
                                  "tags saved associated with them. - update - Will loop through every game record already in"
-                                 "the dabatase and update it with the latest information."
+                                 "the dabatase, stalest first, and update it with the latest information. - "
+                                 "rating_update - Will refresh the rating and reviews of every game, stalest first. "
+                                 "- price_update - Will "
+                                 "poll the prices of every game in the database in large batches and record the "
+                                 "ones that changed in the price history. - store_page - Will fetch the store page "
+                                 "of every game in the database once and run every extractor enabled in the config "
+                                 "on it (tags, rating, reviews, dlc, controller_support). - export - Will write "
+                                 "the games and their child tables to Parquet, Arrow or gzipped CSV files in "
+                                 "EXPORT_DIRECTORY, chunk by chunk, without holding the database for long. - "
+                                 "search - Will list the games whose name or descriptions contain every word of "
+                                 "the query, best match first. Requires SEARCH_INDEX. - reprocess - Will parse the "
+                                 "appdetails responses and store pages kept in ARCHIVE_DIRECTORY again, without any "
+                                 "request to Steam, and update the database with the result; useful after a "
+                                 "parsing fix."
                                  "",
-                            choices=("all", "api", "webui", "update", "rating_update"))
+                            choices=("all", "api", "webui", "update", "rating_update", "price_update",
+                                     "store_page", "export", "search", "reprocess"))
+    arg_scraper.add_argument(dest="query", nargs="*",
+                            help="Words to look for in search mode. A word ending with * matches every word "
+                                 "starting with it.")
     arg_scraper.add_argument("-v", "--verbose",
                             help="Increase verbosity of the script, displaying every record it goes through. "
                                  "By default that output goes to a log file.",
@@ -32,28 +57,84 @@ if __name__ == "__main__":
     arg_scraper.add_argument("-f", "--force",
                             help="Don't skip records that were previously inaccessible, attempt to retrieve them again.",
                             action="store_true")
-    args = arg_scraper.parse_args()
+    arg_scraper.add_argument("-c", "--config",
+                            help="Config file to use instead of " + DEFAULT_CONFIG_FILE + ".",
+                            default=DEFAULT_CONFIG_FILE)
+    arg_scraper.add_argument("--report",
+                            help="Write a JSON summary of the run (records per second, latency, throughput of every "
+                                 "stage) to the given file.")
+    arg_scraper.add_argument("--budget", type=common.parse_duration,
+                            help="Time after which no new record is started, such as 4h or 1h30m. The records "
+                                 "are refreshed stalest first in update and rating_update modes, so the most "
+                                 "valuable ones are done by then.")
+    arg_scraper.add_argument("--format", choices=export.FORMATS, default=export.AUTO,
+                            help="Format of the files written in export mode. auto writes Parquet when pyarrow is "
+                                 "installed and gzipped CSV otherwise.")
+    arg_scraper.add_argument("--join",
+                            help="In export mode, add the child tables to the games as list columns instead of "
+                                 "writing them to files of their own.",
+                            action="store_true")
+    arg_scraper.add_argument("--limit", type=int, default=20,
+                            help="Maximum number of games listed in search mode.")
+    args = arg_scraper.parse_intermixed_args()  # The words of the query may come after the options
+    if args.runtype != "search" and len(args.query) > 0:
+        arg_scraper.error("unrecognized arguments: " + " ".join(args.query))
+    if args.runtype == "search" and len(args.query) == 0:
+        arg_scraper.error("search mode needs the words to look for")
 
-    config = common.read_config_file(DEFAULT_CONFIG_FILE)
+    config_file = args.config
+    config = common.read_config_file(config_file)
     db_file = config["DATABASE_FILENAME"]
-    db_handler.DBHandler(db_file)
+    db_handler.DBHandler(db_file, common.get_bool(config.get("SEARCH_INDEX", False)))
 
     verbose = args.verbose
     force = args.force
+    scrapers = []
+    deadline = time.time() + args.budget if args.budget is not None else None
+
+    def run(scraper):
+        scrapers.append(scraper)
+        scraper.start_scraping(max(0.0, deadline - time.time()) if deadline is not None else None)
+
     if args.runtype == "all":
-        game_scraper = game_scraper.GameScraper(DEFAULT_CONFIG_FILE, verbose, force)
-        game_scraper.start_scraping()
-        tags_scraper = webui_scraper.WebUIScraper(DEFAULT_CONFIG_FILE, verbose)
-        tags_scraper.start_scraping()
+        run(game_scraper.GameScraper(config_file, verbose, force))
+        run(webui_scraper.WebUIScraper(config_file, verbose))
     elif args.runtype == "api":
-        game_scraper = game_scraper.GameScraper(DEFAULT_CONFIG_FILE, verbose, force)
-        game_scraper.start_scraping()
+        run(game_scraper.GameScraper(config_file, verbose, force))
     elif args.runtype == "webui":
-        tags_scraper = webui_scraper.WebUIScraper(DEFAULT_CONFIG_FILE, verbose)
-        tags_scraper.start_scraping()
+        run(webui_scraper.WebUIScraper(config_file, verbose))
     elif args.runtype == "update":
-        upd_scraper = games_update_scraper.UpdateGamesScraper(DEFAULT_CONFIG_FILE, verbose)
-        upd_scraper.start_scraping()
+        run(games_update_scraper.UpdateGamesScraper(config_file, verbose))
     elif args.runtype == "rating_update":
-        rating_scraper = rating_scraper.RatingScraper(DEFAULT_CONFIG_FILE, verbose)
-        rating_scraper.start_scraping()
+        run(rating_scraper.RatingScraper(config_file, verbose))
+    elif args.runtype == "price_update":
+        run(price_scraper.PriceScraper(config_file, verbose))
+    elif args.runtype == "store_page":
+        run(store_page_scraper.StorePageScraper(config_file, verbose))
+    elif args.runtype == "reprocess":
+        if not config.get("ARCHIVE_DIRECTORY"):
+            common.printcolor("The archive is disabled, set ARCHIVE_DIRECTORY in the config file.", common.Color.FAIL)
+            exit(1)
+        run(reprocess_scraper.ReprocessGamesScraper(config_file, verbose))
+        run(reprocess_scraper.ReprocessStorePagesScraper(config_file, verbose))
+    elif args.runtype == "export":
+        start_time = time.time()
+        exporter = export.Exporter(db_file, config.get("EXPORT_DIRECTORY") or "export", args.format,
+                                   int(config.get("EXPORT_CHUNK_SIZE", 2000)), args.join)
+        for table, rows in exporter.export().items():
+            print("Exported " + str(rows) + " rows of " + table + ".")
+        common.printcolor("Files written to " + exporter.directory + " in " +
+                          common.seconds_to_string(common.get_elapsed_time(start_time)), common.Color.OKBLUE)
+    elif args.runtype == "search":
+        conn = sqlite3.connect(db_file)
+        if not search.has_index(conn):
+            common.printcolor("The database has no search index, enable SEARCH_INDEX in the config file.",
+                              common.Color.FAIL)
+            exit(1)
+        for appid, name, score in search.search(conn, " ".join(args.query), args.limit):
+            print("%10d  %6.2f  %s" % (appid, score, name))
+        conn.close()
+
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump([scraper.report() for scraper in scrapers], f, indent=2)
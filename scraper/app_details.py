@@ -0,0 +1,271 @@
+import hashlib
+import json
+import re
+from collections import Counter
+from . import common, dimensions, descriptions
+
+# Columns of the games table filled from the appdetails API, in the order
+# parse_app_details() returns them. The id column is not included.
+GAME_COLUMNS = ("name", "type", "required_age", "is_free", "full_game_id", "detailed_description",
+                "about_the_game", "short_description", "price", "recommendations", "is_released",
+                "release_date", "screenshots", "movies", "achievements")
+
+# Child tables filled from the appdetails API and their columns, gameid excluded.
+CHILD_TABLES = {
+    "languages": ("name",),
+    "developers": ("name",),
+    "publishers": ("name",),
+    "platforms": ("name", "status"),
+    "metacritic": ("score", "url"),
+    "categories": ("name",),
+    "genres": ("name",),
+}
+
+
+
+def game_column(column):
+    """:return: column of the games table holding a column of GAME_COLUMNS, and the placeholder of its value"""
+    if column in descriptions.COLUMNS:
+        return descriptions.blob_column(column), descriptions.BLOB_ID
+    return column, "?"
+
+
+# Parameters of both statements are returned by game_params()
+INSERT_GAME = "insert into games (id, %s) values(?,%s)" % (", ".join(game_column(column)[0] for column in GAME_COLUMNS),
+                                                           ",".join(game_column(column)[1] for column in GAME_COLUMNS))
+UPDATE_GAME = "update games set %s where id=?" % ", ".join("%s=%s" % game_column(column) for column in GAME_COLUMNS)
+
+
+def game_params(rec, game):
+    """
+    Adds to a database record the statements storing the descriptions of a
+    game, see descriptions.py.
+    :param rec: db_writer.Record
+    :param game: tuple returned by parse_app_details()
+    :return: parameters of INSERT_GAME and UPDATE_GAME, without the id
+    """
+    return tuple(descriptions.store(rec, value) if column in descriptions.COLUMNS else value
+                 for column, value in zip(GAME_COLUMNS, game))
+
+
+def insert_game(rec, appid, data):
+    """
+    Adds to a database record the insertion of a game, its child rows and
+    its fingerprint.
+    :param rec: db_writer.Record
+    :param appid: id of the game
+    :param data: dictionary returned by parse_response(), for a success
+    """
+    rec.execute(INSERT_GAME, (appid,) + game_params(rec, data["game"]))
+    for table, rows in data["children"].items():
+        insert_children(rec, table, [row + (appid,) for row in rows])
+    rec.execute("insert or replace into fingerprints (gameid, hash) values(?,?)", (appid, data["fingerprint"]))
+
+
+def insert_child_stmt(table):
+    """
+    Builds an insert statement for one of CHILD_TABLES that is not in
+    dimensions.DIMENSIONS. Parameters are the row's values followed by the
+    gameid.
+    """
+    columns = CHILD_TABLES[table] + ("gameid",)
+    return "insert into %s (%s) values(%s)" % (table, ", ".join(columns), ",".join("?" * len(columns)))
+
+
+def insert_children(rec, table, rows):
+    """
+    Adds to a database record the insertion of rows into one of
+    CHILD_TABLES.
+    :param rec: db_writer.Record
+    :param rows: tuples of the row's values followed by the gameid
+    """
+    if table in dimensions.DIMENSIONS:
+        dimensions.insert_names(rec, table, rows)
+    else:
+        rec.executemany(insert_child_stmt(table), rows)
+
+
+def delete_child_stmt(table):
+    """
+    Builds a statement deleting the rows of one of CHILD_TABLES that match
+    a given row. Parameters are the row's values followed by the gameid.
+    """
+    if table in dimensions.DIMENSIONS:
+        return dimensions.delete_stmt(table)
+    conditions = " and ".join(column + " is ?" for column in CHILD_TABLES[table])
+    return "delete from %s where %s and gameid = ?" % (table, conditions)
+
+
+def select_child_stmt(table):
+    """Builds a statement selecting the rows of one of CHILD_TABLES for a gameid."""
+    return "select %s from %s where gameid = ?" % (", ".join(CHILD_TABLES[table]), table)
+
+
+def diff_rows(old_rows, new_rows):
+    """
+    Compares the rows of a child table before and after an update.
+    :return: tuple (removed, added) of row lists. Every row in removed has to
+             be deleted (all of its copies), then every row in added inserted.
+    """
+    old_counts = Counter(old_rows)
+    new_counts = Counter(new_rows)
+    removed = [row for row in old_counts if old_counts[row] != new_counts[row]]
+    added = []
+    for row in removed:
+        added.extend([row] * new_counts[row])
+    for row in new_counts:
+        if row not in old_counts:
+            added.extend([row] * new_counts[row])
+    return removed, added
+
+
+def is_response(content):
+    """
+    :param content: body of an appdetails response
+    :return: False for the bodies Steam answers with when it is overloaded,
+             such as null
+    """
+    return content.lstrip().startswith(b"{")
+
+
+def fingerprint(data):
+    """
+    Computes a fingerprint of an appdetails json object, or of any JSON
+    serialisable data fetched for a game, used to detect whether anything
+    changed since it was last recorded.
+    """
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def split_languages(string):
+    """
+    Helper method to split a string of languages into an array.
+    """
+    if "<br>" in string:
+        string = string.split("<br>", 1)[0]
+    string = re.sub(r'\<\S+\>', '', string)
+    string = string.replace("*", "")
+    languages = string.split(",")
+    result_set = []
+    for entry in languages:
+        entry = entry.strip()
+        result_set.append(entry)
+    return result_set
+
+
+def parse_app_details(data, date_formatter):
+    """
+    Maps a json object retrieved from Steam API onto database rows.
+    :param data: "data" object of an appdetails response
+    :param date_formatter: DateFormatter used to normalise the release date
+    :return: tuple (game, children) where game is a tuple of values in
+             GAME_COLUMNS order and children maps every table in CHILD_TABLES
+             to a list of row tuples (without gameid)
+    """
+    type = common.get_from_json(data, "type")
+    game_name = common.get_from_json(data, "name")
+    required_age = common.get_from_json(data, "required_age")
+    is_free = common.get_bool(common.get_from_json(data, "is_free"))
+
+    full_game = common.get_from_json(data, "fullgame")
+    if full_game is not None:
+        full_game_id = full_game["appid"]
+    else:
+        full_game_id = None
+
+    detailed_description = common.get_from_json(data, "detailed_description")
+    about_the_game = common.get_from_json(data, "about_the_game")
+    short_description = common.get_from_json(data, "short_description")
+
+    price_overview = common.get_from_json(data, "price_overview")
+    if price_overview is not None:
+        price = price_overview["initial"]
+    else:
+        price = 0
+
+    recommendations = common.get_from_json(data, "recommendations")
+    if recommendations is not None:
+        recommendations = recommendations["total"]
+    else:
+        recommendations = 0
+
+    screenshots = common.get_from_json(data, "screenshots")
+    if screenshots is not None:
+        screenshots_num = len(screenshots)
+    else:
+        screenshots_num = 0
+
+    movies = common.get_from_json(data, "movies")
+    if movies is not None:
+        movies_num = len(movies)
+    else:
+        movies_num = 0
+
+    achievements = common.get_from_json(data, "achievements")
+    if achievements is not None:
+        achievements = achievements["total"]
+    else:
+        achievements = 0
+
+    release_date = common.get_from_json(data, "release_date")
+    if release_date is not None:
+        is_released = not common.get_bool(release_date["coming_soon"])
+        release_date = date_formatter.format_date(release_date["date"])
+    else:
+        is_released = False
+        release_date = None
+
+    game = (game_name, type, required_age, is_free, full_game_id, detailed_description,
+            about_the_game, short_description, price, recommendations, is_released, release_date,
+            screenshots_num, movies_num, achievements)
+
+    children = dict((table, []) for table in CHILD_TABLES)
+
+    supported_languages = common.get_from_json(data, "supported_languages")  # string to parse
+    if supported_languages is not None:
+        children["languages"] = [(language,) for language in split_languages(supported_languages)]
+
+    developers = common.get_from_json(data, "developers")
+    if developers is not None:
+        children["developers"] = [(dev,) for dev in developers]
+
+    publishers = common.get_from_json(data, "publishers")
+    if publishers is not None:
+        children["publishers"] = [(pub,) for pub in publishers]
+
+    platforms = common.get_from_json(data, "platforms")
+    if platforms is not None:
+        children["platforms"] = [(platform, platforms[platform]) for platform in platforms]
+
+    metacritic = common.get_from_json(data, "metacritic")
+    if metacritic is not None:
+        children["metacritic"] = [(common.get_from_json(metacritic, "score"),
+                                   common.get_from_json(metacritic, "url"))]
+
+    categories = common.get_from_json(data, "categories")
+    if categories is not None:
+        children["categories"] = [(category["description"],) for category in categories]
+
+    genres = common.get_from_json(data, "genres")
+    if genres is not None:
+        children["genres"] = [(genre["description"],) for genre in genres]
+
+    return game, children
+
+
+def parse_response(content, date_formatter):
+    """
+    Maps the body of an appdetails response for a single app onto database
+    rows. Runs on the parse processes, see Scraper.get_parser().
+    :param content: body of the response
+    :param date_formatter: DateFormatter used to normalise the release date
+    :return: dictionary with a "success" key; when it is True, it also holds
+             the "game" and "children" returned by parse_app_details() and
+             the "fingerprint" of the data
+    """
+    response = json.loads(content)
+    data = next(iter(response.values()))
+    if data["success"] is False:
+        return {"success": False}
+    game, children = parse_app_details(data["data"], date_formatter)
+    return {"success": True, "game": game, "children": children, "fingerprint": fingerprint(data["data"])}
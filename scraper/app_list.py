@@ -0,0 +1,226 @@
+import json
+import os
+import struct
+import zlib
+from array import array
+from collections import namedtuple
+
+CHUNK_SIZE = 1 << 16
+
+SNAPSHOT_MAGIC = b"APPS"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sII")  # Magic, version, number of apps
+
+# Appids that appeared, disappeared or changed names between two snapshots, as sorted arrays
+Delta = namedtuple("Delta", ("added", "removed", "renamed"))
+
+
+def iter_apps(f, chunk_size=CHUNK_SIZE):
+    """
+    Parses a GetAppList JSON file incrementally, without loading it whole.
+    :param f: file object opened in text mode
+    :return: generator of (appid, name) tuples, in file order
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+
+    def read_more():
+        nonlocal buffer, eof
+        chunk = f.read(chunk_size)
+        if len(chunk) == 0:
+            eof = True
+        buffer += chunk
+
+    # Skip everything up to the opening bracket of the "apps" array
+    while True:
+        start = buffer.find('"apps"')
+        if start >= 0:
+            bracket = buffer.find("[", start)
+            if bracket >= 0:
+                buffer = buffer[bracket + 1:]
+                break
+        if eof:
+            return
+        read_more()
+
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of the app list")
+            buffer = buffer[position:]
+            position = 0
+            read_more()
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            app, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            if eof:
+                raise
+            buffer = buffer[position:]  # Object cut in half by the chunk boundary
+            position = 0
+            read_more()
+            continue
+        yield app["appid"], app.get("name")
+        position = end
+        if position > chunk_size:
+            buffer = buffer[position:]
+            position = 0
+
+
+def load_appids(filename):
+    """
+    Loads the appids of a GetAppList JSON file into a compact array.
+    :param filename: path of the JSON file
+    :return: array of appids, sorted and without duplicates
+    """
+    appids = array("l")
+    with open(filename, "r") as f:
+        for appid, name in iter_apps(f):
+            appids.append(appid)
+    return sort_unique(appids)
+
+
+def sort_unique(appids):
+    """
+    Sorts an array of appids and removes duplicates. Appids are small
+    non-negative integers, so this goes through a bitmap (one bit per
+    possible appid) instead of a set of Python ints.
+    :param appids: array of appids
+    :return: sorted array without duplicates
+    """
+    if len(appids) == 0:
+        return array("l")
+    bitmap = bytearray(max(appids) // 8 + 1)
+    for appid in appids:
+        bitmap[appid >> 3] |= 1 << (appid & 7)
+    result = array("l")
+    for index, byte in enumerate(bitmap):
+        if byte:
+            base = index << 3
+            for bit in range(8):
+                if byte & (1 << bit):
+                    result.append(base + bit)
+    return result
+
+
+def name_hash(name):
+    """
+    :return: 32 bit hash of the name of an app, telling whether it was renamed
+    """
+    return zlib.crc32(name.encode("utf-8")) if name else 0
+
+
+def load_apps(filename):
+    """
+    Loads the appids of a GetAppList JSON file along with the hashes of
+    their names, see name_hash().
+    :param filename: path of the JSON file
+    :return: tuple (appids, hashes) of arrays sorted by appid, without
+             duplicate appids
+    """
+    packed = array("q")  # appid << 32 | hash, so that sorting keeps each hash with its appid
+    with open(filename, "r") as f:
+        for appid, name in iter_apps(f):
+            packed.append(appid << 32 | name_hash(name))
+    if any(packed[i] > packed[i + 1] for i in range(len(packed) - 1)):
+        packed = array("q", sorted(packed))
+    appids = array("l")
+    hashes = array("L")
+    for key in packed:
+        appid = key >> 32
+        if len(appids) > 0 and appids[-1] == appid:
+            hashes[-1] = key & 0xFFFFFFFF  # Duplicate appid, the last entry wins
+        else:
+            appids.append(appid)
+            hashes.append(key & 0xFFFFFFFF)
+    return appids, hashes
+
+
+def save_snapshot(filename, apps):
+    """
+    Saves the apps returned by load_apps() in a compact binary file: a
+    header followed by the appids and the hashes as 32 bit integers. The
+    file is replaced atomically.
+    """
+    appids, hashes = apps
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(appids)))
+        f.write(array("i", appids).tobytes())
+        f.write(array("I", hashes).tobytes())
+    os.replace(temp_filename, filename)
+
+
+def load_snapshot(filename):
+    """
+    :return: tuple (appids, hashes) as saved by save_snapshot(), None if
+             the file doesn't exist or is not a snapshot
+    """
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, "rb") as f:
+        header = f.read(SNAPSHOT_HEADER.size)
+        if len(header) < SNAPSHOT_HEADER.size:
+            return None
+        magic, version, count = SNAPSHOT_HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return None
+        stored_appids = array("i")
+        stored_hashes = array("I")
+        try:
+            stored_appids.fromfile(f, count)
+            stored_hashes.fromfile(f, count)
+        except EOFError:
+            return None
+    return array("l", stored_appids), array("L", stored_hashes)
+
+
+def diff(previous, current):
+    """
+    Compares two snapshots with a single merge pass over their sorted appids.
+    :param previous: tuple (appids, hashes) of the previous snapshot
+    :param current: tuple (appids, hashes) of the current snapshot
+    :return: Delta
+    """
+    old_ids, old_hashes = previous
+    new_ids, new_hashes = current
+    added, removed, renamed = array("l"), array("l"), array("l")
+    i = j = 0
+    while i < len(old_ids) and j < len(new_ids):
+        old_id, new_id = old_ids[i], new_ids[j]
+        if old_id == new_id:
+            if old_hashes[i] != new_hashes[j]:
+                renamed.append(new_id)
+            i += 1
+            j += 1
+        elif old_id < new_id:
+            removed.append(old_id)
+            i += 1
+        else:
+            added.append(new_id)
+            j += 1
+    removed.extend(old_ids[i:])
+    added.extend(new_ids[j:])
+    return Delta(added, removed, renamed)
+
+
+def find_names(filename, appids):
+    """
+    :param filename: path of a GetAppList JSON file
+    :param appids: collection of appids
+    :return: dictionary mapping the given appids to their names in the file
+    """
+    wanted = set(appids)
+    names = {}
+    if len(wanted) > 0:
+        with open(filename, "r") as f:
+            for appid, name in iter_apps(f):
+                if appid in wanted:
+                    names[appid] = name
+    return names
@@ -0,0 +1,260 @@
+"""
+Append-only archive of the raw responses received from Steam, so that the
+database can be rebuilt from them offline (see reprocess_scraper.py) after
+a parsing bug is fixed.
+
+Responses are compressed one by one and appended to segment files of
+about segment_size bytes, which are never rewritten. Each record of a
+segment is a RECORD_HEADER followed by the compressed payload; the header
+holds everything needed to rebuild the index from the segments alone. The
+index is a SQLite database next to the segments, mapping (source, appid)
+to the segment, offset and time of the latest response.
+"""
+import atexit
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+import time
+from . import compression
+
+APPDETAILS = "appdetails"
+STORE_PAGE = "store_page"
+SOURCES = (APPDETAILS, STORE_PAGE)  # Position is the id of a source in the record headers
+
+RECORD_MAGIC = b"SR"
+RECORD_HEADER = struct.Struct("<2sBBqdI")  # Magic, source, codec, appid, fetched_at, length of the payload
+SEGMENT_FORMAT = "segment-%06d.bin"
+INDEX_FILENAME = "index.db"
+
+CREATE_INDEX = """
+    CREATE TABLE IF NOT EXISTS payloads(
+    source varchar(20) not null,
+    appid integer not null,
+    segment integer not null,
+    offset integer not null,
+    length integer not null,
+    fetched_at real not null,
+    hash blob not null,
+    PRIMARY KEY(source, appid)) WITHOUT ROWID
+    """
+INDEX_PAYLOAD = "insert or replace into payloads (source, appid, segment, offset, length, fetched_at, hash) " \
+                "values(?,?,?,?,?,?,?)"
+
+
+class Archive:
+    """
+    Archive kept in a directory, created on the first append. Appends and
+    reads are safe to call from several threads. The index is committed
+    every commit_interval seconds and on close(); records appended since
+    the last commit are indexed again from the segments when the archive
+    is opened next.
+    """
+
+    def __init__(self, directory, segment_size=256 * 1024 * 1024, commit_interval=5.0):
+        self.directory = directory
+        self.segment_size = int(segment_size)
+        self.commit_interval = commit_interval
+        self.conn = None
+        self.segment = None  # Number of the segment appended to
+        self.file = None
+        self.readers = {}  # Segment -> file descriptor
+        self.last_commit = time.time()
+        self.lock = threading.RLock()
+        atexit.register(self.close)
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, SEGMENT_FORMAT % segment)
+
+    def segments(self):
+        """:return: sorted numbers of the segments in the directory"""
+        if not os.path.isdir(self.directory):
+            return []
+        prefix, suffix = SEGMENT_FORMAT.split("%06d")
+        return sorted(int(name[len(prefix):-len(suffix)]) for name in os.listdir(self.directory)
+                      if name.startswith(prefix) and name.endswith(suffix))
+
+    def connect(self):
+        """Opens the index, creating the directory if needed and indexing what the last commit missed."""
+        with self.lock:
+            if self.conn is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.conn = sqlite3.connect(os.path.join(self.directory, INDEX_FILENAME), check_same_thread=False)
+                self.conn.execute(CREATE_INDEX)
+                # The latest record indexed is never replaced, so it ends where indexing stopped
+                segment, end = self.conn.execute("select segment, max(offset + length) from payloads "
+                                                 "where segment=(select max(segment) from payloads)").fetchone()
+                for number in self.segments():
+                    if segment is None or number > segment:
+                        self.scan(number)
+                    elif number == segment:
+                        self.scan(number, end)
+                self.conn.commit()
+            return self.conn
+
+    def scan(self, segment, start=0):
+        """
+        Indexes the records of a segment from a given offset on, keeping the
+        latest record of every appid. A partly written record at the end of
+        the last segment, left by a crash, is cut off.
+        :return: number of records indexed
+        """
+        path = self.segment_path(segment)
+        last = segment == self.segments()[-1]
+        indexed = 0
+        with open(path, "rb") as f:
+            f.seek(start)
+            offset = start
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) == 0:
+                    break
+                magic, source, codec, appid, fetched_at, length = RECORD_HEADER.unpack(header) \
+                    if len(header) == RECORD_HEADER.size else (None, 0, 0, 0, 0, 0)
+                payload = f.read(length)
+                if magic != RECORD_MAGIC or len(payload) < length:
+                    if not last:
+                        raise ValueError("Corrupt record in " + path + " at offset " + str(offset))
+                    self.truncate(path, offset)
+                    break
+                # Segments are in order of time, so a record replaces the ones of the same appid before it
+                raw = compression.decompress(compression.CODECS[codec], payload)
+                self.conn.execute(INDEX_PAYLOAD, (SOURCES[source], appid, segment, offset,
+                                                  RECORD_HEADER.size + length, fetched_at,
+                                                  hashlib.sha1(raw).digest()))
+                offset += RECORD_HEADER.size + length
+                indexed += 1
+        return indexed
+
+    @staticmethod
+    def truncate(path, offset):
+        with open(path, "r+b") as f:
+            f.truncate(offset)
+
+    def rebuild_index(self):
+        """
+        Recreates the index from the segments, for instance after the index
+        file was lost.
+        :return: number of records indexed
+        """
+        with self.lock:
+            self.connect()
+            self.conn.execute("delete from payloads")
+            indexed = sum(self.scan(segment) for segment in self.segments())
+            self.conn.commit()
+            return indexed
+
+    def append(self, source, appid, payload, fetched_at=None):
+        """
+        Archives a response. A response identical to the latest one of the
+        same appid and source only updates the time of the latest one.
+        :param source: one of SOURCES
+        :param appid: id of the app the response is about
+        :param payload: body of the response, bytes
+        :param fetched_at: time the response was received, in seconds since the epoch
+        """
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        digest = hashlib.sha1(payload).digest()
+        with self.lock:
+            conn = self.connect()
+            latest = conn.execute("select hash from payloads where source=? and appid=?", (source, appid)).fetchone()
+            if latest is not None and latest[0] == digest:
+                conn.execute("update payloads set fetched_at=? where source=? and appid=?", (fetched_at, source, appid))
+                return
+        codec, data = compression.compress(payload)  # Outside of the lock, so that threads compress in parallel
+        record = RECORD_HEADER.pack(RECORD_MAGIC, SOURCES.index(source), compression.CODECS.index(codec),
+                                    appid, fetched_at, len(data)) + data
+        with self.lock:
+            f = self.writable_segment(len(record))
+            offset = f.tell()
+            f.write(record)
+            f.flush()
+            conn.execute(INDEX_PAYLOAD, (source, appid, self.segment, offset, len(record), fetched_at, digest))
+            if time.time() - self.last_commit >= self.commit_interval:
+                self.commit()
+
+    def writable_segment(self, size):
+        """:return: file of the segment to append a record of a given size to"""
+        if self.file is not None and self.file.tell() + size > self.segment_size and self.file.tell() > 0:
+            self.file.close()
+            self.file = None
+            self.segment += 1
+        if self.file is None:
+            if self.segment is None:
+                segments = self.segments()
+                self.segment = segments[-1] if len(segments) > 0 else 1
+            self.file = open(self.segment_path(self.segment), "ab")
+            if self.file.tell() + size > self.segment_size and self.file.tell() > 0:
+                return self.writable_segment(size)
+        return self.file
+
+    def commit(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.commit()
+            self.last_commit = time.time()
+
+    def entries(self, source):
+        """
+        :param source: one of SOURCES
+        :return: list of (appid, fetched_at) of the archived responses of a
+                 source, in the order they are stored, so that reading them
+                 in turn goes through the segments sequentially
+        """
+        with self.lock:
+            return self.connect().execute("select appid, fetched_at from payloads where source=? "
+                                          "order by segment, offset", (source,)).fetchall()
+
+    def read(self, source, appid):
+        """
+        :return: latest archived response of an appid, None if there is none
+        """
+        with self.lock:
+            location = self.connect().execute("select segment, offset, length from payloads "
+                                              "where source=? and appid=?", (source, appid)).fetchone()
+            if location is None:
+                return None
+            segment, offset, length = location
+            if segment == self.segment and self.file is not None:
+                self.file.flush()
+            fd = self.readers.get(segment)
+            if fd is None:
+                fd = self.readers[segment] = os.open(self.segment_path(segment), os.O_RDONLY)
+        record = os.pread(fd, length, offset)
+        magic, source_id, codec, stored_appid, fetched_at, data_length = RECORD_HEADER.unpack_from(record)
+        if magic != RECORD_MAGIC or stored_appid != appid or SOURCES[source_id] != source:
+            raise ValueError("Archive index doesn't match " + SEGMENT_FORMAT % segment + " at offset " + str(offset))
+        return compression.decompress(compression.CODECS[codec], record[RECORD_HEADER.size:])
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            for fd in self.readers.values():
+                os.close(fd)
+            self.readers = {}
+            if self.conn is not None:
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_archive(config):
+    """
+    Returns the archive shared by every scraper in this process, creating
+    it from the config on first use.
+    :param config: config dictionary, see common.read_config_file()
+    :return: Archive, None when ARCHIVE_DIRECTORY is empty
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None and config.get("ARCHIVE_DIRECTORY"):
+            _shared = Archive(config["ARCHIVE_DIRECTORY"],
+                              float(config.get("ARCHIVE_SEGMENT_SIZE", 256)) * 1024 * 1024)
+        return _shared
@@ -1,6 +1,9 @@
 import sys
 import datetime
 import time
+import re
+
+duration_regex = re.compile(r"(?:(\d+(?:\.\d+)?)d)?(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m)?(?:(\d+(?:\.\d+)?)s)?")
 
 
 class ANSISequence:
@@ -33,6 +36,24 @@ def percentage(part, whole):
     return 100 * float(part) / float(whole)
 
 
+def parse_duration(value):
+    """
+    Parses a duration such as "4h", "90m", "1h30m" or "45s". A plain number
+    is a number of seconds.
+    :return: number of seconds
+    """
+    value = value.strip().lower()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    match = duration_regex.fullmatch(value)
+    if match is None or not any(match.groups()):
+        raise ValueError("Invalid duration: " + value)
+    days, hours, minutes, seconds = (float(group) if group else 0.0 for group in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
 def get_bool(v):
     """Returns True if the passed string contains 'yes', 'true', 't' or 1."""
     if type(v) is bool:
@@ -0,0 +1,49 @@
+"""
+Compression of the data kept by the scraper: zstd when the zstandard
+package is installed, zlib otherwise. Data compressed with either can be
+read back as long as its codec is available.
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+NONE = "none"
+ZLIB = "zlib"
+ZSTD = "zstd"
+CODECS = (NONE, ZLIB, ZSTD)  # Position is the id of a codec where it is stored as a number
+CODEC = ZSTD if zstandard is not None else ZLIB  # Codec of the data written by this process
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def compress(raw):
+    """
+    :param raw: bytes to compress
+    :return: tuple (codec, data); data that doesn't compress is kept as it is
+    """
+    if CODEC == ZSTD:
+        data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    else:
+        data = zlib.compress(raw, ZLIB_LEVEL)
+    if len(data) >= len(raw):
+        return NONE, raw
+    return CODEC, data
+
+
+def decompress(codec, data):
+    """
+    :param codec: one of CODECS
+    :return: decompressed bytes
+    """
+    if codec == ZLIB:
+        return zlib.decompress(data)
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is required to read data compressed with zstd")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec != NONE:
+        raise ValueError("Unknown codec: " + str(codec))
+    return bytes(data)
@@ -0,0 +1,155 @@
+import atexit
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from .common import ANSISequence, Color
+
+LOGGER_PREFIX = "steam_scraper."
+LOGFILE_FORMAT = "%(asctime)s %(levelname)-7s %(message)s"
+
+# Colours of the messages printed in verbose mode
+LEVEL_COLORS = {
+    logging.DEBUG: Color.ENDC,
+    logging.INFO: Color.OKGREEN,
+    logging.WARNING: Color.FAIL,
+    logging.ERROR: Color.FAIL,
+}
+
+_closed_at_exit = set()
+
+
+class ProgressBar:
+    """
+    Progress bar drawn on the last line of the terminal. Updates are cheap:
+    the bar is only redrawn refresh_rate times per second, and not at all
+    when the stream is not a terminal (e.g. under nohup or in a pipe).
+    """
+
+    def __init__(self, stream=None, refresh_rate=4.0, enabled=None):
+        self.stream = stream if stream is not None else sys.stdout
+        self.interval = 1 / refresh_rate if refresh_rate > 0 else float("inf")
+        if enabled is None:
+            enabled = refresh_rate > 0 and hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.enabled = enabled
+        self.current = 0
+        self.total = 0
+        self.last_draw = float("-inf")
+        self.lock = threading.Lock()
+
+    def render(self):
+        percent = 100 * float(self.current) / self.total if self.total > 0 else 100
+        return Color.BOLD + "[%-50s] %d%%" % ('=' * int(percent / 2), percent) + Color.ENDC
+
+    def update(self, current, total, force=False):
+        """
+        Sets the progress, redrawing the bar if it wasn't redrawn for long enough.
+        :param force: redraw regardless of the refresh rate
+        """
+        self.current = current
+        self.total = total
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_draw < self.interval:
+            return
+        with self.lock:
+            self.last_draw = now
+            self.stream.write(ANSISequence.ERASE_LINE + self.render())
+            self.stream.flush()
+
+    def finish(self):
+        """Draws the bar one last time, with the final progress."""
+        self.update(self.current, self.total, force=True)
+
+    def write_line(self, line):
+        """Prints a line above the bar, in a single write."""
+        with self.lock:
+            if self.enabled:
+                self.last_draw = time.monotonic()
+                self.stream.write(ANSISequence.ERASE_LINE + line + "\n" + self.render())
+            else:
+                self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+class ConsoleHandler(logging.Handler):
+    """Prints log messages above the progress bar, coloured by level on terminals."""
+
+    def __init__(self, progress):
+        logging.Handler.__init__(self)
+        self.progress = progress
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+            if self.progress.enabled:
+                message = LEVEL_COLORS.get(record.levelno, Color.ENDC) + message + Color.ENDC
+            self.progress.write_line(message)
+        except Exception:
+            self.handleError(record)
+
+
+def create_logger(name, verbose, logfile, progress, level=logging.DEBUG):
+    """
+    Sets up the logger of a scraper. In verbose mode messages are printed
+    above the progress bar; otherwise the logfile is truncated and messages
+    are handed over to a background thread which writes them to it, so that
+    logging never blocks the scraping threads on disk I/O.
+    :param name: name of the scraper, loggers are shared by name
+    :param verbose: whether to print messages instead of writing them to the logfile
+    :param logfile: name of the logfile
+    :param progress: ProgressBar of the scraper
+    :param level: minimum level of the messages kept
+    :return: logging.Logger
+    """
+    logger = logging.getLogger(LOGGER_PREFIX + name)
+    close_logger(logger)
+    logger.setLevel(level)
+    logger.propagate = False
+    if verbose:
+        handler = ConsoleHandler(progress)
+    else:
+        file_handler = logging.FileHandler(logfile, mode="w", encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter(LOGFILE_FORMAT))
+        messages = queue.Queue()
+        handler = QueueHandler(messages)
+        handler.listener = QueueListener(messages, file_handler)
+        handler.listener.start()
+    logger.addHandler(handler)
+    if logger.name not in _closed_at_exit:
+        _closed_at_exit.add(logger.name)
+        atexit.register(close_logger, logger)
+    return logger
+
+
+def flush_logger(logger):
+    """Waits for the messages queued by a logger to be written."""
+    for handler in logger.handlers:
+        if getattr(handler, "listener", None) is not None:
+            handler.queue.join()
+
+
+def close_logger(logger):
+    """Removes the handlers of a logger, after writing out the messages still queued."""
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        listener = getattr(handler, "listener", None)
+        if listener is not None:
+            listener.stop()
+            for target in listener.handlers:
+                target.close()
+        handler.close()
+
+
+def parse_level(name):
+    """
+    :param name: name of a level, such as "INFO"
+    :return: logging level
+    """
+    level = logging.getLevelName(name.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError("Unknown log level: " + name)
+    return level
@@ -1,23 +1,169 @@
 from datetime import datetime
+import calendar
 import re
+import threading
+
+ordinal_regex = re.compile(r'(\d)(st|nd|rd|th)')
+
+# Patterns of the directives the fast path understands, as used by strptime
+DIRECTIVES = {
+    "d": r"(?P<%s_d>3[01]|[12]\d|0[1-9]|[1-9]| [1-9])",
+    "Y": r"(?P<%s_Y>\d\d\d\d)",
+}
+
+# Formatters created when unpickling, see DateFormatter.__reduce__()
+formatters = {}
+formatters_lock = threading.Lock()
+
+
+def get_formatter(target_format, input_formats):
+    """
+    Returns the formatter of this process for the given formats, so that
+    formatters sent to the parse processes keep their memo between tasks.
+    """
+    key = (target_format, tuple(input_formats))
+    with formatters_lock:
+        formatter = formatters.get(key)
+        if formatter is None:
+            formatter = formatters[key] = DateFormatter(target_format)
+            formatter.set_input_formats(list(input_formats))
+        return formatter
+
+
+def month_pattern(names):
+    # Longest names first, so that "may" doesn't shadow "mayo" in other locales
+    names = sorted((name.lower() for name in names if name), key=len, reverse=True)
+    return "|".join(re.escape(name) for name in names)
 
 
 class DateFormatter:
+    """
+    Converts dates from any of its input formats to the target format.
+    Strings whose format is not recognised are returned as they are.
+
+    Results are memoised, as the same release dates come up over and over.
+    Input formats made of month names, days, years, spaces and punctuation
+    are compiled into a single regular expression which finds the matching
+    format in one pass; strptime() is only tried format by format for the
+    other ones.
+    """
+
+    MEMO_SIZE = 16384
 
     def __init__(self, target_format):
         self.target_format = target_format
         self.input_formats = []
+        self.memo = {}
+        self.lock = threading.Lock()
+        self.dispatcher = None
+        self.dispatch_formats = 0
+        self.month_numbers = {}
+        self.groups = {}  # Name of the group of each format -> (format index, year, month type, month, day groups)
+
+    def __reduce__(self):
+        return get_formatter, (self.target_format, tuple(self.input_formats))
 
     def add_input_format(self, input_format):
         self.input_formats.append(input_format)
+        self.compile()
 
     def set_input_formats(self, input_formats):
         self.input_formats = input_formats
+        self.compile()
+
+    def compile(self):
+        """
+        Builds the regular expression of the fast path from the leading
+        input formats it understands. It stops at the first format it
+        doesn't, so that formats keep being tried in order.
+        """
+        with self.lock:
+            self.memo = {}
+            self.month_numbers = {
+                "b": dict((name.lower(), number) for number, name in enumerate(calendar.month_abbr) if name),
+                "B": dict((name.lower(), number) for number, name in enumerate(calendar.month_name) if name),
+            }
+            months = {
+                "b": r"(?P<%s_b>" + month_pattern(calendar.month_abbr).replace("%", "%%") + ")",
+                "B": r"(?P<%s_B>" + month_pattern(calendar.month_name).replace("%", "%%") + ")",
+            }
+            alternatives = []
+            self.groups = {}
+            for index, input_format in enumerate(self.input_formats):
+                prefix = "f" + str(index)
+                pattern = self.format_pattern(input_format, prefix, months)
+                if pattern is None:
+                    break
+                alternatives.append("(?P<%s>%s)" % (prefix, pattern))
+                month = "b" if "(?P<%s_b>" % prefix in pattern else "B"
+                self.groups[prefix] = (index, prefix + "_Y", month, prefix + "_" + month,
+                                       prefix + "_d" if "(?P<%s_d>" % prefix in pattern else None)
+            self.dispatch_formats = len(alternatives)
+            if len(alternatives) > 0:
+                self.dispatcher = re.compile("|".join(alternatives), re.IGNORECASE)
+            else:
+                self.dispatcher = None
+
+    @staticmethod
+    def format_pattern(input_format, prefix, months):
+        """
+        Translates a format into a regular expression matching the same
+        strings as strptime() does.
+        :return: pattern, or None if the format has other directives
+        """
+        pattern = ""
+        seen = set()
+        for part in re.split(r"(%.)", input_format):
+            if part.startswith("%") and len(part) == 2:
+                directive = part[1]
+                if directive in seen:
+                    return None
+                seen.add(directive)
+                if directive in DIRECTIVES:
+                    pattern += DIRECTIVES[directive] % prefix
+                elif directive in months:
+                    pattern += months[directive] % prefix
+                else:
+                    return None
+            else:
+                if "%" in part:
+                    return None
+                # Same translation as strptime(): escape special characters, any whitespace matches \s+
+                part = re.sub(r"([\\.^$*+?\(\){}\[\]|])", r"\\\1", part)
+                pattern += re.sub(r"\s+", lambda whitespace: r"\s+", part)
+        if "Y" not in seen or not seen & {"b", "B"}:
+            return None
+        return pattern + r"\Z"
 
     def format_date(self, entry):
-        for format in self.input_formats:
+        result = self.memo.get(entry)
+        if result is None:
+            result = self.convert(entry)
+            with self.lock:
+                if len(self.memo) >= self.MEMO_SIZE:
+                    del self.memo[next(iter(self.memo))]  # Oldest entry
+                self.memo[entry] = result
+        return result
+
+    def convert(self, entry):
+        trimmed = self.trim(entry)
+        start = 0
+        if self.dispatcher is not None:
+            match = self.dispatcher.match(trimmed)
+            if match is not None:
+                index, year, month_type, month, day = self.groups[match.lastgroup]
+                month = self.month_numbers[month_type][match.group(month).lower()]
+                day = int(match.group(day)) if day is not None else 1
+                try:
+                    return datetime(int(match.group(year)), month, day).strftime(self.target_format)
+                except ValueError:
+                    pass  # Such as Feb 30, leave it to strptime() from the matching format on
+                start = index
+            else:
+                start = self.dispatch_formats  # None of these formats can match
+        for format in self.input_formats[start:]:
             try:
-                parsed_date = datetime.strptime(self.trim(entry), format)  # try to get the date
+                parsed_date = datetime.strptime(trimmed, format)  # try to get the date
                 formatted_date = parsed_date.strftime(self.target_format)
                 return formatted_date
             except ValueError:
@@ -26,4 +172,4 @@ class DateFormatter:
 
     @staticmethod
     def trim(s):
-        return re.sub(r'(\d)(st|nd|rd|th)', r'\1', s)
+        return ordinal_regex.sub(r'\1', s)
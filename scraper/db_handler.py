@@ -1,22 +1,36 @@
 import sqlite3
-from . import common
+import sys
+from . import common, migrations, search
 
 
 class DBHandler:
-    def __init__(self, db_file):
+    def __init__(self, db_file, search_index=False):
+        """
+        :param db_file: database filename
+        :param search_index: whether to build the full-text search index
+                             if the database doesn't have one, see search.py
+        """
         self.db_file = db_file
+        self.search_index = search_index
         self.initialize_db()
 
     def initialize_db(self):
         # Connect to database. If the file doesn't exist, create it
         conn = sqlite3.connect(self.db_file)
+        applied = []
         with conn:
             c = conn.cursor()
             try:
+                # Brings existing databases up to date and creates the schema in new ones
+                applied = migrations.migrate(conn)
                 self.table_verification(c)
-            except sqlite3.OperationalError:
-                # If the tables don't exist, create them
-                print("Database failed verification. Do you want to create a new database?")
+            except sqlite3.OperationalError as e:
+                print("Database failed verification: " + str(e))
+                if not sys.stdin.isatty():
+                    # Never destroy a database without asking, and there is nobody to ask
+                    common.printcolor("Run the scraper interactively to recreate the database.", common.Color.FAIL)
+                    exit(1)
+                print("Do you want to create a new database?")
                 common.printcolor("WARNING: If a database already exists, it will be completely destroyed "
                                   "and existing data will be lost.", common.Color.WARNING)
                 choice = input("Type in \"yes\" if you want to create a new database.")
@@ -26,6 +40,13 @@ class DBHandler:
                 else:
                     print("Exiting...")
                     exit(0)
+        if any(version in migrations.VACUUM_AFTER for version in applied) and \
+                conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            print("Giving the space freed by the migration back to the filesystem...")
+            conn.execute("VACUUM")
+        if self.search_index:
+            search.create_index(conn)
+        conn.close()
 
     @staticmethod
     def table_verification(cursor):
@@ -48,46 +69,15 @@ class DBHandler:
 
     @staticmethod
     def create_tables(cursor):
+        """
+        Drops every table and view of the database and creates the schema
+        from scratch, at the latest version.
+        """
         c = cursor
-        query = """
-                drop table if exists games;
-                drop table if exists languages;
-                drop table if exists developers;
-                drop table if exists publishers;
-                drop table if exists metacritic;
-                drop table if exists categories;
-                drop table if exists genres;
-                drop table if exists platforms;
-                drop table if exists tags;
-                drop table if exists inaccessible;
-                CREATE TABLE games(
-                id integer primary key not null,
-                name varchar(200) not null,
-                type varchar(50),
-                required_age integer,
-                is_free boolean,
-                full_game_id integer,
-                detailed_description text,
-                about_the_game text,
-                short_description text,
-                price integer,
-                rating tinyint,
-                recommendations integer,
-                is_released boolean,
-                release_date datetime,
-                screenshots integer,
-                movies integer,
-                achievements integer);
-                CREATE TABLE languages(name varchar(40), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
-                CREATE TABLE developers(name varchar(60), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
-                CREATE TABLE publishers(name varchar(60), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
-                CREATE TABLE metacritic(score integer, url text, gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
-                CREATE TABLE categories(name varchar(120), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
-                CREATE TABLE genres(name varchar(120), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
-                CREATE TABLE platforms(name varchar(30), status boolean, gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
-                CREATE TABLE tags(name varchar(120), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
-                CREATE TABLE inaccessible(id integer primary key not null);
-                """
-        c.executescript(query)
-
-
+        # Virtual tables are dropped before their shadow tables
+        c.execute("select type, name from sqlite_master where type in ('view', 'table') and name not like 'sqlite_%' "
+                  "order by type desc, sql like 'create virtual table%' desc")
+        objects = c.fetchall()
+        c.executescript("".join("drop %s if exists \"%s\";" % (type, name) for type, name in objects) +
+                        "PRAGMA user_version = 0;")
+        migrations.migrate(c.connection, log=lambda message: None)
@@ -0,0 +1,202 @@
+import sqlite3
+import threading
+import time
+import atexit
+
+EXECUTE = 0
+EXECUTEMANY = 1
+INTERN_MANY = 2
+
+
+class Record:
+    """
+    Collects the statements belonging to a single record. Nothing reaches
+    the database until the record is closed without an exception, at which
+    point it is handed over to the DBWriter as one unit.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.operations = []
+
+    def execute(self, stmt, params=()):
+        self.operations.append((EXECUTE, stmt, params))
+
+    def executemany(self, stmt, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        if len(seq_of_params) > 0:
+            self.operations.append((EXECUTEMANY, stmt, seq_of_params))
+
+    def intern_many(self, stmt, dimension, seq_of_params):
+        """
+        Same as executemany(), except that the first value of every row is a
+        name of a dimension table, which is replaced by its id (see
+        DBWriter.name_id()).
+        """
+        seq_of_params = list(seq_of_params)
+        if len(seq_of_params) > 0:
+            self.operations.append((INTERN_MANY, stmt, (dimension, seq_of_params)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and len(self.operations) > 0:
+            self.writer.submit(self.operations)
+
+
+class DBWriter:
+    """
+    Write-behind writer for the database. It keeps one connection open and
+    applies the submitted records in a single transaction every batch_size
+    records or flush_interval seconds, whichever comes first. A record is
+    acknowledged once it has been submitted; acknowledged records are always
+    flushed, including on exit or when the scraper is interrupted.
+
+    The writer also keeps the ids of the names of the dimension tables in
+    memory, so that interning a name it has seen before doesn't cost a
+    query.
+
+    When given metrics (see metrics.Metrics), the writer records the time
+    taken by every flush and the number of records written and failed.
+    """
+
+    def __init__(self, db_file, batch_size=200, flush_interval=5.0, on_error=None, on_flush=None, metrics=None):
+        self.db_file = db_file
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.on_error = on_error
+        self.on_flush = on_flush
+        self.metrics = metrics
+        self.conn = None
+        self.pending = []
+        self.name_ids = {}  # Dimension table -> {name: id}
+        self.last_flush = time.time()
+        self.closed = False
+        self.lock = threading.RLock()
+        atexit.register(self.close)
+
+    def record(self):
+        """
+        Starts a new record. Use as a context manager:
+            with writer.record() as rec:
+                rec.execute(...)
+        """
+        return Record(self)
+
+    def execute(self, stmt, params=()):
+        """Submits a single statement as a record of its own."""
+        with self.record() as rec:
+            rec.execute(stmt, params)
+
+    def submit(self, operations):
+        with self.lock:
+            self.closed = False
+            self.pending.append(operations)
+            if len(self.pending) >= self.batch_size or time.time() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def connect(self):
+        if self.conn is None:
+            # Transactions are managed explicitly, see flush()
+            self.conn = sqlite3.connect(self.db_file, isolation_level=None, check_same_thread=False)
+        return self.conn
+
+    def flush(self):
+        """
+        Writes every pending record in one transaction. Each record runs
+        inside its own savepoint, so a record that fails is rolled back on
+        its own and reported through on_error instead of taking the rest of
+        the batch down with it.
+        """
+        with self.lock:
+            if len(self.pending) == 0:
+                return
+            start = time.perf_counter()
+            c = self.connect().cursor()
+            failed = 0
+            try:
+                c.execute("begin")
+                for operations in self.pending:
+                    c.execute("savepoint record")
+                    record_interned = []
+                    try:
+                        for kind, stmt, params in operations:
+                            if kind == EXECUTE:
+                                c.execute(stmt, params)
+                            elif kind == EXECUTEMANY:
+                                c.executemany(stmt, params)
+                            else:
+                                dimension, rows = params
+                                c.executemany(stmt, [(self.name_id(dimension, row[0], record_interned),) + tuple(row[1:])
+                                                     for row in rows])
+                    except sqlite3.Error as e:
+                        c.execute("rollback to record")
+                        self.forget_names(record_interned)
+                        record_interned = []
+                        failed += 1
+                        if self.on_error is not None:
+                            self.on_error(e)
+                    c.execute("release record")
+                c.execute("commit")
+            except BaseException:
+                # Interrupted or failed mid-transaction: keep the records pending so they can be retried
+                if self.conn.in_transaction:
+                    c.execute("rollback")
+                # The ids of the names added by the transaction may be given to other names by the retry
+                self.name_ids = {}
+                raise
+            if self.metrics is not None:
+                self.metrics.observe("db_flush_duration_seconds", time.perf_counter() - start)
+                self.metrics.inc("db_records_written_total", value=len(self.pending) - failed)
+                if failed > 0:
+                    self.metrics.inc("db_record_errors_total", value=failed)
+            self.pending = []
+            self.last_flush = time.time()
+            if self.on_flush is not None:
+                self.on_flush()
+
+    def name_id(self, dimension, name, interned):
+        """
+        Returns the id of a name of a dimension table, adding the name to
+        the table if it isn't there yet. Must be called within flush().
+        :param dimension: name of the dimension table
+        :param name: name to look up, None gives None
+        :param interned: list to which (dimension, name) is appended when
+                         the name is added, so that it can be forgotten if
+                         the record is rolled back
+        """
+        if name is None:
+            return None
+        ids = self.name_ids.get(dimension)
+        if ids is None:
+            ids = self.name_ids[dimension] = dict(self.conn.execute("select name, id from " + dimension))
+        nameid = ids.get(name)
+        if nameid is None:
+            c = self.conn.execute("insert or ignore into %s (name) values(?)" % dimension, (name,))
+            if c.rowcount > 0:
+                nameid = c.lastrowid
+                interned.append((dimension, name))
+            else:  # Added by someone else since the cache was loaded
+                nameid = self.conn.execute("select id from %s where name = ?" % dimension, (name,)).fetchone()[0]
+            ids[name] = nameid
+        return nameid
+
+    def forget_names(self, interned):
+        """Removes names whose insertion was rolled back from the cache."""
+        for dimension, name in interned:
+            self.name_ids[dimension].pop(name, None)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            if len(self.pending) > 0:
+                self.flush()
+            elif self.on_flush is not None:
+                self.on_flush()  # Even with nothing pending, callers may have progress to persist
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+                self.name_ids = {}
+            self.closed = True
@@ -0,0 +1,110 @@
+"""
+Content-addressed storage for the descriptions of the games. Each distinct
+description is compressed and stored once in description_blobs, keyed by
+the SHA-1 of its text; the games table refers to it by id through the
+<column>_blob columns. DLCs and soundtracks often share the description of
+their game, which then costs a single row.
+
+SQLite can't decompress the blobs by itself: register() adds the
+description() function to a connection, after which the
+game_descriptions view reads like the columns used to.
+"""
+import hashlib
+from . import compression
+
+# Columns of the games table stored as blobs
+COLUMNS = ("detailed_description", "about_the_game", "short_description")
+
+INSERT_BLOB = "insert or ignore into description_blobs (hash, codec, data) values(?,?,?)"
+BLOB_ID = "(select id from description_blobs where hash=?)"
+DELETE_UNREFERENCED = "delete from description_blobs where id not in (%s)" % " union ".join(
+    "select %s_blob from games where %s_blob is not null" % (column, column) for column in COLUMNS)
+
+
+def blob_column(column):
+    """:return: column of the games table referring to the blob of a description column"""
+    return column + "_blob"
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+def compress(text):
+    """
+    :param text: description
+    :return: tuple (codec, data), see compression.compress()
+    """
+    return compression.compress(text.encode("utf-8"))
+
+
+def decompress(codec, data):
+    """
+    :return: text of a blob, None for a missing blob
+    """
+    if data is None:
+        return None
+    return compression.decompress(codec, data).decode("utf-8")
+
+
+def register(conn):
+    """
+    Adds the description(codec, data) function, used by the
+    game_descriptions view, to a connection.
+    """
+    conn.create_function("description", 2, decompress)
+
+
+def select_expr(column, table="games"):
+    """
+    :param column: one of COLUMNS
+    :param table: name or alias of the games table in the query
+    :return: SQL expression reading the text of a description, once register() was called
+    """
+    return "(select description(codec, data) from description_blobs where id = %s.%s)" % (table, blob_column(column))
+
+
+def store(rec, text):
+    """
+    Adds to a database record the statement storing a description, unless
+    a blob with the same text exists.
+    :param rec: db_writer.Record, or a cursor
+    :param text: description, may be None
+    :return: hash of the text to pass to BLOB_ID, None when text is None
+    """
+    if text is None:
+        return None
+    digest = text_hash(text)
+    rec.execute(INSERT_BLOB, (digest,) + compress(text))
+    return digest
+
+
+def move_descriptions(conn, chunk_size=500):
+    """
+    Moves the descriptions held in the text columns of the games table to
+    blobs, then empties those columns. Used by migrations.py.
+    """
+    columns = ", ".join(COLUMNS)
+    select = "select id, %s from games where id > ? and coalesce(%s) is not null order by id limit ?" % (columns,
+                                                                                                       columns)
+    update = "update games set %s where id=?" % ", ".join(
+        "%s=%s, %s=null" % (blob_column(column), BLOB_ID, column) for column in COLUMNS)
+    cursor = conn.cursor()
+    last_id = -1 << 63
+    while True:
+        # Read in chunks rather than through one cursor, which the updates would invalidate
+        chunk = conn.execute(select, (last_id, chunk_size)).fetchall()
+        if len(chunk) == 0:
+            break
+        cursor.executemany(update, [tuple(store(cursor, text) for text in row[1:]) + (row[0],) for row in chunk])
+        last_id = chunk[-1][0]
+
+
+def delete_unreferenced(conn):
+    """
+    Deletes the blobs no game refers to anymore, such as the previous
+    descriptions of updated games.
+    :return: number of blobs deleted
+    """
+    with conn:
+        return conn.execute(DELETE_UNREFERENCED).rowcount
@@ -0,0 +1,46 @@
+# Child tables whose names are interned. Each name is stored once in a
+# dimension table and games refer to it by id through a junction table;
+# the original table name is kept as a view of (name, gameid) rows, so
+# queries written against it keep working.
+# view name -> (dimension table, junction table)
+DIMENSIONS = {
+    "tags": ("tag_names", "game_tags"),
+    "languages": ("language_names", "game_languages"),
+    "developers": ("developer_names", "game_developers"),
+    "publishers": ("publisher_names", "game_publishers"),
+    "categories": ("category_names", "game_categories"),
+    "genres": ("genre_names", "game_genres"),
+}
+
+
+def insert_stmt(table):
+    """
+    Builds the statement linking a game to a name of one of DIMENSIONS.
+    Parameters are the id of the name followed by the gameid.
+    """
+    return "insert into %s (nameid, gameid) values(?,?)" % DIMENSIONS[table][1]
+
+
+def delete_stmt(table):
+    """
+    Builds a statement unlinking a game from a name of one of DIMENSIONS.
+    Parameters are the name followed by the gameid.
+    """
+    dimension, junction = DIMENSIONS[table]
+    return "delete from %s where nameid is (select id from %s where name is ?) and gameid = ?" % (junction, dimension)
+
+
+def delete_game_stmt(table):
+    """Builds a statement unlinking a game from every name of one of DIMENSIONS."""
+    return "delete from %s where gameid = ?" % DIMENSIONS[table][1]
+
+
+def insert_names(rec, table, rows):
+    """
+    Adds to a database record the links of a game to names of one of
+    DIMENSIONS. The names are turned into ids by the writer's cache.
+    :param rec: db_writer.Record
+    :param table: name of the view, such as "tags"
+    :param rows: tuples (name, gameid)
+    """
+    rec.intern_many(insert_stmt(table), DIMENSIONS[table][0], rows)
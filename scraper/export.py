@@ -0,0 +1,312 @@
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import urllib.request
+from collections import namedtuple
+from . import migrations, descriptions
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+PARQUET = "parquet"
+ARROW = "arrow"
+CSV = "csv"
+AUTO = "auto"
+FORMATS = (AUTO, PARQUET, ARROW, CSV)
+EXTENSIONS = {PARQUET: ".parquet", ARROW: ".arrow", CSV: ".csv.gz"}
+
+# Tables holding rows of a game, exported alongside games or joined to it as list columns
+CHILD_TABLES = migrations.CHILD_TABLES + ("controller_support", "price_history")
+
+# Bounds of the gameid ranges, so that child rows of ids missing from games are exported too
+MIN_ID = -(1 << 63)
+MAX_ID = (1 << 63) - 1
+
+INT = "int"
+FLOAT = "float"
+BOOL = "bool"
+TEXT = "text"
+
+Column = namedtuple("Column", ("name", "kind"))
+
+
+def column_kind(decltype):
+    """
+    :param decltype: declared type of a column, such as "varchar(40)"
+    :return: INT, FLOAT, BOOL or TEXT, following the affinity rules of SQLite
+    """
+    decltype = (decltype or "").lower()
+    if "bool" in decltype:
+        return BOOL
+    if "int" in decltype:
+        return INT
+    if any(name in decltype for name in ("real", "floa", "doub")):
+        return FLOAT
+    return TEXT
+
+
+def to_int(value):
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_float(value):
+    if value is None or isinstance(value, float):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_bool(value):
+    return None if value is None else bool(to_int(value))
+
+
+def to_text(value):
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+# SQLite only enforces the declared types loosely, columnar formats need every value of a column to match
+CONVERTERS = {INT: to_int, FLOAT: to_float, BOOL: to_bool, TEXT: to_text}
+
+
+def get_columns(conn, table):
+    """:return: list of the Columns of a table or view"""
+    return [Column(row[1], column_kind(row[2])) for row in conn.execute("PRAGMA table_info(%s)" % table)]
+
+
+def resolve_format(fmt):
+    """
+    :param fmt: one of FORMATS
+    :return: format to write, AUTO resolves to PARQUET when pyarrow is
+             installed and to CSV otherwise
+    """
+    if fmt == AUTO:
+        return PARQUET if pyarrow is not None else CSV
+    if fmt not in EXTENSIONS:
+        raise ValueError("Unknown export format: " + fmt)
+    if fmt != CSV and pyarrow is None:
+        raise ValueError("pyarrow is required to export to " + fmt + ", use csv instead")
+    return fmt
+
+
+class CsvWriter:
+    """Writes rows to a gzipped CSV file with a header. List values are written as JSON arrays."""
+
+    def __init__(self, filename, fields):
+        self.filename = filename
+        self.temp_filename = filename + ".part"
+        self.file = gzip.open(self.temp_filename, "wt", compresslevel=6, encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([field.name for field in fields])
+        self.rows = 0
+
+    def write(self, rows):
+        self.writer.writerows([json.dumps(value, ensure_ascii=False) if isinstance(value, list) else value
+                               for value in row] for row in rows)
+        self.rows += len(rows)
+
+    def close(self):
+        self.file.close()
+        os.replace(self.temp_filename, self.filename)
+
+    def abort(self):
+        """Removes the partly written file, the file of the previous export is left as it is."""
+        self.file.close()
+        if os.path.exists(self.temp_filename):
+            os.remove(self.temp_filename)
+
+
+def arrow_type(kind):
+    return {INT: pyarrow.int64(), FLOAT: pyarrow.float64(), BOOL: pyarrow.bool_(), TEXT: pyarrow.string()}[kind]
+
+
+class ArrowWriter:
+    """
+    Writes rows to a Parquet or Arrow IPC file, one row group or record
+    batch per call to write(), so that only one chunk is ever held in
+    memory.
+    """
+
+    def __init__(self, filename, fields, fmt):
+        self.filename = filename
+        self.temp_filename = filename + ".part"
+        self.schema = pyarrow.schema([(field.name, field.arrow_type()) for field in fields])
+        if fmt == PARQUET:
+            self.sink = None
+            self.writer = pyarrow.parquet.ParquetWriter(self.temp_filename, self.schema, compression="zstd")
+        else:
+            self.sink = pyarrow.OSFile(self.temp_filename, "wb")
+            self.writer = pyarrow.ipc.new_file(self.sink, self.schema,
+                                               options=pyarrow.ipc.IpcWriteOptions(compression="zstd"))
+        self.rows = 0
+
+    def write(self, rows):
+        if len(rows) == 0:
+            return
+        arrays = [pyarrow.array(list(values), type=field.type) for values, field in zip(zip(*rows), self.schema)]
+        self.writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.rows += len(rows)
+
+    def close(self):
+        self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+        os.replace(self.temp_filename, self.filename)
+
+    def abort(self):
+        """Removes the partly written file, the file of the previous export is left as it is."""
+        self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+        if os.path.exists(self.temp_filename):
+            os.remove(self.temp_filename)
+
+
+class Field:
+    """
+    Output column. Plain fields hold a value of a column; list fields hold
+    the rows of a child table joined to a game, as values when the table
+    has a single column besides gameid and as records otherwise.
+    """
+
+    def __init__(self, name, kind=None, children=None):
+        self.name = name
+        self.kind = kind
+        self.children = children
+
+    def arrow_type(self):
+        if self.children is None:
+            return arrow_type(self.kind)
+        if len(self.children) == 1:
+            return pyarrow.list_(arrow_type(self.children[0].kind))
+        return pyarrow.list_(pyarrow.struct([(column.name, arrow_type(column.kind)) for column in self.children]))
+
+
+class Exporter:
+    """
+    Streams the games and their child tables out of the database in chunks
+    of chunk_size games, so that memory use doesn't depend on the size of
+    the database. Every chunk is read in a short transaction of its own on
+    a read-only connection, which never holds the database for long while
+    a scraper is writing to it.
+
+    Games and every child table are written to files of their own, or with
+    join the child tables are added to the games as list columns. Child
+    rows of games missing from the games table are only exported without
+    join.
+    """
+
+    def __init__(self, db_file, directory, fmt=AUTO, chunk_size=2000, join=False):
+        self.db_file = db_file
+        self.directory = directory
+        self.fmt = resolve_format(fmt)
+        self.chunk_size = max(1, int(chunk_size))
+        self.join = join
+
+    def connect(self):
+        uri = "file:" + urllib.request.pathname2url(os.path.abspath(self.db_file)) + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, isolation_level=None)
+        descriptions.register(conn)
+        return conn
+
+    def open_writer(self, table, fields):
+        filename = os.path.join(self.directory, table + EXTENSIONS[self.fmt])
+        if self.fmt == CSV:
+            return CsvWriter(filename, fields)
+        return ArrowWriter(filename, fields, self.fmt)
+
+    def iter_ranges(self, conn, columns):
+        """
+        Reads the games chunk by chunk, in order of id.
+        :return: generator of (games, lower, upper) tuples, where games are
+                 converted rows and (lower, upper] is the range of gameids
+                 the chunk covers
+        """
+        # Descriptions are read from their blobs
+        names = ", ".join(descriptions.select_expr(column.name) if column.name in descriptions.COLUMNS
+                          else column.name for column in columns)
+        converters = [CONVERTERS[column.kind] for column in columns]
+        lower = MIN_ID
+        while True:
+            conn.execute("begin")
+            rows = conn.execute("select %s from games where id > ? order by id limit ?" % names,
+                                (lower, self.chunk_size)).fetchall()
+            if len(rows) < self.chunk_size:
+                upper = MAX_ID  # Last chunk, child rows past the last game belong to it
+            else:
+                upper = rows[-1][0]
+            yield [tuple(convert(value) for convert, value in zip(converters, row)) for row in rows], lower, upper
+            conn.execute("commit")
+            if upper == MAX_ID:
+                return
+            lower = upper
+
+    @staticmethod
+    def read_children(conn, table, columns, lower, upper):
+        """:return: converted rows of a child table for the gameids in (lower, upper]"""
+        names = ", ".join(column.name for column in columns)
+        converters = [CONVERTERS[column.kind] for column in columns]
+        rows = conn.execute("select %s from %s where gameid > ? and gameid <= ? order by gameid" % (names, table),
+                            (lower, upper))
+        return [tuple(convert(value) for convert, value in zip(converters, row)) for row in rows]
+
+    def export(self):
+        """
+        Writes the files. A file is only replaced once it is complete, the
+        partly written files are removed when the export fails.
+        :return: dictionary of table name -> number of rows written
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        conn = self.connect()
+        writers = {}
+        try:
+            blob_columns = set(descriptions.blob_column(column) for column in descriptions.COLUMNS)
+            game_columns = [column for column in get_columns(conn, "games") if column.name not in blob_columns]
+            child_columns = dict((table, get_columns(conn, table)) for table in CHILD_TABLES)
+            # Child rows are read with gameid first, so they can be grouped or written as they are
+            for table, columns in child_columns.items():
+                child_columns[table] = [Column("gameid", INT)] + [column for column in columns
+                                                                   if column.name != "gameid"]
+            game_fields = [Field(column.name, column.kind) for column in game_columns]
+            if self.join:
+                game_fields += [Field(table, children=columns[1:]) for table, columns in child_columns.items()]
+            else:
+                for table, columns in child_columns.items():
+                    writers[table] = self.open_writer(table, [Field(column.name, column.kind) for column in columns])
+            writers["games"] = self.open_writer("games", game_fields)
+
+            for games, lower, upper in self.iter_ranges(conn, game_columns):
+                for table, columns in child_columns.items():
+                    rows = self.read_children(conn, table, columns, lower, upper)
+                    if not self.join:
+                        writers[table].write(rows)
+                        continue
+                    grouped = {}
+                    for row in rows:
+                        value = row[1] if len(columns) == 2 else dict(zip((column.name for column in columns[1:]),
+                                                                          row[1:]))
+                        grouped.setdefault(row[0], []).append(value)
+                    games = [game + (grouped.get(game[0], []),) for game in games]
+                writers["games"].write(games)
+
+            for writer in writers.values():
+                writer.close()
+            return dict((table, writer.rows) for table, writer in writers.items())
+        except BaseException:
+            for writer in writers.values():
+                writer.abort()
+            raise
+        finally:
+            conn.close()
@@ -1,54 +1,123 @@
-import requests
 import sqlite3
-import re
+from array import array
+from datetime import datetime
 from time import sleep
-from . import common, scraper
+from . import common, scraper, app_details, scheduler, app_list, search, archive
 
 
 class GameScraper(scraper.Scraper):
 
+    RUNTYPE = "api"
+    ARCHIVE_SOURCE = archive.APPDETAILS
+
     def __init__(self, config_filename: str, verbose: bool, override_missing: bool):
         self.override_missing = override_missing
+        self.snapshot = None  # Apps of the app list, saved as the new snapshot once they are all scraped
         scraper.Scraper.__init__(self, config_filename, verbose)
-        self.APP_DETAILS_URL = "https://store.steampowered.com/api/appdetails?appids="
+        self.APP_DETAILS_URL = self.STORE_URL + "/api/appdetails?appids="
 
     def get_records_list(self):
-        games_list = self.get_records_list_from_json(self.ALLGAMES_FILE)
-        return self.check_all_records(games_list)
-
-    @staticmethod
-    def split_languages(string):
         """
-        Helper method to split a string of languages into an array.
+        Goes through the whole app list on the first run. Afterwards, the
+        app list is compared with the snapshot saved at the end of the last
+        complete run, and only the apps added since then are scraped;
+        removed apps are flagged in removed_apps and renamed apps get their
+        new names. --force always goes through the whole app list.
         """
-        if "<br>" in string:
-            string = string.split("<br>", 1)[0]
-        string = re.sub('\<\S+\>', '', string)
-        string = string.replace("*", "")
-        languages = string.split(",")
-        result_set = []
-        for entry in languages:
-            entry = entry.strip()
-            result_set.append(entry)
-        return result_set
+        snapshot_file = self.config.get("APP_SNAPSHOT_FILENAME")
+        if not snapshot_file or self.override_missing:
+            return self.check_all_records(self.get_records_list_from_json(self.ALLGAMES_FILE))
+        self.refresh_app_list(self.ALLGAMES_FILE)
+        self.snapshot = app_list.load_apps(self.ALLGAMES_FILE)
+        previous = app_list.load_snapshot(snapshot_file)
+        if previous is None:
+            result = self.check_all_records(self.snapshot[0])
+        else:
+            delta = app_list.diff(previous, self.snapshot)
+            print("Since the last snapshot of the app list: " + str(len(delta.added)) + " added, " +
+                  str(len(delta.removed)) + " removed, " + str(len(delta.renamed)) + " renamed.")
+            self.record_delta(delta)
+            result = self.check_records(delta.added)
+        if len(result) == 0:
+            self.save_snapshot()
+        return result
 
-    def check_all_records(self, games):
+    def record_delta(self, delta):
+        """
+        Flags the apps removed from the app list, unflags the ones that came
+        back and renames the recorded games whose names changed.
+        :param delta: app_list.Delta between the last snapshot and the app list
+        """
+        timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        names = app_list.find_names(self.ALLGAMES_FILE, delta.renamed)
+        with self.writer.record() as rec:
+            rec.executemany("insert or ignore into removed_apps (id, removed_at) values(?,?)",
+                            [(appid, timestamp) for appid in delta.removed])
+            rec.executemany("delete from removed_apps where id=?", [(appid,) for appid in delta.added])
+            rec.executemany("update games set name=? where id=? and name is not ?",
+                            [(name, appid, name) for appid, name in names.items() if name])
+            if self.search_index:
+                rec.executemany(search.RENAME_GAME, [(name, appid) for appid, name in names.items() if name])
+        self.writer.flush()
+
+    def save_snapshot(self):
+        """Saves the app list as the snapshot the next run is compared with."""
+        if self.snapshot is not None:
+            app_list.save_snapshot(self.config["APP_SNAPSHOT_FILENAME"], self.snapshot)
+            self.snapshot = None
+
+    def check_records(self, appids, chunk_size=500):
+        """
+        Same as check_all_records(), querying the database for the given
+        appids only, so that the cost follows the number of appids rather
+        than the size of the database.
+        :param appids: sorted array of appids
+        :return: array of the appids that are not recorded
+        """
+        conn = sqlite3.connect(self.DATABASE_FILE)
+        with conn:
+            recorded = set()
+            for start in range(0, len(appids), chunk_size):
+                chunk = list(appids[start:start + chunk_size])
+                placeholders = ",".join("?" * len(chunk))
+                c = conn.execute("select id from games where id in (%s) union "
+                                 "select id from inaccessible where id in (%s)" % (placeholders, placeholders),
+                                 chunk + chunk)
+                recorded.update(item[0] for item in c.fetchall())
+        conn.close()
+        return array("l", (appid for appid in appids if appid not in recorded))
+
+    def check_all_records(self, appids):
         """
         Prior to running queries, we first need to build a list of applications
         to run queries on. To do that, we pull all appids from allgames.json and
         choose those that satisfy our conditions (already in DB and don't have any
         tags recorded). A list of those apps is then returned.
-        :param games: list of games from allgames.json
-        :return: list of game ids satisfying our requirements
+        :param appids: sorted array of appids from allgames.json
+        :return: array of game ids satisfying our requirements
         """
         conn = sqlite3.connect(self.DATABASE_FILE)
-        result = []
-        for game in games:
-            appid = str(game["appid"])
-            if self.is_not_recorded(conn, appid) is True:
-                result.append(appid)
-        result = sorted(result, key=int)
-        return result
+        recorded = self.get_recorded_ids(conn)
+        conn.close()
+        return array("l", (appid for appid in appids if appid not in recorded))
+
+    def get_recorded_ids(self, conn):
+        """
+        Loads the ids of every application that should not be scraped again
+        in a single query, following the same rules as is_not_recorded().
+        :param conn: sqlite connection to utilize
+        :return: set of appids (as integers)
+        """
+        with conn:
+            c = conn.cursor()
+            if self.override_missing:
+                stmt = "select id from games"
+            else:
+                stmt = """select id from games
+                       union
+                       select id from inaccessible"""
+            c.execute(stmt)
+            return set(item[0] for item in c.fetchall())
 
     def is_not_recorded(self, conn, appid):
         """
@@ -84,173 +153,52 @@ class GameScraper(scraper.Scraper):
         Inserts a new record for a game using the data retrieved from
         the json object retrieved from Steam API. There can only be one
         record for an ID.
-        :param data:
+        :param data: dictionary returned by app_details.parse_response()
         :param appid:
         :return:
         """
-        conn = sqlite3.connect(self.DATABASE_FILE)
-        with conn:
-            c = conn.cursor()
-
-            type = common.get_from_json(data, "type")
-            game_name = common.get_from_json(data, "name")
-            required_age = common.get_from_json(data, "required_age")
-            is_free = common.get_bool(common.get_from_json(data, "is_free"))
-
-            full_game = common.get_from_json(data, "fullgame")
-            if full_game is not None:
-                full_game_id = full_game["appid"]
-            else:
-                full_game_id = None
-
-            detailed_description = common.get_from_json(data, "detailed_description")
-            about_the_game = common.get_from_json(data, "about_the_game")
-            short_description = common.get_from_json(data, "short_description")
-
-            supported_languages = common.get_from_json(data, "supported_languages")  # string to parse
-            if supported_languages is not None:
-                languages = self.split_languages(supported_languages)
-            else:
-                languages = None
-
-            developers = common.get_from_json(data, "developers")  # json array?
-            publishers = common.get_from_json(data, "publishers")  # json array?
-
-            price_overview = common.get_from_json(data, "price_overview")
-            if price_overview is not None:
-                price = price_overview["initial"]
-            else:
-                price = 0
-
-            platforms = common.get_from_json(data, "platforms")  # json array?
-            metacritic = common.get_from_json(data, "metacritic")  # json array?
-            categories = common.get_from_json(data, "categories")  # json array?
-            genres = common.get_from_json(data, "genres")  # json array?
-
-            recommendations = common.get_from_json(data, "recommendations")
-            if recommendations is not None:
-                recommendations = recommendations["total"]
-            else:
-                recommendations = 0
-
-            screenshots = common.get_from_json(data, "screenshots")  # json array?
-            if screenshots is not None:
-                screenshots_num = len(screenshots)
-            else:
-                screenshots_num = 0
-
-            movies = common.get_from_json(data, "movies")  # json array?
-            if movies is not None:
-                movies_num = len(movies)
-            else:
-                movies_num = 0
-
-            achievements = common.get_from_json(data, "achievements")
-            if achievements is not None:
-                achievements = achievements["total"]
-            else:
-                achievements = 0
-
-            release_date = common.get_from_json(data, "release_date")
-            if release_date is not None:
-                is_released = not common.get_bool(release_date["coming_soon"])
-                release_date = self.date_formatter.format_date(release_date["date"])
-            else:
-                is_released = False
-                release_date = None
-
-            stmt = "insert into games (id," \
-                   " name, type, required_age," \
-                   " is_free, full_game_id, detailed_description," \
-                   " about_the_game, short_description, price," \
-                   " recommendations, is_released, release_date, screenshots," \
-                   " movies, achievements) values(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
-            params = (appid, game_name, type, required_age, is_free, full_game_id, detailed_description,
-                      about_the_game, short_description, price, recommendations, is_released, release_date,
-                      screenshots_num, movies_num, achievements)
-            c.execute(stmt, params)
-
-            if languages is not None:
-                for language in languages:
-                    stmt = "insert into languages (name, gameid) values(?,?)"
-                    params = (language, appid)
-                    c.execute(stmt, params)
-
-            if developers is not None:
-                for dev in developers:
-                    stmt = "insert into developers (name, gameid) values(?,?)"
-                    params = (dev, appid)
-                    c.execute(stmt, params)
-
-            if publishers is not None:
-                for pub in publishers:
-                    stmt = "insert into publishers (name, gameid) values(?,?)"
-                    params = (pub, appid)
-                    c.execute(stmt, params)
-
-            if platforms is not None:
-                for platform in platforms:
-                    stmt = "insert into platforms (name, status, gameid) values(?,?,?)"
-                    status = platforms[platform]
-                    params = (platform, status, appid)
-                    c.execute(stmt, params)
-
-            if metacritic is not None:
-                stmt = "insert into metacritic (score, url, gameid) values(?,?,?)"
-                score = common.get_from_json(metacritic, "score")
-                url = common.get_from_json(metacritic, "url")
-                params = (score, url, appid)
-                c.execute(stmt, params)
-
-            if categories is not None:
-                for category in categories:
-                    stmt = "insert into categories (name, gameid) values(?,?)"
-                    name = category["description"]
-                    params = (name, appid)
-                    c.execute(stmt, params)
-
-            if genres is not None:
-                for genre in genres:
-                    stmt = "insert into genres (name, gameid) values(?,?)"
-                    name = genre["description"]
-                    params = (name, appid)
-                    c.execute(stmt, params)
-
-            self.printc("Record #" + str(appid) + " (" + game_name + ") inserted.", common.Color.OKGREEN)
+        if not data["success"]:
+            self.new_inaccessible_record(appid)
+            return
+        game = data["game"]
+        with self.writer.record() as rec:
+            app_details.insert_game(rec, appid, data)
+            scheduler.log_fetch(rec, scheduler.APPDETAILS, appid, data["fingerprint"])
+            if self.search_index:
+                search.index_game(rec, appid, dict(zip(app_details.GAME_COLUMNS, game)))
+
+        self.logger.info("Record #" + str(appid) + " (" + str(game[0]) + ") inserted.")
 
     def new_inaccessible_record(self, appid):
-        conn = sqlite3.connect(self.DATABASE_FILE)
-        with conn:
-            c = conn.cursor()
-            stmt = "insert into inaccessible (id) values(?)"
-            params = (appid,)
-            c.execute(stmt, params)
+        stmt = "insert into inaccessible (id) values(?)"
+        params = (appid,)
+        self.writer.execute(stmt, params)
+
+    def get_parser(self):
+        return app_details.parse_response, (self.date_formatter,)
 
     def get_record(self, appid):
-        self.printc("Running ID " + appid + "...", common.Color.ENDC)
+        appid = str(appid)
+        self.logger.debug("Running ID " + appid + "...")
         url = self.APP_DETAILS_URL + appid
         attempts = 0
         while True:
             try:
-                resp = requests.get(url=url)
+                resp = self.fetch(url, validate=app_details.is_response)
                 if resp.status_code == 200:
-                    data = resp.json()[appid]
-                    if data["success"] is not False:
-                        return data["data"]
-                    else:
-                        self.new_inaccessible_record(appid)
-                        return None
-                elif resp.status_code == 429:
-                    attempts += 1
-                    self.printc("\rToo many requests, waiting... #" + str(attempts), common.Color.FAIL)
-                    sleep(self.TIMEOUT)
+                    if not app_details.is_response(resp.content):
+                        raise ValueError("Unexpected response")  # Steam answers "null" when overloaded
+                    self.archive_response(appid, resp.content)
+                    return resp.content
             except Exception as e:
                 attempts += 1
-                self.printc("\rError occurred " + str(e.__class__) + ". #" + str(attempts), common.Color.FAIL)
+                self.logger.warning("Error occurred " + str(e.__class__) + ". #" + str(attempts))
                 sleep(self.TIMEOUT)
 
     def on_finished(self):
-        self.printc("", common.Color.ENDC)
+        self.progress.finish()
+        if self.current >= self.total and all(self.should_scrape(appid) for appid in self.games_list):
+            self.save_snapshot()  # Apps skipped for STARTING_APPID would never show up as added otherwise
         common.printcolor("\n\nExecution finished. New records: " + str(self.current), common.Color.OKBLUE)
         print("Execution time: " + common.seconds_to_string(common.get_elapsed_time(self.start_time)))
 
@@ -0,0 +1,265 @@
+import re
+from html import unescape
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+REGEX = "regex"
+LXML = "lxml"
+BS4 = "bs4"
+AUTO = "auto"
+
+# Comments, scripts and styles can contain markup that is not part of the
+# document, matching them first lets the expressions below skip them.
+SKIP = r'<!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>'
+markup_regex = re.compile(SKIP + r'|<[^>]*>', re.S | re.I)
+element_regex = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)\b')
+percentage_regex = re.compile(r"(\d+)%")
+tag_regexes = {}
+
+
+def attribute_regex(name):
+    return re.compile(r'\s' + name + r'\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.I)
+
+
+class_regex = attribute_regex("class")
+appid_regex = attribute_regex("data-ds-appid")
+
+def available_backends():
+    """Returns the extraction backends usable in this environment, fastest first."""
+    backends = [REGEX]
+    if lxml is not None:
+        backends.append(LXML)
+    if BeautifulSoup is not None:
+        backends.append(BS4)
+    return backends
+
+
+def to_text(content):
+    if isinstance(content, bytes):
+        return content.decode("utf-8", errors="replace")
+    return content
+
+
+def strings(fragment):
+    """Returns the stripped, non-empty text nodes of an HTML fragment."""
+    result = []
+    for string in markup_regex.split(fragment):
+        string = unescape(string).strip()
+        if len(string) > 0:
+            result.append(string)
+    return result
+
+
+def is_skipped(text, position):
+    """Checks whether a position of the page lies in a comment, a script or a style."""
+    for opening, closing in (("<!--", "-->"), ("<script", "</script"), ("<style", "</style")):
+        start = text.rfind(opening, 0, position)
+        if start >= 0:
+            end = text.find(closing, start + len(opening))
+            if end < 0 or end > position:
+                return True
+    return False
+
+
+def get_attribute(regex, tag):
+    match = regex.search(tag)
+    if match is None:
+        return None
+    return unescape(match.group(1) or match.group(2) or match.group(3) or "")
+
+
+def find_elements(text, name, class_name):
+    """
+    Finds the opening tags of the elements of a given name carrying a given
+    class. Instead of parsing the page, the class name is searched for as a
+    plain string and only the tags it appears in are looked at.
+    :return: generator of tuples (start, end) of each opening tag
+    """
+    position = text.find(class_name)
+    while position >= 0:
+        start = text.rfind("<", 0, position)
+        end = text.find(">", position)
+        # The class name has to be within a tag, not in text or in a comment, script or style
+        if start >= 0 and end >= 0 and text.find(">", start, position) < 0 and not is_skipped(text, start):
+            element = element_regex.match(text, start)
+            if element is not None and element.group(1).lower() == name:
+                classes = get_attribute(class_regex, text[start:end + 1])
+                if classes is not None and class_name in classes.split():
+                    yield start, end + 1
+        position = text.find(class_name, max(position, end) + 1)
+
+
+def find_closing_tag(text, name, start):
+    """
+    Finds the closing tag of an element, nested elements of the same name
+    included.
+    :param start: position right after the opening tag of the element
+    :return: position of the closing tag, or -1 if the element is not closed
+    """
+    regex = tag_regexes.get(name)
+    if regex is None:
+        regex = tag_regexes[name] = re.compile(SKIP + r'|<(/?)' + name + r'\b[^>]*>', re.S | re.I)
+    depth = 1
+    for tag in regex.finditer(text, start):
+        if tag.group(1) is None:
+            continue
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return tag.start()
+    return -1
+
+
+def find_contents(text, name, class_name):
+    """
+    :return: list of tuples (opening tag, inner HTML) of the elements of a
+             given name carrying a given class, or None if one of them is
+             not closed
+    """
+    result = []
+    for start, end in find_elements(text, name, class_name):
+        closing = find_closing_tag(text, name, end)
+        if closing < 0:
+            return None
+        result.append((text[start:end], text[end:closing]))
+    return result
+
+
+def dlc_entry(appid, name):
+    """Builds an entry of the DLC list, or None if the appid is not valid."""
+    if appid is None or not appid.strip().isdigit():
+        return None
+    return int(appid), name
+
+
+def regex_extract(content):
+    """
+    Fast path: locates the elements of interest by looking for their class
+    names, without building a document tree.
+    :return: dictionary as returned by extract(), or None if the markup
+             around them is broken and should be left to a real parser
+    """
+    text = to_text(content)
+    tags = find_contents(text, "a", "app_tag")
+    rows = find_contents(text, "div", "user_reviews_summary_row")
+    dlc_rows = find_contents(text, "a", "game_area_dlc_row")
+    features = find_contents(text, "a", "game_area_details_specs_ctn")
+    if tags is None or rows is None or dlc_rows is None or features is None:
+        return None
+
+    dlc = []
+    for tag, inner in dlc_rows:
+        names = find_contents(inner, "div", "game_area_dlc_name")
+        if names is None:
+            return None
+        name = unescape(markup_regex.sub("", names[0][1])).strip() if len(names) > 0 else None
+        entry = dlc_entry(get_attribute(appid_regex, tag), name)
+        if entry is not None:
+            dlc.append(entry)
+
+    return {
+        "tags": [unescape(markup_regex.sub("", inner)).strip() for tag, inner in tags],
+        "reviews": ["".join(strings(inner)) for tag, inner in rows],
+        "dlc": dlc,
+        "features": ["".join(strings(inner)) for tag, inner in features],
+    }
+
+
+def lxml_extract(content):
+    document = lxml.html.fromstring(content)
+
+    def find_all(element, name, class_name):
+        return element.xpath(".//%s[contains(concat(' ', normalize-space(@class), ' '), ' %s ')]" % (name, class_name))
+
+    def joined_strings(element):
+        return "".join(string.strip() for string in element.xpath(".//text()"))
+
+    dlc = []
+    for row in find_all(document, "a", "game_area_dlc_row"):
+        names = find_all(row, "div", "game_area_dlc_name")
+        entry = dlc_entry(row.get("data-ds-appid"), names[0].text_content().strip() if len(names) > 0 else None)
+        if entry is not None:
+            dlc.append(entry)
+
+    return {
+        "tags": [element.text_content().strip() for element in find_all(document, "a", "app_tag")],
+        "reviews": [joined_strings(element) for element in find_all(document, "div", "user_reviews_summary_row")],
+        "dlc": dlc,
+        "features": [joined_strings(element) for element in find_all(document, "a", "game_area_details_specs_ctn")],
+    }
+
+
+def bs4_extract(content):
+    soup = BeautifulSoup(content, 'html.parser')
+
+    dlc = []
+    for row in soup.find_all("a", class_="game_area_dlc_row"):
+        name = row.find("div", class_="game_area_dlc_name")
+        entry = dlc_entry(row.get("data-ds-appid"), name.get_text().strip() if name is not None else None)
+        if entry is not None:
+            dlc.append(entry)
+
+    return {
+        "tags": [tag.get_text().strip() for tag in soup.find_all("a", class_="app_tag")],
+        "reviews": [row.get_text(strip=True).strip() for row in soup.find_all("div", class_="user_reviews_summary_row")],
+        "dlc": dlc,
+        "features": [feature.get_text(strip=True).strip()
+                     for feature in soup.find_all("a", class_="game_area_details_specs_ctn")],
+    }
+
+
+EXTRACTORS = {
+    REGEX: regex_extract,
+    LXML: lxml_extract,
+    BS4: bs4_extract,
+}
+
+
+def extract(content, backend=AUTO):
+    """
+    Extracts the data of interest from a store page.
+    With the auto backend, the regex fast path is tried first; pages it
+    can't verify are handed to lxml if installed, BeautifulSoup otherwise.
+    :param content: page content, bytes or str
+    :param backend: one of AUTO, REGEX, LXML, BS4
+    :return: dictionary with the following lists:
+             tags - user tags
+             reviews - text of the review summary rows
+             dlc - tuples (appid, name) of the DLCs
+             features - text of the features listed in the side bar
+    """
+    if backend != AUTO:
+        result = EXTRACTORS[backend](content)
+        if result is None:
+            raise ValueError("Page could not be parsed with the " + backend + " backend")
+        return result
+    result = regex_extract(content)
+    if result is not None:
+        return result
+    backends = available_backends()
+    if len(backends) < 2:
+        raise ValueError("Page could not be parsed with the " + REGEX + " backend, install lxml or BeautifulSoup4 "
+                         "to parse the pages it can't")
+    return EXTRACTORS[backends[1]](content)
+
+
+def rating_from_rows(rows):
+    """
+    Picks the overall rating out of the review summary rows: the percentage
+    of positive reviews in the second row (all reviews, the first one being
+    recent reviews).
+    :return: rating as a string of digits, or None if there is none
+    """
+    if len(rows) < 2:
+        return None
+    match = percentage_regex.search(rows[1])
+    if match:
+        return match.group(1)
+    return None
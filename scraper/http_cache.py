@@ -0,0 +1,178 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class CachedResponse:
+    """
+    Response served from the cache. Mimics the parts of requests.Response
+    used by the scrapers.
+    """
+
+    def __init__(self, url, status_code, content, headers, fetched_at):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.fetched_at = fetched_at
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content.decode("utf-8"))
+
+
+class ResponseCache:
+    """
+    Persistent cache of HTTP responses keyed by url. Bodies are stored
+    compressed along with their ETag and Last-Modified validators. Entries
+    younger than ttl seconds are served without touching the network, older
+    ones are revalidated with a conditional request. Once the stored bodies
+    exceed max_size bytes, the least recently used entries are evicted.
+    """
+
+    def __init__(self, filename, ttl, max_size):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        with self.conn:
+            c = self.conn.cursor()
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=OFF")  # Losing the last few entries on a crash is harmless
+            c.execute("""CREATE TABLE IF NOT EXISTS responses(
+                      url text primary key not null,
+                      status integer,
+                      content_type text,
+                      etag text,
+                      last_modified text,
+                      body blob,
+                      size integer,
+                      fetched_at real,
+                      accessed_at real)""")
+            c.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses(accessed_at)")
+            c.execute("select coalesce(sum(size), 0) from responses")
+            self.size = c.fetchone()[0]
+
+    def get(self, url):
+        """
+        :return: tuple (response, fresh) where response is a CachedResponse
+                 or None if the url is not cached, and fresh tells whether it
+                 can be used without revalidation
+        """
+        with self.lock:
+            c = self.conn.cursor()
+            c.execute("select status, content_type, etag, last_modified, body, fetched_at "
+                      "from responses where url=?", (url,))
+            row = c.fetchone()
+            if row is None:
+                self.misses += 1
+                return None, False
+            status, content_type, etag, last_modified, body, fetched_at = row
+            headers = {}
+            if content_type is not None:
+                headers["Content-Type"] = content_type
+            if etag is not None:
+                headers["ETag"] = etag
+            if last_modified is not None:
+                headers["Last-Modified"] = last_modified
+            response = CachedResponse(url, status, zlib.decompress(body), headers, fetched_at)
+            fresh = time.time() - fetched_at < self.ttl
+            if fresh:
+                self.hits += 1
+                with self.conn:
+                    c.execute("update responses set accessed_at=? where url=?", (time.time(), url))
+            return response, fresh
+
+    @staticmethod
+    def conditional_headers(response):
+        """
+        Builds the headers turning a request into a conditional one.
+        :param response: cached response to revalidate
+        """
+        headers = {}
+        if "ETag" in response.headers:
+            headers["If-None-Match"] = response.headers["ETag"]
+        if "Last-Modified" in response.headers:
+            headers["If-Modified-Since"] = response.headers["Last-Modified"]
+        return headers
+
+    def revalidate(self, url):
+        """Marks a cached response as fresh again after a 304."""
+        with self.lock:
+            self.hits += 1
+            self.revalidated += 1
+            now = time.time()
+            with self.conn:
+                self.conn.execute("update responses set fetched_at=?, accessed_at=? where url=?", (now, now, url))
+
+    def store(self, url, response):
+        """
+        Stores a response received from the network.
+        :param response: requests.Response
+        """
+        body = zlib.compress(response.content)
+        now = time.time()
+        with self.lock:
+            with self.conn:
+                c = self.conn.cursor()
+                c.execute("select size from responses where url=?", (url,))
+                row = c.fetchone()
+                if row is not None:
+                    self.size -= row[0]
+                c.execute("insert or replace into responses (url, status, content_type, etag, last_modified, body,"
+                          " size, fetched_at, accessed_at) values(?,?,?,?,?,?,?,?,?)",
+                          (url, response.status_code, response.headers.get("Content-Type"),
+                           response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                           body, len(body), now, now))
+                self.size += len(body)
+                if self.size > self.max_size:
+                    self.evict(c)
+
+    def evict(self, cursor):
+        """
+        Deletes the least recently used entries until the cache is down to
+        90% of its maximum size.
+        """
+        target = self.max_size * 0.9
+        cursor.execute("select url, size from responses order by accessed_at")
+        evicted = []
+        for url, size in cursor.fetchall():
+            if self.size <= target:
+                break
+            evicted.append((url,))
+            self.size -= size
+        cursor.executemany("delete from responses where url=?", evicted)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache(config):
+    """
+    Returns the response cache shared by every scraper in this process,
+    creating it from the config on first use.
+    :param config: config dictionary, see common.read_config_file()
+    :return: ResponseCache, or None if CACHE_FILENAME is empty or not set
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None and config.get("CACHE_FILENAME"):
+            _shared = ResponseCache(config["CACHE_FILENAME"],
+                                    ttl=float(config.get("CACHE_TTL", 24)) * 3600,
+                                    max_size=float(config.get("CACHE_MAX_SIZE", 2048)) * 1024 * 1024)
+        return _shared
@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+
+class ProgressJournal:
+    """
+    Keeps track of the progress of a run so that it can be resumed after a
+    crash or a reboot. Records are expected to be scraped in ascending order
+    of their keys; the journal stores the highest key up to which every
+    record has been completed (the watermark) plus the keys completed out of
+    order above it. Runs whose records aren't scraped in order of their keys
+    don't track them (see start()) and rely on the time the run started
+    instead, kept as started_at.
+
+    The journal is only written by save(), which the scraper calls after the
+    database writer has committed, so it never claims a record that is not
+    in the database yet. Writing it does not sync the disk.
+    """
+
+    def __init__(self, filename, runtype):
+        self.filename = filename
+        self.runtype = runtype
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()  # Of the first run, when resumed
+        self.watermark = None
+        self.completed = set()
+        self.order = None
+        self.position = 0
+        self.resumed = False
+        self.started = False
+        self.finished = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename, "r") as f:
+                state = json.load(f)
+        except ValueError:
+            return  # Unreadable journal, start over
+        if state.get("runtype") != self.runtype:
+            return
+        self.run_id = state["run_id"]
+        self.started_at = state.get("started_at", self.started_at)
+        self.watermark = state["watermark"]
+        self.completed = set(state["completed"])
+        self.resumed = True
+
+    def is_done(self, key):
+        return (self.watermark is not None and key <= self.watermark) or key in self.completed
+
+    def start(self, keys=None):
+        """
+        Sets the keys of the records to be scraped during this run.
+        :param keys: keys of the records, None not to track them
+        """
+        with self.lock:
+            self.order = sorted(keys) if keys is not None else None
+            self.position = 0
+            self.started = True
+
+    def mark_done(self, key):
+        with self.lock:
+            if self.order is None:
+                return
+            self.completed.add(key)
+            while self.position < len(self.order) and self.order[self.position] in self.completed:
+                self.watermark = self.order[self.position]
+                self.completed.discard(self.watermark)
+                self.position += 1
+
+    def save(self):
+        with self.lock:
+            if not self.started or self.finished:
+                return
+            state = {
+                "run_id": self.run_id,
+                "runtype": self.runtype,
+                "started_at": self.started_at,
+                "watermark": self.watermark,
+                "completed": sorted(key for key in self.completed
+                                    if self.watermark is None or key > self.watermark),
+            }
+            temp_filename = self.filename + ".tmp"
+            with open(temp_filename, "w") as f:
+                json.dump(state, f)
+            os.replace(temp_filename, self.filename)  # Atomic, the journal is never half written
+
+    def finish(self):
+        """Removes the journal once the run is complete."""
+        with self.lock:
+            self.finished = True
+            if os.path.isfile(self.filename):
+                os.remove(self.filename)
@@ -0,0 +1,236 @@
+import atexit
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+PREFIX = "steam_scraper_"
+
+# Upper bounds of the buckets of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Name -> (type, help)
+METRICS = {
+    "http_requests_total": (COUNTER, "Responses received, by endpoint family and status code "
+                                     "(status \"error\" for requests that failed without a response)."),
+    "http_request_duration_seconds": (HISTOGRAM, "Time from sending a request to receiving its response."),
+    "http_connections_opened": (GAUGE, "Connections opened to each host since the start of the process."),
+    "rate_limit_wait_seconds": (HISTOGRAM, "Time a request waited for the rate limiter, including 429 backoff."),
+    "rate_limit_requests_per_second": (GAUGE, "Current rate allowed by the rate limiter."),
+    "cache_responses_total": (COUNTER, "Responses served from the response cache, fresh or revalidated."),
+    "stage_duration_seconds": (HISTOGRAM, "Time spent on a record by each stage of the pipeline."),
+    "records_total": (COUNTER, "Records completed."),
+    "records_remaining": (GAUGE, "Records left to complete in the current run."),
+    "parse_queue_stalls_total": (COUNTER, "Times a request was held back because the parse queue was full."),
+    "db_flush_duration_seconds": (HISTOGRAM, "Time taken to write a batch of records to the database."),
+    "db_records_written_total": (COUNTER, "Records written to the database."),
+    "db_record_errors_total": (COUNTER, "Records rolled back because one of their statements failed."),
+}
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus sense: counts of values lower or equal to each bucket."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for count in self.counts:
+            total += count
+            yield total
+
+
+def format_labels(labels):
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace("\"", "\\\"")
+                                       .replace("\n", "\\n"))
+                          for name, value in labels) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms of a scraping process, rendered in the
+    Prometheus text exposition format. Every metric is declared in METRICS
+    and identified by its name without PREFIX plus a dictionary of labels.
+
+    Collectors are functions called with the registry before every
+    rendering, to set gauges that are cheaper to read than to keep updated.
+    """
+
+    def __init__(self):
+        self.values = dict((name, {}) for name in METRICS)  # Name -> {labels: value or Histogram}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(labels):
+        return tuple(sorted(labels.items())) if labels else ()
+
+    def inc(self, name, labels=None, value=1):
+        key = self.key(labels)
+        with self.lock:
+            values = self.values[name]
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name, value, labels=None):
+        key = self.key(labels)
+        with self.lock:
+            self.values[name][key] = value
+
+    def observe(self, name, value, labels=None):
+        key = self.key(labels)
+        with self.lock:
+            histogram = self.values[name].get(key)
+            if histogram is None:
+                histogram = self.values[name][key] = Histogram()
+            histogram.observe(value)
+
+    def get(self, name, labels=None):
+        """
+        :return: value of a counter or gauge, Histogram for a histogram,
+                 None if it was never set
+        """
+        with self.lock:
+            return self.values[name].get(self.key(labels))
+
+    def add_collector(self, collector):
+        with self.lock:
+            if collector not in self.collectors:
+                self.collectors.append(collector)
+
+    def render(self):
+        """
+        :return: every metric that has a value, in the Prometheus text format
+        """
+        for collector in list(self.collectors):
+            collector(self)
+        lines = []
+        with self.lock:
+            for name, (kind, description) in METRICS.items():
+                values = self.values[name]
+                if len(values) == 0:
+                    continue
+                full_name = PREFIX + name
+                lines.append("# HELP " + full_name + " " + description)
+                lines.append("# TYPE " + full_name + " " + kind)
+                for labels, value in sorted(values.items()):
+                    if kind != HISTOGRAM:
+                        lines.append(full_name + format_labels(labels) + " " + format_value(value))
+                        continue
+                    bounds = value.buckets + (float("inf"),)
+                    for bound, count in zip(bounds, value.cumulative_counts()):
+                        lines.append(full_name + "_bucket" + format_labels(labels + (("le", format_value(bound)),))
+                                     + " " + str(count))
+                    lines.append(full_name + "_sum" + format_labels(labels) + " " + repr(value.sum))
+                    lines.append(full_name + "_count" + format_labels(labels) + " " + str(value.count))
+        return "\n".join(lines) + "\n"
+
+
+class FileExporter:
+    """
+    Rewrites a file with the rendered metrics every interval seconds, for
+    the textfile collector of the Prometheus node exporter. The file is
+    replaced atomically so that it is never read half written.
+    """
+
+    def __init__(self, metrics, filename, interval):
+        self.metrics = metrics
+        self.filename = filename
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="metrics-file", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def export(self):
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, "w") as f:
+            f.write(self.metrics.render())
+        os.replace(temp_filename, self.filename)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def stop(self):
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.export()
+
+
+class HTTPExporter:
+    """Serves the rendered metrics on http://host:port/metrics from a background thread."""
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_metrics(config):
+    """
+    Returns the metrics shared by every scraper in this process, creating
+    them from the config on first use. They are written to METRICS_FILE
+    every METRICS_INTERVAL seconds and served on METRICS_PORT, when set.
+    :param config: config dictionary, see common.read_config_file()
+    :return: Metrics
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Metrics()
+            if config.get("METRICS_FILE"):
+                FileExporter(_shared, config["METRICS_FILE"], float(config.get("METRICS_INTERVAL", 5)))
+            if config.get("METRICS_PORT"):
+                HTTPExporter(_shared, int(config["METRICS_PORT"]))
+        return _shared
@@ -0,0 +1,200 @@
+"""
+Versioned migrations of the database schema.
+
+The version of a database is kept in its user_version pragma. Every
+migration brings the schema from the previous version to its own and runs
+in a transaction together with the update of user_version, so a database is
+never left half migrated. Databases created before versioning was
+introduced have version 0; the first migrations only create what is
+missing, so they upgrade them in place without touching their data.
+
+To change the schema, append a migration to MIGRATIONS. Never edit one
+that has been released. A migration is either a script or, when the data
+has to go through Python, a function called with the connection; it must
+not commit.
+"""
+from . import descriptions
+
+# Tables receiving one row per game or more, indexed on gameid in version 4
+CHILD_TABLES = ("languages", "developers", "publishers", "metacritic", "categories", "genres", "platforms",
+                "tags", "reviews", "dlc")
+
+
+def normalise(table, dimension, junction, name_type):
+    """
+    Builds the script moving the names of a (name, gameid) child table to a
+    dimension table and the links to a junction table, then replacing the
+    table with a view of the same rows. Inserts and deletes on the view are
+    redirected to the new tables.
+    """
+    return """
+        CREATE TABLE {dimension}(id integer primary key not null, name {name_type} unique);
+        INSERT INTO {dimension} (name) SELECT DISTINCT name FROM {table} WHERE name IS NOT NULL;
+        CREATE TABLE {junction}(nameid integer, gameid integer,
+        FOREIGN KEY(nameid) REFERENCES {dimension}(id), FOREIGN KEY(gameid) REFERENCES games(id));
+        INSERT INTO {junction} (nameid, gameid)
+        SELECT n.id, t.gameid FROM {table} t LEFT JOIN {dimension} n ON n.name = t.name ORDER BY t.rowid;
+        DROP TABLE {table};
+        CREATE INDEX {junction}_gameid ON {junction}(gameid);
+        CREATE INDEX {junction}_nameid ON {junction}(nameid);
+        CREATE VIEW {table} AS
+        SELECT n.name AS name, j.gameid AS gameid FROM {junction} j LEFT JOIN {dimension} n ON n.id = j.nameid;
+        CREATE TRIGGER {table}_insert INSTEAD OF INSERT ON {table} BEGIN
+        INSERT OR IGNORE INTO {dimension} (name) SELECT NEW.name WHERE NEW.name IS NOT NULL;
+        INSERT INTO {junction} (nameid, gameid) VALUES ((SELECT id FROM {dimension} WHERE name IS NEW.name), NEW.gameid);
+        END;
+        CREATE TRIGGER {table}_delete INSTEAD OF DELETE ON {table} BEGIN
+        DELETE FROM {junction} WHERE gameid IS OLD.gameid AND nameid IS (SELECT id FROM {dimension} WHERE name IS OLD.name);
+        END;
+        """.format(table=table, dimension=dimension, junction=junction, name_type=name_type)
+
+
+def move_descriptions(conn):
+    """Moves the descriptions of the games to compressed, deduplicated blobs, see descriptions.py."""
+    conn.execute("""
+        CREATE TABLE description_blobs(
+        id integer primary key not null,
+        hash blob not null unique,
+        codec varchar(10) not null,
+        data blob not null)""")
+    for column in descriptions.COLUMNS:
+        conn.execute("ALTER TABLE games ADD COLUMN %s integer REFERENCES description_blobs(id)"
+                     % descriptions.blob_column(column))
+    conn.execute("""
+        CREATE VIEW game_descriptions AS
+        SELECT id AS gameid, %s
+        FROM games""" % ", ".join(descriptions.select_expr(column) + " AS " + column
+                                  for column in descriptions.COLUMNS))
+    descriptions.move_descriptions(conn)
+
+
+MIGRATIONS = [
+    (1, "Base schema", """
+        CREATE TABLE IF NOT EXISTS games(
+        id integer primary key not null,
+        name varchar(200) not null,
+        type varchar(50),
+        required_age integer,
+        is_free boolean,
+        full_game_id integer,
+        detailed_description text,
+        about_the_game text,
+        short_description text,
+        price integer,
+        rating tinyint,
+        recommendations integer,
+        is_released boolean,
+        release_date datetime,
+        screenshots integer,
+        movies integer,
+        achievements integer);
+        CREATE TABLE IF NOT EXISTS languages(name varchar(40), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
+        CREATE TABLE IF NOT EXISTS developers(name varchar(60), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
+        CREATE TABLE IF NOT EXISTS publishers(name varchar(60), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
+        CREATE TABLE IF NOT EXISTS metacritic(score integer, url text, gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
+        CREATE TABLE IF NOT EXISTS categories(name varchar(120), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
+        CREATE TABLE IF NOT EXISTS genres(name varchar(120), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
+        CREATE TABLE IF NOT EXISTS platforms(name varchar(30), status boolean, gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
+        CREATE TABLE IF NOT EXISTS tags(name varchar(120), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
+        CREATE TABLE IF NOT EXISTS inaccessible(id integer primary key not null);
+        """),
+    (2, "Price history and fingerprints", """
+        CREATE TABLE IF NOT EXISTS price_history(
+        gameid integer not null,
+        timestamp datetime not null,
+        currency varchar(3),
+        initial integer,
+        final integer,
+        discount_percent integer,
+        PRIMARY KEY(gameid, timestamp),
+        FOREIGN KEY(gameid) REFERENCES games(id));
+        CREATE TABLE IF NOT EXISTS fingerprints(
+        gameid integer primary key not null,
+        hash char(40) not null,
+        FOREIGN KEY(gameid) REFERENCES games(id));
+        """),
+    (3, "Store page extractors", """
+        CREATE TABLE IF NOT EXISTS reviews(
+        label varchar(40),
+        summary varchar(60),
+        percentage tinyint,
+        total integer,
+        gameid integer,
+        FOREIGN KEY(gameid) REFERENCES games(id));
+        CREATE TABLE IF NOT EXISTS dlc(dlcid integer, name varchar(200), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
+        CREATE TABLE IF NOT EXISTS controller_support(
+        gameid integer primary key not null,
+        support varchar(10),
+        FOREIGN KEY(gameid) REFERENCES games(id));
+        """),
+    (4, "Indexes on gameid", "".join("""
+        CREATE INDEX IF NOT EXISTS %s_gameid ON %s(gameid);
+        """ % (table, table) for table in CHILD_TABLES)),
+    (5, "Dimension tables for names", "".join([
+        normalise("tags", "tag_names", "game_tags", "varchar(120)"),
+        normalise("languages", "language_names", "game_languages", "varchar(40)"),
+        normalise("developers", "developer_names", "game_developers", "varchar(60)"),
+        normalise("publishers", "publisher_names", "game_publishers", "varchar(60)"),
+        normalise("categories", "category_names", "game_categories", "varchar(120)"),
+        normalise("genres", "genre_names", "game_genres", "varchar(120)"),
+    ])),
+    (6, "Fetch log", """
+        CREATE TABLE IF NOT EXISTS fetch_log(
+        gameid integer not null,
+        source varchar(20) not null,
+        last_fetched real not null,
+        fingerprint char(40),
+        fetches integer not null default 0,
+        changes integer not null default 0,
+        PRIMARY KEY(gameid, source),
+        FOREIGN KEY(gameid) REFERENCES games(id));
+        """),
+    (7, "Removed apps", """
+        CREATE TABLE IF NOT EXISTS removed_apps(
+        id integer primary key not null,
+        removed_at datetime not null);
+        """),
+    (8, "Description blobs", move_descriptions),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Versions after which the space freed by the migrations is given back to the filesystem, see DBHandler
+VACUUM_AFTER = (8,)
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, log=print):
+    """
+    Applies every migration newer than the version of the database. Does
+    not ask anything, so it can run unattended.
+    :param conn: sqlite connection
+    :param log: function called with a message for every applied migration
+    :return: list of the versions applied
+    """
+    version = get_version(conn)
+    if version > LATEST_VERSION:
+        raise RuntimeError("Database version " + str(version) + " is newer than the latest version known to "
+                           "this scraper (" + str(LATEST_VERSION) + ").")
+    applied = []
+    for migration_version, description, script in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        log("Migrating database to version " + str(migration_version) + " (" + description + ")...")
+        try:
+            if callable(script):
+                conn.execute("BEGIN")
+                script(conn)
+                conn.execute("PRAGMA user_version = %d" % migration_version)
+                conn.execute("COMMIT")
+            else:
+                conn.executescript("BEGIN;" + script + "PRAGMA user_version = %d; COMMIT;" % migration_version)
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        applied.append(migration_version)
+    return applied
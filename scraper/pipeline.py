@@ -0,0 +1,111 @@
+import threading
+import time
+from array import array
+
+
+def timed_call(function, *args):
+    """
+    Calls a function and measures how long it took. Module level so that it
+    can be sent to the parse processes.
+    :return: tuple (result, elapsed seconds)
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+class StageStats:
+    """Number of items a stage of the scraping pipeline went through and the time spent on them."""
+
+    def __init__(self, name, workers, metrics=None, labels=None):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.metrics = metrics
+        self.labels = dict(labels or {}, stage=name)
+        self.lock = threading.Lock()
+
+    def add(self, elapsed):
+        with self.lock:
+            self.items += 1
+            self.busy += elapsed
+        if self.metrics is not None:
+            self.metrics.observe("stage_duration_seconds", elapsed, self.labels)
+
+    def time(self, function, *args):
+        result, elapsed = timed_call(function, *args)
+        self.add(elapsed)
+        return result
+
+
+class PipelineStats:
+    """
+    Throughput of the stages of a run: fetch (get_record on the worker
+    threads), parse (on the parse processes, or on the worker threads when
+    there are none) and write (new_record on the main thread). A stage
+    whose workers are busy close to 100% of the time is the bottleneck.
+
+    When given metrics (see metrics.Metrics), the time of every item of
+    every stage and the completed records are also recorded there, with
+    the given labels.
+    """
+
+    def __init__(self, metrics=None, labels=None):
+        self.stages = {}
+        self.metrics = metrics
+        self.labels = labels or {}
+        self.start_time = time.perf_counter()
+        self.stalls = 0  # Times a request was held back because the parse queue was full
+        self.latencies = array("d")  # Seconds from the request of each record to its handover to new_record()
+
+    def add_latency(self, elapsed):
+        self.latencies.append(elapsed)
+        if self.metrics is not None:
+            self.metrics.inc("records_total", self.labels)
+
+    def add_stall(self):
+        self.stalls += 1
+        if self.metrics is not None:
+            self.metrics.inc("parse_queue_stalls_total", self.labels)
+
+    def latency_percentile(self, percentile):
+        if len(self.latencies) == 0:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def stage(self, name, workers=1):
+        if name not in self.stages:
+            self.stages[name] = StageStats(name, workers, self.metrics, self.labels)
+        return self.stages[name]
+
+    def summary(self):
+        """
+        :return: dictionary of the number of records, their latency and the
+                 statistics of every stage
+        """
+        return {
+            "records": len(self.latencies),
+            "latency_p50": self.latency_percentile(50),
+            "latency_p99": self.latency_percentile(99),
+            "stalls": self.stalls,
+            "stages": dict((stage.name, {"items": stage.items, "busy": stage.busy, "workers": stage.workers})
+                           for stage in self.stages.values()),
+        }
+
+    def report(self):
+        """
+        :return: list of lines describing every stage
+        """
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        lines = []
+        for stage in self.stages.values():
+            if stage.items == 0:
+                continue
+            lines.append("%-6s %8d items | %7.2f items/s | %8.2f ms/item | %2d workers, %3.0f%% busy" % (
+                stage.name, stage.items, stage.items / elapsed, 1000 * stage.busy / stage.items, stage.workers,
+                100 * stage.busy / (elapsed * stage.workers)))
+        if self.stalls > 0:
+            lines.append("Requests held back by a full parse queue: " + str(self.stalls))
+        return lines
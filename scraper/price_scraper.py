@@ -0,0 +1,127 @@
+import sqlite3
+from . import common, scraper
+from datetime import datetime
+from time import sleep
+
+
+class PriceScraper(scraper.Scraper):
+    """
+    Polls the prices of every game already in the database. The appdetails
+    API accepts several comma-separated appids when the response is
+    restricted to price_overview, so prices are requested in batches of
+    PRICE_BATCH_SIZE games. A row is added to price_history only when the
+    price of a game differs from the last one recorded.
+    """
+
+    RUNTYPE = "price_update"
+
+    def __init__(self, config_filename: str, verbose: bool):
+        scraper.Scraper.__init__(self, config_filename, verbose)
+        self.APP_DETAILS_URL = self.STORE_URL + "/api/appdetails?filters=price_overview"
+        country_code = self.config.get("PRICE_COUNTRY_CODE", "")
+        if len(country_code) > 0:
+            self.APP_DETAILS_URL += "&cc=" + country_code
+        self.APP_DETAILS_URL += "&appids="
+        self.checked = 0
+        self.changed = 0
+        self.fail = 0
+
+    def get_records_list(self):
+        """
+        Builds batches of appids to poll, and loads the latest recorded price
+        of every game so that unchanged prices can be skipped.
+        :return: list of tuples of appids
+        """
+        conn = sqlite3.connect(self.DATABASE_FILE)
+        with conn:
+            c = conn.cursor()
+            stmt = """
+                    SELECT gameid, max(timestamp), currency, initial, final, discount_percent
+                    FROM price_history
+                    GROUP BY gameid;
+                    """
+            c.execute(stmt)
+            self.last_prices = dict((item[0], item[2:]) for item in c.fetchall())
+
+            stmt = """
+                    SELECT id
+                    FROM games
+                    WHERE id >= ?
+                    ORDER BY id;
+                    """
+            c.execute(stmt, (self.starting_number,))
+            ids = [item[0] for item in c.fetchall()]
+            batch_size = int(self.config.get("PRICE_BATCH_SIZE", 100))
+            return [tuple(ids[i:i + batch_size]) for i in range(0, len(ids), batch_size)]
+
+    def should_scrape(self, entry):
+        return True  # Appids below STARTING_APPID are already left out of the batches
+
+    def journal_key(self, batch):
+        return batch[-1]
+
+    @staticmethod
+    def parse_price(data):
+        """
+        Extracts the price from the "data" object of a price_overview response.
+        Games without a price (e.g. free games) come back with an empty data
+        array, and are recorded with a price of 0.
+        :return: tuple (currency, initial, final, discount_percent)
+        """
+        price_overview = common.get_from_json(data, "price_overview") if isinstance(data, dict) else None
+        if price_overview is None:
+            return None, 0, 0, 0
+        return (common.get_from_json(price_overview, "currency"),
+                common.get_from_json(price_overview, "initial"),
+                common.get_from_json(price_overview, "final"),
+                common.get_from_json(price_overview, "discount_percent"))
+
+    def get_record(self, batch):
+        self.logger.debug("Running IDs " + str(batch[0]) + "-" + str(batch[-1]) + "...")
+        url = self.APP_DETAILS_URL + ",".join(str(appid) for appid in batch)
+        attempts = 0
+        while True:
+            try:
+                resp = self.fetch(url, use_cache=False)  # Prices must be polled every time
+                if resp.status_code == 200:
+                    result = resp.json()
+                    prices = {}
+                    for appid in batch:
+                        entry = common.get_from_json(result, str(appid))
+                        if entry is not None and entry["success"] is not False:
+                            prices[appid] = self.parse_price(entry["data"])
+                    with self.lock:
+                        self.fail += len(batch) - len(prices)
+                    return prices
+            except Exception as e:
+                attempts += 1
+                self.logger.warning("Error occurred " + str(e.__class__) + ". #" + str(attempts))
+                sleep(self.TIMEOUT)
+
+    def new_record(self, prices, batch):
+        """
+        Records the prices that changed since the last time they were polled.
+        :param prices: dict mapping appids to the tuples returned by parse_price()
+        :param batch: tuple of appids the prices were requested for
+        """
+        timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        changed = [(appid, price) for appid, price in prices.items() if self.last_prices.get(appid) != price]
+        with self.writer.record() as rec:
+            stmt = "insert into price_history (gameid, timestamp, currency, initial, final, discount_percent)" \
+                   " values(?,?,?,?,?,?)"
+            rec.executemany(stmt, [(appid, timestamp) + price for appid, price in changed])
+            stmt = "update games set price=? where id=?"
+            rec.executemany(stmt, [(price[1], appid) for appid, price in changed])
+
+        for appid, price in changed:
+            self.last_prices[appid] = price
+        self.checked += len(prices)
+        self.changed += len(changed)
+        self.logger.info("Prices for #" + str(batch[0]) + "-" + str(batch[-1]) + " checked, " +
+                         str(len(changed)) + " changed.")
+
+    def on_finished(self):
+        self.progress.finish()
+        common.printcolor("\n\nExecution finished. Checked prices: " + str(self.checked) +
+                          " | Changed: " + str(self.changed) + " | Failed: " + str(self.fail), common.Color.OKBLUE)
+        print("Execution time: " + common.seconds_to_string(common.get_elapsed_time(self.start_time)))
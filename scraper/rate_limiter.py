@@ -0,0 +1,165 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+APPDETAILS = "appdetails"
+STORE_PAGE = "store_page"
+DEFAULT = "default"
+
+
+def endpoint_family(url):
+    """
+    Maps a url onto the family of endpoints sharing the same rate limit.
+    """
+    path = urlparse(url).path
+    if path.startswith("/api/appdetails"):
+        return APPDETAILS
+    elif path.startswith("/app/"):
+        return STORE_PAGE
+    return DEFAULT
+
+
+def parse_retry_after(value):
+    """
+    Parses the value of a Retry-After header.
+    :param value: number of seconds or an HTTP date
+    :return: number of seconds to wait, None if missing or malformed
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate adapts to the server (AIMD). Every
+    successful request raises the rate by increase / rate, i.e. roughly by
+    increase requests per second every second, and every 429 multiplies it
+    by decrease. A 429 also pauses the bucket for the time given in
+    Retry-After, or for one token interval if the header is missing.
+    """
+
+    def __init__(self, rate, min_rate=0.05, max_rate=None, burst=1, increase=0.01, decrease=0.5,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate) if max_rate is not None else self.rate * 10
+        self.burst = float(burst)
+        self.increase = float(increase)
+        self.decrease = float(decrease)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.updated = self.clock()
+        self.blocked_until = 0.0
+        self.last_decrease = float("-inf")
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent.
+        :return: time the request was let through, to be passed to on_throttled()
+        """
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return now
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            self.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttled(self, issued_at, retry_after=None):
+        """
+        Backs off after a 429. Requests that were already in flight when the
+        rate was last decreased don't decrease it again, so a burst of 429s
+        only counts once.
+        :param issued_at: value returned by acquire() for the throttled request
+        :param retry_after: seconds to wait as requested by the server, if any
+        """
+        with self.lock:
+            now = self.clock()
+            if issued_at > self.last_decrease:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.last_decrease = now
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.blocked_until = max(self.blocked_until, now + pause)
+            self.tokens = 0
+
+
+class RateLimiter:
+    """
+    Keeps an AdaptiveTokenBucket per endpoint family, see endpoint_family().
+    """
+
+    def __init__(self, rates):
+        """
+        :param rates: dict mapping endpoint families to their initial rate in requests per second
+        """
+        self.rates = rates
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, url):
+        family = endpoint_family(url)
+        with self.lock:
+            if family not in self.buckets:
+                self.buckets[family] = AdaptiveTokenBucket(self.rates.get(family, self.rates[DEFAULT]))
+            return self.buckets[family]
+
+    def acquire(self, url):
+        return self.bucket(url).acquire()
+
+    def on_success(self, url):
+        self.bucket(url).on_success()
+
+    def on_throttled(self, url, issued_at, retry_after=None):
+        self.bucket(url).on_throttled(issued_at, parse_retry_after(retry_after))
+
+    def collect(self, metrics):
+        """Sets the current rate of every endpoint family, see metrics.Metrics.add_collector()."""
+        with self.lock:
+            buckets = list(self.buckets.items())
+        for family, bucket in buckets:
+            metrics.set("rate_limit_requests_per_second", bucket.rate, {"endpoint": family})
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_rate_limiter(config):
+    """
+    Returns the rate limiter shared by every scraper in this process,
+    creating it from the config on first use.
+    :param config: config dictionary, see common.read_config_file()
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RateLimiter({
+                APPDETAILS: float(config.get("RATE_LIMIT_APPDETAILS", 0.6)),
+                STORE_PAGE: float(config.get("RATE_LIMIT_STORE_PAGE", 1.0)),
+                DEFAULT: float(config.get("RATE_LIMIT_DEFAULT", 1.0)),
+            })
+        return _shared
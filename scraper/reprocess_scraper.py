@@ -0,0 +1,110 @@
+import sqlite3
+from . import common, app_details, search, archive, descriptions, games_update_scraper, store_page_scraper
+
+
+class ReprocessGamesScraper(games_update_scraper.UpdateGamesScraper):
+    """
+    Rebuilds the games of the database from the appdetails responses kept
+    in the archive (see archive.py), without any request to Steam: after a
+    parsing bug is fixed, every game is parsed again from the response it
+    was last scraped from. The rows of recorded games are rewritten where
+    they differ from the parsed data; games missing from the database are
+    inserted.
+    """
+
+    RUNTYPE = "reprocess"
+    RESUMABLE = False  # Nothing is logged in the fetch log to resume from
+    LOG_FETCHES = False  # Nothing is fetched, the fetch log keeps the times of the actual fetches
+    SKIP_UNCHANGED = False  # The fingerprint is the one of the archived response, it can't tell a parsing fix
+
+    def __init__(self, config_filename: str, verbose: bool):
+        self.recorded = set()  # Ids of the games in the database
+        games_update_scraper.UpdateGamesScraper.__init__(self, config_filename, verbose)
+
+    def get_records_list(self):
+        """
+        :return: appids of the archived responses, in the order they are
+                 stored so that the archive is read sequentially
+        """
+        if self.archive is None:
+            return []
+        conn = sqlite3.connect(self.DATABASE_FILE)
+        with conn:
+            self.fingerprints = dict(conn.execute("select gameid, hash from fingerprints").fetchall())
+            self.recorded = set(item[0] for item in conn.execute("select id from games").fetchall())
+        conn.close()
+        return [appid for appid, fetched_at in self.archive.entries(archive.APPDETAILS)]
+
+    def get_record(self, appid):
+        self.logger.debug("Reading ID " + str(appid) + " from the archive...")
+        return self.archive.read(archive.APPDETAILS, appid)
+
+    def new_record(self, data, appid):
+        """
+        Updates a recorded game like update mode does, or inserts a game
+        that isn't recorded yet.
+        :param data: dictionary returned by app_details.parse_response()
+        :param appid:
+        """
+        if not data["success"]:
+            if appid not in self.recorded:  # Recorded games are kept like update mode does
+                self.writer.execute("insert or ignore into inaccessible (id) values(?)", (appid,))
+            return
+        if appid in self.recorded:
+            games_update_scraper.UpdateGamesScraper.new_record(self, data, appid)
+            return
+        game = data["game"]
+        with self.writer.record() as rec:
+            app_details.insert_game(rec, appid, data)
+            if self.search_index:
+                search.index_game(rec, appid, dict(zip(app_details.GAME_COLUMNS, game)))
+        self.recorded.add(appid)
+        self.fingerprints[appid] = data["fingerprint"]
+        self.new += 1
+        self.logger.info("Record #" + str(appid) + " (" + str(game[0]) + ") inserted.")
+
+    def on_finished(self):
+        self.progress.finish()
+        common.printcolor("\n\nExecution finished. Rebuilt records: " + str(self.changed) +
+                          " | New: " + str(self.new) + " | Total: " + str(self.total), common.Color.OKBLUE)
+        if self.changed > 0:
+            print("Descriptions no longer used: " + str(descriptions.delete_unreferenced(self.conn)))
+        print("Execution time: " + common.seconds_to_string(common.get_elapsed_time(self.start_time)))
+
+
+class ReprocessStorePagesScraper(store_page_scraper.StorePageScraper):
+    """
+    Runs the store page extractors enabled in the config again on the store
+    pages kept in the archive, without any request to Steam.
+    """
+
+    RUNTYPE = "reprocess_store_page"
+    RESUMABLE = False
+    LOG_FETCHES = False
+
+    def get_records_list(self):
+        """
+        :return: appids of the recorded games with an archived store page,
+                 in the order the pages are stored
+        """
+        if self.archive is None:
+            return []
+        conn = sqlite3.connect(self.DATABASE_FILE)
+        with conn:
+            recorded = set(item[0] for item in conn.execute("select id from games").fetchall())
+        conn.close()
+        return [appid for appid, fetched_at in self.archive.entries(archive.STORE_PAGE) if appid in recorded]
+
+    def get_record(self, appid):
+        self.logger.debug("Reading ID " + str(appid) + " from the archive...")
+        data = self.archive.read(archive.STORE_PAGE, appid)
+        if data is None:
+            with self.lock:
+                self.fail += 1
+        return data
+
+    def on_finished(self):
+        self.progress.finish()
+        common.printcolor("\n\nExecution finished. Reprocessed pages: " + str(self.succeed) +
+                          " | Total: " + str(self.total), common.Color.OKBLUE)
+        print("Execution time: " + common.seconds_to_string(common.get_elapsed_time(self.start_time)))
@@ -0,0 +1,89 @@
+import math
+import time
+from datetime import datetime
+
+# Sources of the fetch log: data fetched from the appdetails API and from store pages
+APPDETAILS = "appdetails"
+STORE_PAGE = "store_page"
+RATING = "rating"
+
+SECONDS_PER_DAY = 86400
+# How much more often a game released today is refreshed than one released years ago
+RECENCY_WEIGHT = 4.0
+# Change rate assumed for games that never changed, so that they still get refreshed eventually
+MIN_CHANGE_RATE = 0.05
+
+INSERT_FETCH = "insert or ignore into fetch_log (gameid, source, last_fetched, fetches, changes) values(?,?,?,0,0)"
+UPDATE_FETCH = """
+    update fetch_log
+    set last_fetched=?, fetches=fetches+1,
+        changes=changes+(fingerprint is not null and fingerprint is not ?), fingerprint=?
+    where gameid=? and source=?
+    """
+
+
+def log_fetch(rec, source, gameid, data_fingerprint, now=None):
+    """
+    Adds the statements recording that the data of a game was fetched from
+    a source to a database record. A fetch counts as a change when the
+    fingerprint differs from the previous one.
+    :param rec: db_writer.Record
+    :param source: name of the source, such as APPDETAILS
+    :param gameid: id of the game
+    :param data_fingerprint: fingerprint of the fetched data, see app_details.fingerprint()
+    :param now: time of the fetch, in seconds since the epoch
+    """
+    now = time.time() if now is None else now
+    rec.execute(INSERT_FETCH, (gameid, source, now))
+    rec.execute(UPDATE_FETCH, (now, data_fingerprint, data_fingerprint, gameid, source))
+
+
+def years_since(release_date, now):
+    """
+    :param release_date: release date as stored in the games table
+    :return: years since the release, 0 for unreleased games or unknown dates
+    """
+    try:
+        released = datetime.strptime(release_date, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return 0.0
+    return max(0.0, (now - released.timestamp()) / (365.25 * SECONDS_PER_DAY))
+
+
+def staleness(now, last_fetched, fetches, changes, release_date, recommendations):
+    """
+    Scores how badly the data of a game needs to be refreshed. The score
+    grows with the time since the last fetch, weighted by how often the
+    data changed when it was fetched before, by popularity (number of
+    recommendations, on a log scale) and by how recently the game was
+    released. Games that were never fetched come first.
+    :return: score, higher is staler
+    """
+    if last_fetched is None:
+        return math.inf
+    age = max(0.0, now - last_fetched) / SECONDS_PER_DAY
+    change_rate = max(MIN_CHANGE_RATE, (changes + 1) / (fetches + 2))
+    popularity = 1 + math.log10(1 + (recommendations or 0))
+    recency = 1 + RECENCY_WEIGHT / (1 + years_since(release_date, now))
+    return age * change_rate * popularity * recency
+
+
+def stale_first(conn, source, now=None):
+    """
+    Orders the games of the database by staleness of the data of a source.
+    :param conn: sqlite connection
+    :param source: name of the source, see log_fetch()
+    :param now: current time, in seconds since the epoch
+    :return: list of game ids, stalest first
+    """
+    now = time.time() if now is None else now
+    rows = conn.execute("""
+        SELECT g.id, f.last_fetched, f.fetches, f.changes, g.release_date, g.recommendations
+        FROM games g
+        LEFT JOIN fetch_log f ON f.gameid = g.id AND f.source = ?
+        """, (source,)).fetchall()
+    scored = [(staleness(now, last_fetched, fetches, changes, release_date, recommendations),
+               recommendations or 0, gameid)
+              for gameid, last_fetched, fetches, changes, release_date, recommendations in rows]
+    scored.sort(reverse=True)
+    return [gameid for score, recommendations, gameid in scored]
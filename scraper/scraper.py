@@ -1,13 +1,20 @@
 from abc import ABC, abstractmethod
 import time
 import os
-import sys
-import json
-import urllib
-from . import common
-from urllib import request
+import requests
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from . import common, app_list, pipeline, console, search
 from datetime import datetime
 from .date_formatter import DateFormatter
+from .db_writer import DBWriter
+from .rate_limiter import get_shared_rate_limiter, endpoint_family
+from .metrics import get_shared_metrics
+from .http_cache import get_shared_cache
+from .transport import get_shared_transport
+from .archive import get_shared_archive
+from .journal import ProgressJournal
 
 
 class Scraper(ABC):
@@ -15,6 +22,12 @@ class Scraper(ABC):
     Base class for Scraper.
     """
 
+    RUNTYPE = None  # Name of the runtype, identifies the progress journal of a run
+    RESUMABLE = True  # Whether interrupted runs are resumed from the progress journal
+    RESUME_SOURCE = None  # Fetch log source telling the records done by an interrupted run, see remaining_entries()
+    ARCHIVE_SOURCE = None  # Source under which archive_response() keeps the responses, see archive.SOURCES
+    LOG_FETCHES = True  # Whether the records written are logged in the fetch log, see scheduler.log_fetch()
+
     def __init__(self, config_filename: str, verbose: bool):
         print("Initialising scraper...")
 
@@ -36,15 +49,44 @@ class Scraper(ABC):
         self.starting_number = int(self.config["STARTING_APPID"])
         self.JSON_MAX_FILE_AGE = int(self.config["JSON_MAX_FILE_AGE"])
         self.LOGFILE = self.config["LOGFILE_NAME"]
+        self.CONCURRENT_REQUESTS = max(1, int(self.config.get("CONCURRENT_REQUESTS", 1)))
+        self.PARSE_PROCESSES = max(0, int(self.config.get("PARSE_PROCESSES", 0)))
+        self.PARSE_QUEUE_SIZE = max(1, int(self.config.get("PARSE_QUEUE_SIZE", 16)))
+        self.stats = None
+        self.metrics = get_shared_metrics(self.config)
+        self.writer = DBWriter(self.DATABASE_FILE,
+                               batch_size=int(self.config.get("WRITE_BATCH_SIZE", 200)),
+                               flush_interval=float(self.config.get("WRITE_FLUSH_INTERVAL", 5)),
+                               on_error=self.on_write_error,
+                               on_flush=self.on_write_flush,
+                               metrics=self.metrics)
+        self.journal = None
+        if self.RESUMABLE and self.RUNTYPE is not None and self.config.get("JOURNAL_FILENAME"):
+            journal_file = self.config["JOURNAL_FILENAME"] + "." + self.RUNTYPE + ".json"
+            self.journal = ProgressJournal(journal_file, self.RUNTYPE)
+        self.rate_limiter = get_shared_rate_limiter(self.config)
+        self.cache = get_shared_cache(self.config)
+        self.transport = get_shared_transport(self.config)
+        self.archive = get_shared_archive(self.config)
+        self.metrics.add_collector(self.rate_limiter.collect)
+        self.metrics.add_collector(self.transport.collect)
 
         self.verbose = verbose
-        if self.verbose is False: # If verbosity is off, create a new logfile
-            with open(self.LOGFILE, "w") as logfile:
-                logfile.write("")
+        self.lock = threading.RLock()  # Guards counters shared with the worker threads
+        self.progress = console.ProgressBar(refresh_rate=float(self.config.get("PROGRESS_REFRESH_RATE", 4)))
+        # Printed in verbose mode, written to a new logfile otherwise
+        self.logger = console.create_logger(self.RUNTYPE or type(self).__name__, self.verbose, self.LOGFILE,
+                                            self.progress, console.parse_level(self.config.get("LOG_LEVEL", "DEBUG")))
 
-        self.ALL_GAMES_API_URL = "http://api.steampowered.com/ISteamApps/GetAppList/v0002/?key=STEAMKEY&format=json"
+        self.STORE_URL = self.config.get("STORE_URL", "https://store.steampowered.com").rstrip("/")
+        self.API_URL = self.config.get("API_URL", "http://api.steampowered.com").rstrip("/")
+        self.ALL_GAMES_API_URL = self.API_URL + "/ISteamApps/GetAppList/v0002/?key=STEAMKEY&format=json"
         self.start_time = 0
+        self.deadline = None
         self.current = 0
+        conn = sqlite3.connect(self.DATABASE_FILE)
+        self.search_index = search.has_index(conn)  # Kept up to date by the scrapers writing descriptions
+        conn.close()
         self.games_list = self.get_records_list()
         self.total = len(self.games_list)
         print("Scraper initialised.")
@@ -60,9 +102,19 @@ class Scraper(ABC):
         return []
 
     def get_records_list_from_json(self, filename):
+        self.refresh_app_list(filename)
+        return app_list.load_appids(filename)
+
+    def refresh_app_list(self, filename):
+        """
+        Downloads the list of every app from Steam if the file doesn't
+        exist, or if it is older than JSON_MAX_FILE_AGE days and the user
+        agrees to it.
+        :param filename: path of the JSON file
+        """
         if not os.path.isfile(filename):
             print("Could not locate JSON file with all apps. Attempting to pull one from Steam...")
-            urllib.request.urlretrieve(self.ALL_GAMES_API_URL, filename)
+            self.transport.download(self.ALL_GAMES_API_URL, filename)
         else:
             mod_time = os.path.getmtime(filename)
             mod_date = datetime.utcfromtimestamp(mod_time)
@@ -74,30 +126,213 @@ class Scraper(ABC):
                                   common.Color.WARNING)
                 choice = input("Type in \"yes\" to download newest records file.")
                 if choice.lower() == "yes":
-                    urllib.request.urlretrieve(self.ALL_GAMES_API_URL, filename)
+                    self.transport.download(self.ALL_GAMES_API_URL, filename)
             else:
                 print("JSON file is "+str(delta.days)+" days old.")
 
-        with open(filename, 'r') as f:
-            applist = json.load(f)
-            games = applist["applist"]["apps"]
-            return games
-
-    def start_scraping(self):
+    def start_scraping(self, budget=None):
+        """
+        Scrapes every entry of the records list.
+        :param budget: seconds after which no new entry is started, the
+                       entries in progress are still completed; None for
+                       no limit
+        """
         self.start_time = time.time()
+        self.deadline = self.start_time + budget if budget is not None else None
         print("Starting scraping...")
         if len(self.games_list)>0:
-            for entry in self.games_list:
-                if int(entry) >= self.starting_number:
-                    data = self.get_record(entry)
-                    if data is not None:
-                        self.new_record(data, entry)
-
-                self.current = self.current + 1
+            entries = [entry for entry in self.games_list if self.should_scrape(entry)]
+            if self.journal is not None:
+                if self.journal.resumed:
+                    remaining = self.remaining_entries(entries)
+                    print("Resuming run " + self.journal.run_id + ", " + str(len(entries) - len(remaining)) +
+                          " records already done.")
+                    entries = remaining
+                if self.RESUME_SOURCE is None:
+                    self.journal.start(self.journal_key(entry) for entry in entries)
+                else:
+                    self.journal.start()  # The fetch log tells which records are done
+            self.current = len(self.games_list) - len(entries)  # Skipped entries count as done
+            self.progress.update(self.current, self.total)
+            try:
+                self.run_concurrently(entries)
+            finally:
+                self.writer.close()  # Flushes acknowledged records, even on Ctrl-C or a crash
+            if self.current < self.total:
+                print("Time budget exhausted, " + str(self.total - self.current) + " records left for the next run.")
+            elif self.journal is not None:
+                self.journal.finish()
             self.on_finished()
+            print("Throughput per stage:")
+            for line in self.stats.report():
+                print("  " + line)
+            console.flush_logger(self.logger)
         else:
             print("No records to scrape. Exiting.")
 
+    def remaining_entries(self, entries):
+        """
+        Drops the entries completed by the interrupted run being resumed.
+        Scrapers with a RESUME_SOURCE don't go through their entries in
+        order of their journal keys; the entries done are the games fetched
+        from that source since the interrupted run started.
+        :param entries: entries of the records list to scrape
+        :return: entries left to scrape
+        """
+        if self.RESUME_SOURCE is None:
+            return [entry for entry in entries if not self.journal.is_done(self.journal_key(entry))]
+        conn = sqlite3.connect(self.DATABASE_FILE)
+        with conn:
+            c = conn.execute("select gameid from fetch_log where source=? and last_fetched >= ?",
+                             (self.RESUME_SOURCE, self.journal.started_at))
+            done = set(item[0] for item in c.fetchall())
+        conn.close()
+        return [entry for entry in entries if entry not in done]
+
+    def should_scrape(self, entry):
+        """
+        Decides whether an entry of the records list should be scraped. By
+        default entries are appids and those below STARTING_APPID are skipped.
+        :param entry: entry of the records list
+        :return: True if the entry should be scraped
+        """
+        return int(entry) >= self.starting_number
+
+    def journal_key(self, entry):
+        """
+        Returns the key identifying an entry of the records list in the
+        progress journal. Keys have to increase along the records list.
+        :param entry: entry of the records list
+        """
+        return int(entry)
+
+    def get_parser(self):
+        """
+        Scrapers whose get_record() returns raw response bodies provide here
+        the function turning a body into the data passed to new_record().
+        It runs on the parse processes (see PARSE_PROCESSES), so it has to
+        be a module level function and its arguments have to be picklable.
+        :return: tuple (function, args) where function is called as
+                 function(body, *args), or None if get_record() already
+                 returns the data
+        """
+        return None
+
+    def run_concurrently(self, entries):
+        """
+        Runs every entry through the stages of the pipeline: get_record() on
+        a pool of worker threads keeping at most CONCURRENT_REQUESTS requests
+        in flight, the parser (see get_parser()) on a pool of PARSE_PROCESSES
+        processes, and new_record() on the calling thread as soon as the
+        data arrives, so the insert logic never runs concurrently and
+        self.current always reflects the number of completed entries,
+        regardless of completion order.
+
+        At most PARSE_QUEUE_SIZE bodies wait for the parse processes; while
+        the queue is full no new request is sent, which keeps memory flat
+        when parsing can't keep up with the network. Once the deadline set
+        by start_scraping() has passed, no new request is sent.
+        :param entries: iterable of appids to scrape
+        """
+        parser = self.get_parser()
+        processes = self.PARSE_PROCESSES if parser is not None else 0
+        labels = {"runtype": self.RUNTYPE or type(self).__name__}
+        self.stats = pipeline.PipelineStats(self.metrics, labels)
+        self.metrics.set("records_remaining", self.total - self.current, labels)
+        self.stats.stage("fetch", self.CONCURRENT_REQUESTS)
+        parse_stage = self.stats.stage("parse", processes or self.CONCURRENT_REQUESTS)
+        write_stage = self.stats.stage("write")
+
+        executor = ThreadPoolExecutor(max_workers=self.CONCURRENT_REQUESTS)
+        parse_executor = ProcessPoolExecutor(max_workers=processes) if processes > 0 else None
+        inline_parser = parser if parse_executor is None else None
+        in_flight = {}
+        parsing = {}
+        submitted = {}  # Entry -> time its request was submitted
+        try:
+            entries = iter(entries)
+            exhausted = False
+            while True:
+                if self.deadline is not None and time.time() >= self.deadline:
+                    exhausted = True
+                while not exhausted and len(in_flight) < self.CONCURRENT_REQUESTS:
+                    if len(in_flight) + len(parsing) >= self.CONCURRENT_REQUESTS + self.PARSE_QUEUE_SIZE:
+                        self.stats.add_stall()
+                        break
+                    try:
+                        entry = next(entries)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    submitted[entry] = time.perf_counter()
+                    in_flight[executor.submit(self.fetch_record, entry, inline_parser)] = entry
+                if len(in_flight) + len(parsing) == 0:
+                    break
+                done, _ = wait(list(in_flight) + list(parsing), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in in_flight:
+                        entry = in_flight.pop(future)
+                        data = future.result()
+                        if data is not None and parse_executor is not None:
+                            function, args = parser
+                            parsing[parse_executor.submit(pipeline.timed_call, function, data, *args)] = entry
+                            continue
+                    else:
+                        entry = parsing.pop(future)
+                        try:
+                            data, elapsed = future.result()
+                            parse_stage.add(elapsed)
+                        except Exception as e:
+                            self.logger.error("Failed to parse record #" + str(entry) + ": " + repr(e))
+                            data = None
+                    if data is not None:
+                        write_stage.time(self.new_record, data, entry)
+                    self.stats.add_latency(time.perf_counter() - submitted.pop(entry))
+                    if self.journal is not None:
+                        self.journal.mark_done(self.journal_key(entry))
+                    with self.lock:
+                        self.current = self.current + 1
+                    self.progress.update(self.current, self.total)
+                    self.metrics.set("records_remaining", self.total - self.current, labels)
+        finally:
+            for future in list(in_flight) + list(parsing):
+                future.cancel()
+            executor.shutdown(wait=False)
+            if parse_executor is not None:
+                parse_executor.shutdown(wait=False)
+
+    def report(self):
+        """
+        Summarises the run, for main.py --report.
+        :return: dictionary
+        """
+        elapsed = common.get_elapsed_time(self.start_time)
+        report = {
+            "runtype": self.RUNTYPE,
+            "records": 0,
+            "elapsed": elapsed,
+        }
+        if self.stats is not None:
+            report.update(self.stats.summary())
+            report["records_per_second"] = report["records"] / elapsed if elapsed > 0 else 0
+        return report
+
+    def fetch_record(self, entry, parser):
+        """
+        Runs get_record() on a worker thread. When a parser is given (there
+        are no parse processes), the body is parsed right away on the same
+        thread.
+        """
+        data = self.stats.stage("fetch").time(self.get_record, entry)
+        if data is not None and parser is not None:
+            function, args = parser
+            try:
+                data = self.stats.stage("parse").time(function, data, *args)
+            except Exception as e:
+                self.logger.error("Failed to parse record #" + str(entry) + ": " + repr(e))
+                return None
+        return data
+
     @abstractmethod
     def on_finished(self):
         """
@@ -117,6 +352,79 @@ class Scraper(ABC):
         """
         pass
 
+    def archive_response(self, appid, content):
+        """
+        Keeps the raw body of a response in the archive, if it is enabled,
+        so that it can be parsed again offline (see reprocess_scraper.py).
+        :param appid: id of the app the response is about
+        :param content: body of the response
+        """
+        if self.archive is not None and self.ARCHIVE_SOURCE is not None:
+            self.archive.append(self.ARCHIVE_SOURCE, int(appid), content)
+
+    def fetch(self, url, use_cache=True, validate=None):
+        """
+        Sends a GET request through the shared transport (see
+        transport.Transport) once the shared rate limiter allows it. Requests
+        answered with 429 are retried (the limiter backs off, honouring
+        Retry-After), any other response is returned to the caller. Network
+        errors are raised. Every response is counted in the metrics by
+        endpoint family and status code.
+
+        Unless use_cache is False, fresh responses are served from the
+        response cache, and stale ones are revalidated with a conditional
+        request; a 304 then returns the cached response. A 200 response whose
+        body fails validate is returned but not cached, so that a retry goes
+        to the network again.
+        :param url: url to retrieve
+        :param use_cache: whether the response cache may be used
+        :param validate: function called with the body of a response,
+                         returning False when it shouldn't be cached
+        :return: requests.Response or http_cache.CachedResponse
+        """
+        use_cache = use_cache and self.cache is not None
+        endpoint = {"endpoint": endpoint_family(url)}
+        cached = None
+        headers = {}
+        if use_cache:
+            cached, fresh = self.cache.get(url)
+            if cached is not None and validate is not None and not validate(cached.content):
+                cached = None
+            elif fresh:
+                self.metrics.inc("cache_responses_total", dict(endpoint, result="fresh"))
+                return cached
+            if cached is not None:
+                headers = self.cache.conditional_headers(cached)
+
+        attempts = 0
+        while True:
+            waiting_since = time.perf_counter()
+            issued_at = self.rate_limiter.acquire(url)
+            sent_at = time.perf_counter()
+            self.metrics.observe("rate_limit_wait_seconds", sent_at - waiting_since, endpoint)
+            try:
+                resp = self.transport.get(url, headers=headers)
+            except requests.RequestException:
+                self.metrics.inc("http_requests_total", dict(endpoint, status="error"))
+                raise
+            self.metrics.observe("http_request_duration_seconds", time.perf_counter() - sent_at, endpoint)
+            self.metrics.inc("http_requests_total", dict(endpoint, status=str(resp.status_code)))
+            if resp.status_code == 429:
+                attempts += 1
+                self.rate_limiter.on_throttled(url, issued_at, resp.headers.get("Retry-After"))
+                self.logger.warning("Too many requests, waiting... #" + str(attempts))
+            else:
+                if resp.status_code < 500:
+                    self.rate_limiter.on_success(url)
+                if use_cache:
+                    if resp.status_code == 304 and cached is not None:
+                        self.cache.revalidate(url)
+                        self.metrics.inc("cache_responses_total", dict(endpoint, result="revalidated"))
+                        return cached
+                    if resp.status_code == 200 and (validate is None or validate(resp.content)):
+                        self.cache.store(url, resp)
+                return resp
+
     @abstractmethod
     def new_record(self, data, appid):
         """
@@ -127,23 +435,18 @@ class Scraper(ABC):
         """
         pass
 
-    def printc(self, string, color):
+    def on_write_error(self, error):
         """
-        Helper function used to print text and the progress bar. Also
-        supports different text colors.
-        :param string: text to print
-        :param color: an instance of Color to use
+        Called by the database writer when one of the records could not be
+        written. The record is rolled back, the rest of its batch is kept.
         """
-        percent = common.percentage(self.current, self.total)
-        sys.stdout.write(common.ANSISequence.ERASE_LINE)
-        if self.verbose:
-            sys.stdout.write(color + string + common.Color.ENDC + "\n")
-        else:
-            with open(self.LOGFILE, "a") as logfile:
-                logfile.write(string+"\n")
-
-        sys.stdout.write(common.Color.BOLD + "[%-50s] %d%%" % ('=' * int(percent / 2), percent) + common.Color.ENDC)
-        sys.stdout.flush()
-
-
+        self.logger.error("Failed to write a record: " + str(error))
 
+    def on_write_flush(self):
+        """
+        Called by the database writer after it committed. Every record marked
+        as done in the journal has been submitted to the writer before, so the
+        journal can now be saved.
+        """
+        if self.journal is not None:
+            self.journal.save()
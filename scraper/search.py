@@ -0,0 +1,134 @@
+"""
+Full-text index over the names and descriptions of the games, in an FTS5
+table. The descriptions are stored by Steam as HTML; they are indexed as
+plain text, so markup never matches a query. The index is optional: it is
+built by DBHandler when SEARCH_INDEX is enabled, and the scrapers keep it
+up to date for as long as it exists.
+"""
+import re
+import sqlite3
+from html import unescape
+from . import descriptions
+
+TABLE = "games_fts"
+# Indexed columns of the games table, and how much a match in each of them weighs in the ranking
+COLUMNS = ("name", "short_description", "about_the_game", "detailed_description")
+WEIGHTS = (10.0, 4.0, 1.0, 1.0)
+HTML_COLUMNS = COLUMNS[1:]
+
+CREATE_INDEX = "CREATE VIRTUAL TABLE %s USING fts5(%s, tokenize='unicode61 remove_diacritics 2')" % (
+    TABLE, ", ".join(COLUMNS))
+DELETE_GAME = "delete from %s where rowid=?" % TABLE
+INSERT_GAME = "insert into %s (rowid, %s) values(?,%s)" % (TABLE, ", ".join(COLUMNS), ",".join("?" * len(COLUMNS)))
+RENAME_GAME = "update %s set name=? where rowid=?" % TABLE
+SEARCH = """
+    SELECT rowid, name, bm25(%s, %s) AS score
+    FROM %s
+    WHERE %s MATCH ?
+    ORDER BY score
+    LIMIT ?
+    """ % (TABLE, ", ".join(str(weight) for weight in WEIGHTS), TABLE, TABLE)
+
+tag_regex = re.compile(r"<[^>]*>")
+space_regex = re.compile(r"\s+")
+
+
+def strip_html(text):
+    """
+    :param text: HTML fragment, such as the description of a game
+    :return: text without markup, entities decoded and whitespace collapsed
+    """
+    if not text:
+        return text
+    return space_regex.sub(" ", unescape(tag_regex.sub(" ", text))).strip()
+
+
+def document(game):
+    """
+    :param game: mapping of the columns of a game to their values
+    :return: values of COLUMNS to index, as plain text
+    """
+    return tuple(strip_html(game.get(column)) if column in HTML_COLUMNS else game.get(column)
+                 for column in COLUMNS)
+
+
+def has_index(conn):
+    """:return: True if the database has a search index"""
+    c = conn.execute("select 1 from sqlite_master where type='table' and name=?", (TABLE,))
+    return c.fetchone() is not None
+
+
+def create_index(conn, chunk_size=1000, log=print):
+    """
+    Creates the search index and fills it with the games already recorded,
+    in a single transaction so that a database never holds a partial index.
+    Does nothing if the index exists.
+    :param conn: sqlite connection
+    :param chunk_size: number of games read from the database at once
+    :param log: function called with progress messages
+    :return: True if the index exists, False if SQLite was built without FTS5
+    """
+    if has_index(conn):
+        return True
+    try:
+        with conn:
+            conn.execute("begin")  # The sqlite3 module doesn't open a transaction for CREATE statements
+            conn.execute(CREATE_INDEX)
+            descriptions.register(conn)
+            games = conn.execute("select id, %s from games" % ", ".join(
+                descriptions.select_expr(column) if column in descriptions.COLUMNS else column for column in COLUMNS))
+            total = 0
+            while True:
+                rows = games.fetchmany(chunk_size)
+                if len(rows) == 0:
+                    break
+                conn.executemany(INSERT_GAME, [(row[0],) + document(dict(zip(COLUMNS, row[1:]))) for row in rows])
+                total += len(rows)
+            log("Search index built over " + str(total) + " games.")
+    except sqlite3.OperationalError as e:
+        if "fts5" not in str(e):
+            raise
+        log("SQLite was built without FTS5, the search index can't be created.")
+        return False
+    return True
+
+
+def index_game(rec, gameid, game):
+    """
+    Adds to a database record the statements replacing a game in the index.
+    :param rec: db_writer.Record
+    :param gameid: id of the game
+    :param game: mapping of the columns of the game to their values, such
+                 as dict(zip(app_details.GAME_COLUMNS, game))
+    """
+    rec.execute(DELETE_GAME, (gameid,))
+    rec.execute(INSERT_GAME, (gameid,) + document(game))
+
+
+def match_query(text):
+    """
+    Turns free text into an FTS5 query matching the games that contain
+    every word, so that punctuation is never read as query syntax. A word
+    ending with * matches every word starting with it.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def search(conn, text, limit=20):
+    """
+    :param conn: sqlite connection to a database with a search index
+    :param text: words to look for, see match_query()
+    :param limit: maximum number of results
+    :return: list of (appid, name, score) tuples, best match first; the
+             higher the score, the better the match
+    """
+    query = match_query(text)
+    if not query:
+        return []
+    return [(appid, name, -score) for appid, name, score in conn.execute(SEARCH, (query, limit))]
@@ -0,0 +1,177 @@
+import re
+from abc import ABC, abstractmethod
+from . import html_extractor, dimensions
+
+# Registered extractors by name, in registration order
+REGISTRY = {}
+
+total_regexes = (re.compile(r"of the ([\d,]+) user reviews"), re.compile(r"\(([\d,]+)\)"))
+summary_regex = re.compile(r"[^(\-]*")
+
+
+def register(cls):
+    """Class decorator adding an extractor to the registry."""
+    REGISTRY[cls.NAME] = cls()
+    return cls
+
+
+def get_extractors(names=None):
+    """
+    :param names: iterable of extractor names, None for every registered one
+    :return: list of extractors
+    """
+    if names is None:
+        return list(REGISTRY.values())
+    extractors = []
+    for name in names:
+        if name not in REGISTRY:
+            raise ValueError("Unknown store page extractor: " + name +
+                             ". Available extractors: " + ", ".join(REGISTRY))
+        extractors.append(REGISTRY[name])
+    return extractors
+
+
+def parse_page(content, names=None, backend=html_extractor.AUTO):
+    """
+    Parses a store page once and runs the given extractors on it.
+    :param content: page content, bytes or str
+    :param names: names of the extractors to run, None for all of them
+    :param backend: HTML extraction backend, see html_extractor.extract()
+    :return: dictionary mapping the name of every extractor that found
+             something on the page to its data
+    """
+    page = html_extractor.extract(content, backend)
+    result = {}
+    for extractor in get_extractors(names):
+        data = extractor.parse(page)
+        if data is not None:
+            result[extractor.NAME] = data
+    return result
+
+
+class Extractor(ABC):
+    """
+    Base class of the store page extractors. An extractor picks its data out
+    of a parsed store page and writes it to its own table. Extractors only
+    write what the page shows: when parse() finds nothing, the records
+    already in the database are left alone.
+    """
+
+    NAME = None
+
+    @abstractmethod
+    def parse(self, page):
+        """
+        :param page: dictionary returned by html_extractor.extract()
+        :return: data to write, None if the page doesn't have any
+        """
+        pass
+
+    @abstractmethod
+    def write(self, rec, appid, data):
+        """
+        Adds the statements writing the data of a game to a database record.
+        :param rec: db_writer.Record
+        :param appid: id of the game
+        :param data: value returned by parse()
+        """
+        pass
+
+
+@register
+class TagsExtractor(Extractor):
+
+    NAME = "tags"
+
+    def parse(self, page):
+        if len(page["tags"]) == 0:
+            return None
+        return page["tags"]
+
+    def write(self, rec, appid, data):
+        rec.execute(dimensions.delete_game_stmt("tags"), (appid,))
+        dimensions.insert_names(rec, "tags", [(tag, appid) for tag in data])
+
+
+@register
+class RatingExtractor(Extractor):
+
+    NAME = "rating"
+
+    def parse(self, page):
+        return html_extractor.rating_from_rows(page["reviews"])
+
+    def write(self, rec, appid, data):
+        rec.execute("update games set rating=? where id=?", (data, appid))
+
+
+def parse_review_row(row):
+    """
+    Splits the text of a review summary row, such as
+    "All Reviews:Very Positive(2,107)- 91% of the 2,107 user reviews ...".
+    :return: tuple (label, summary, percentage, total), unknown values None
+    """
+    label, separator, rest = row.partition(":")
+    if len(separator) == 0:
+        return None
+    summary = summary_regex.match(rest).group().strip()
+    percentage = html_extractor.percentage_regex.search(rest)
+    total = None
+    for regex in total_regexes:
+        match = regex.search(rest)
+        if match is not None:
+            total = int(match.group(1).replace(",", ""))
+            break
+    return (label.strip(), summary if len(summary) > 0 else None,
+            int(percentage.group(1)) if percentage is not None else None, total)
+
+
+@register
+class ReviewsExtractor(Extractor):
+
+    NAME = "reviews"
+
+    def parse(self, page):
+        rows = [row for row in map(parse_review_row, page["reviews"]) if row is not None]
+        if len(rows) == 0:
+            return None
+        return rows
+
+    def write(self, rec, appid, data):
+        rec.execute("delete from reviews where gameid=?", (appid,))
+        rec.executemany("insert into reviews (label, summary, percentage, total, gameid) values(?,?,?,?,?)",
+                        [row + (appid,) for row in data])
+
+
+@register
+class DLCExtractor(Extractor):
+
+    NAME = "dlc"
+
+    def parse(self, page):
+        if len(page["dlc"]) == 0:
+            return None
+        return page["dlc"]
+
+    def write(self, rec, appid, data):
+        rec.execute("delete from dlc where gameid=?", (appid,))
+        rec.executemany("insert into dlc (dlcid, name, gameid) values(?,?,?)",
+                        [(dlcid, name, appid) for dlcid, name in data])
+
+
+@register
+class ControllerSupportExtractor(Extractor):
+
+    NAME = "controller_support"
+
+    def parse(self, page):
+        for feature in page["features"]:
+            feature = feature.lower()
+            if "full controller support" in feature:
+                return "full"
+            if "partial controller support" in feature:
+                return "partial"
+        return None
+
+    def write(self, rec, appid, data):
+        rec.execute("insert or replace into controller_support (gameid, support) values(?,?)", (appid, data))
@@ -0,0 +1,94 @@
+import requests
+import sqlite3
+from . import common, scraper, html_extractor, store_extractors, scheduler, archive, app_details
+from time import sleep
+
+
+class StorePageScraper(scraper.Scraper):
+    """
+    Fetches the store page of every game once and runs the enabled store
+    page extractors on it, each of them writing to its own table. Runtypes
+    derived from it only choose the games and the extractors.
+    """
+
+    RUNTYPE = "store_page"
+    EXTRACTORS = None  # Names of the extractors to run, None to read them from the config
+    FETCH_SOURCE = scheduler.STORE_PAGE  # Source under which the fetched pages are logged in the fetch log
+    ARCHIVE_SOURCE = archive.STORE_PAGE
+
+    def __init__(self, config_filename: str, verbose: bool):
+        scraper.Scraper.__init__(self, config_filename, verbose)
+        self.APP_DETAILS_URL = self.STORE_URL + "/app/"
+        self.succeed = 0
+        self.fail = 0
+        self.HTML_PARSER = self.config.get("HTML_PARSER", html_extractor.AUTO)
+        names = self.EXTRACTORS
+        if names is None and self.config.get("STORE_PAGE_EXTRACTORS", "").strip():
+            names = [name.strip() for name in self.config["STORE_PAGE_EXTRACTORS"].split(",") if name.strip()]
+        self.extractors = store_extractors.get_extractors(names)
+        self.extractor_names = [extractor.NAME for extractor in self.extractors]
+
+    def get_records_list(self):
+        conn = sqlite3.connect(self.DATABASE_FILE)
+        with conn:
+            c = conn.cursor()
+            stmt = """
+                    SELECT id from games ORDER BY id;
+                    """
+            c.execute(stmt)
+            result = [item[0] for item in c.fetchall()]
+            return result
+
+    def new_record(self, data, appid):
+        """
+        Writes the data found by every extractor for a given appid in a
+        single record, along with the fetch of the page in the fetch log.
+        :param data: dictionary mapping extractor names to their data
+        :param appid: id of an app
+        """
+        with self.writer.record() as rec:
+            if self.LOG_FETCHES:
+                scheduler.log_fetch(rec, self.FETCH_SOURCE, appid, app_details.fingerprint(data))
+            for extractor in self.extractors:
+                if extractor.NAME in data:
+                    extractor.write(rec, appid, data[extractor.NAME])
+        if len(data) == 0:
+            return
+        self.succeed += 1
+        self.logger.info("Records for #" + str(appid) + " inserted (" + ", ".join(data) + ").")
+
+    def get_parser(self):
+        return store_extractors.parse_page, (self.extractor_names, self.HTML_PARSER)
+
+    def get_record(self, appid):
+        self.logger.debug("Running ID " + str(appid) + "...")
+        url = self.APP_DETAILS_URL + str(appid)
+        attempts = 0
+        while True:
+            try:
+                resp = self.fetch(url)
+                if resp.status_code == 200:
+                    self.archive_response(appid, resp.content)
+                    return resp.content
+                elif resp.status_code == 404:
+                    self.logger.warning("No such page exists. #")
+                    with self.lock:
+                        self.fail += 1
+                    return None
+            except (requests.ConnectionError, requests.Timeout, ConnectionResetError) as e:
+                attempts += 1
+                self.logger.warning("Error occurred " + str(e.__class__) + ". #" + str(attempts))
+                sleep(self.TIMEOUT)
+            except requests.TooManyRedirects as e:
+                attempts += 1
+                self.logger.warning("Too many redirects. #" + str(attempts))
+                self.logger.error("Can't get record, moving on.")
+                with self.lock:
+                    self.fail += 1
+                return None
+
+    def on_finished(self):
+        self.progress.finish()
+        common.printcolor("\n\nExecution finished. Updated records: " + str(self.succeed) +
+                          " | Failed: " + str(self.fail) + " | Total: " + str(self.total), common.Color.OKBLUE)
+        print("Execution time: " + common.seconds_to_string(common.get_elapsed_time(self.start_time)))
@@ -0,0 +1,92 @@
+import os
+import shutil
+import threading
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+# Date of birth sent to the store age gate: January 1st 1990
+BIRTHTIME = "631152001"
+AGE_GATE_COOKIES = {
+    "birthtime": BIRTHTIME,
+    "lastagecheckage": "1-January-1990",
+    "wants_mature_content": "1",
+    "mature_content": "1",
+}
+
+
+class Transport:
+    """
+    HTTP transport shared by the scrapers. All requests go through a single
+    session, so connections to a host are kept alive and reused instead of
+    going through a new TCP and TLS handshake every time. At most
+    connections_per_host connections are open to a host; when all of them
+    are busy, a request waits for one to be returned to the pool.
+
+    Responses are requested compressed, and the cookies of the store age
+    gate are preset, so that store pages of mature games are served
+    directly instead of redirecting to the age check.
+    """
+
+    def __init__(self, store_url, connections_per_host=4, timeout=30.0, max_hosts=10):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=connections_per_host, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.adapter = adapter
+        store_host = urlparse(store_url).hostname
+        for name, value in AGE_GATE_COOKIES.items():
+            self.session.cookies.set(name, value, domain=store_host, path="/")
+
+    def get(self, url, headers=None, stream=False):
+        """
+        Sends a GET request.
+        :param url: url to retrieve
+        :param headers: headers added to the ones of the session
+        :param stream: whether to leave the body to be read by the caller
+        :return: requests.Response
+        """
+        return self.session.get(url, headers=headers, timeout=self.timeout, stream=stream)
+
+    def download(self, url, filename):
+        """
+        Saves the body of a response to a file, without holding it in memory.
+        The file is only replaced once the download is complete.
+        """
+        temp_filename = filename + ".part"
+        with self.get(url, stream=True) as resp:
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            with open(temp_filename, "wb") as f:
+                shutil.copyfileobj(resp.raw, f, 1024 * 1024)
+        os.replace(temp_filename, filename)
+
+    def collect(self, metrics):
+        """Sets the number of connections opened to every host, see metrics.Metrics.add_collector()."""
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                metrics.set("http_connections_opened", pool.num_connections, {"host": pool.host})
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_transport(config):
+    """
+    Returns the transport shared by every scraper in this process, creating
+    it from the config on first use.
+    :param config: config dictionary, see common.read_config_file()
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Transport(config.get("STORE_URL", "https://store.steampowered.com"),
+                                connections_per_host=int(config.get("CONNECTIONS_PER_HOST",
+                                                                    config.get("CONCURRENT_REQUESTS", 4))),
+                                timeout=float(config.get("REQUEST_TIMEOUT", 30)))
+        return _shared
@@ -3,14 +3,79 @@ from scraper import game_scraper
 from scraper import webui_scraper
 from scraper import db_handler
 from scraper import common
+from scraper import scraper
 from scraper.date_formatter import DateFormatter
+from scraper.db_writer import DBWriter
+from scraper import rate_limiter
+from scraper import price_scraper
+from scraper import http_cache
+from scraper import games_update_scraper
+from scraper.journal import ProgressJournal
+from scraper import app_list
+from scraper import html_extractor
+from scraper import store_extractors
+from scraper import store_page_scraper
+from scraper import app_details
+from scraper import migrations
+from scraper import dimensions
+from scraper import metrics
+from scraper import console
+from scraper import transport
+from scraper import scheduler
+from scraper import export
+from scraper import search
+from scraper import descriptions
+from scraper import compression
+from scraper import archive
+from scraper import reprocess_scraper
+import csv
+import datetime
+import glob
+import gzip
+import io
+import json
+import logging
+import pickle
+import shutil
 import sqlite3
 import os
+import tempfile
+import time
+import urllib.request
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from array import array
 
 
 TESTING_FOLDER = "scraper/testing/"
 
 
+def write_scraper_config(folder, database, **settings):
+    """
+    Writes the config file of a scraper under test to a temporary folder, so
+    that its logfile stays there and neither the cache, the journal nor the
+    archive is enabled.
+    :param folder: temporary folder
+    :param database: database file of the scraper
+    :param settings: other config values
+    :return: name of the config file
+    """
+    config = {
+        "DATABASE_FILENAME": database,
+        "ALLGAMES_FILENAME": os.path.join(folder, "allgames.json"),
+        "TIMEOUT": 1,
+        "STARTING_APPID": 0,
+        "JSON_MAX_FILE_AGE": 7,
+        "LOGFILE_NAME": os.path.join(folder, "log"),
+    }
+    config.update(settings)
+    filename = os.path.join(folder, "config.yml")
+    with open(filename, "w") as f:
+        for key, value in config.items():
+            f.write("%s: %s\n" % (key, value))
+    return filename
+
+
 class TestPercentage(unittest.TestCase):
 
     def test_percentage_0(self):
@@ -113,21 +178,95 @@ class TestDbHandler(unittest.TestCase):
             result = db_handler.DBHandler.table_verification(c)
             self.assertTrue(result, "Validation isn't working properly")
 
+    def test3_legacy_database_is_migrated(self):
+        conn = sqlite3.connect(self.test_db)
+        with conn:
+            conn.executescript("""
+                CREATE TABLE games(id integer primary key not null, name varchar(200) not null, type varchar(50),
+                required_age integer, is_free boolean, full_game_id integer, detailed_description text,
+                about_the_game text, short_description text, price integer, rating tinyint, recommendations integer,
+                is_released boolean, release_date datetime, screenshots integer, movies integer, achievements integer);
+                CREATE TABLE tags(name varchar(120), gameid integer, FOREIGN KEY(gameid) REFERENCES games(id));
+                INSERT INTO games (id, name, about_the_game) VALUES (10, 'Game', '<p>About</p>');
+                INSERT INTO games (id, name, about_the_game, short_description) VALUES (20, 'DLC', '<p>About</p>', '');
+                INSERT INTO tags (name, gameid) VALUES ('Indie', 10);
+                INSERT INTO tags (name, gameid) VALUES ('Indie', 10);
+                """)
+        applied = migrations.migrate(conn, log=lambda message: None)
+        self.assertEqual(applied, [version for version, description, script in migrations.MIGRATIONS],
+                         "Not every migration was applied")
+        self.assertEqual(migrations.get_version(conn), migrations.LATEST_VERSION, "Version not recorded")
+        self.assertTrue(db_handler.DBHandler.table_verification(conn.cursor()), "Migrated database failed verification")
+        self.assertEqual(conn.execute("select name, gameid from tags").fetchall(), [("Indie", 10), ("Indie", 10)],
+                         "Data was lost")
+        self.assertEqual(conn.execute("select id, name from tag_names").fetchall(), [(1, "Indie")],
+                         "Tag names not moved to the dimension table")
+        descriptions.register(conn)
+        self.assertEqual(conn.execute("select gameid, about_the_game, short_description, detailed_description "
+                                      "from game_descriptions").fetchall(),
+                         [(10, "<p>About</p>", None, None), (20, "<p>About</p>", "", None)],
+                         "Descriptions not moved to blobs")
+        self.assertEqual(conn.execute("select count(*) from description_blobs").fetchone(), (2,),
+                         "Descriptions not deduplicated")
+        self.assertEqual(conn.execute("select count(*) from games where about_the_game is not null").fetchone(), (0,),
+                         "Descriptions left in the games table")
+        plan = " ".join(str(row) for row in conn.execute("explain query plan delete from game_tags where gameid = 10"))
+        self.assertIn("game_tags_gameid", plan, "Index on gameid not used")
+        self.assertEqual(migrations.migrate(conn), [], "Migrations applied twice")
+        conn.close()
+
     def tearDown(self):
         os.remove(TESTING_FOLDER+"testing_database.db")
 
 
+class InaccessibleGameScraper(game_scraper.GameScraper):
+    """Game scraper answered by Steam as if every app was inaccessible."""
+
+    def get_record(self, appid):
+        return json.dumps({str(appid): {"success": False}}).encode()
+
+
+class TestGameScraperSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.database = os.path.join(self.folder, "db")
+        self.snapshot = os.path.join(self.folder, "snapshot")
+        conn = sqlite3.connect(self.database)
+        migrations.migrate(conn, log=lambda message: None)
+        conn.close()
+        with open(os.path.join(self.folder, "allgames.json"), "w") as f:
+            json.dump({"applist": {"apps": [{"appid": appid, "name": "App"} for appid in (10, 20, 30)]}}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_snapshot_saved_after_complete_run(self):
+        config = write_scraper_config(self.folder, self.database, APP_SNAPSHOT_FILENAME=self.snapshot)
+        InaccessibleGameScraper(config, False, False).start_scraping()
+        self.assertEqual(list(app_list.load_snapshot(self.snapshot)[0]), [10, 20, 30], "Snapshot not saved")
+
+    def test_snapshot_not_saved_when_apps_skipped(self):
+        config = write_scraper_config(self.folder, self.database, APP_SNAPSHOT_FILENAME=self.snapshot,
+                                      STARTING_APPID=20)
+        InaccessibleGameScraper(config, False, False).start_scraping()
+        self.assertIsNone(app_list.load_snapshot(self.snapshot), "Apps below STARTING_APPID left out of the next runs")
+
+
 class TestGameScraperIsRecorded(unittest.TestCase):
 
     def setUp(self):
         self.test_db = TESTING_FOLDER+"testing_database.db"
         self.conn = sqlite3.connect(self.test_db)
-        self.game_scraper = game_scraper.GameScraper("config.yml", False, False)
         with self.conn:
             c = self.conn.cursor()
             c.execute("create table inaccessible (id integer primary key not null);")
             c.execute("create table games (id integer primary key not null);")
             c.execute("insert into games values (20);")
+        self.folder = tempfile.mkdtemp()
+        with open(os.path.join(self.folder, "allgames.json"), "w") as f:
+            json.dump({"applist": {"apps": []}}, f)
+        self.game_scraper = game_scraper.GameScraper(write_scraper_config(self.folder, self.test_db), False, False)
 
     def test_is_recorded_non_existent(self):
         result = game_scraper.GameScraper.is_not_recorded(self.game_scraper, self.conn, 10)
@@ -137,8 +276,774 @@ class TestGameScraperIsRecorded(unittest.TestCase):
         result = game_scraper.GameScraper.is_not_recorded(self.game_scraper, self.conn, 20)
         self.assertFalse(result, "Is Recorded in game_scraper not working")
 
+    def test_check_all_records(self):
+        with self.conn:
+            self.conn.execute("insert into inaccessible values (30);")
+        self.game_scraper.DATABASE_FILE = self.test_db
+        appids = [10, 20, 30, 40]
+        result = self.game_scraper.check_all_records(appids)
+        self.assertEqual(list(result), [10, 40], "Check All Records in game_scraper not working")
+        self.game_scraper.override_missing = True
+        result = self.game_scraper.check_all_records(appids)
+        self.assertEqual(list(result), [10, 30, 40], "Check All Records ignores override_missing")
+
+    def test_check_records(self):
+        with self.conn:
+            self.conn.execute("insert into inaccessible values (30);")
+        self.game_scraper.DATABASE_FILE = self.test_db
+        result = self.game_scraper.check_records(array("l", [10, 20, 30, 40]), chunk_size=3)
+        self.assertEqual(list(result), [10, 40], "Check Records in game_scraper not working")
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(TESTING_FOLDER+"testing_database.db")
+        shutil.rmtree(self.folder)
+
+
+class TestDBWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db = TESTING_FOLDER+"testing_database.db"
+        self.conn = sqlite3.connect(self.test_db)
+        with self.conn:
+            self.conn.execute("create table inaccessible (id integer primary key not null);")
+        self.errors = []
+        self.writer = DBWriter(self.test_db, batch_size=3, flush_interval=3600, on_error=self.errors.append)
+
+    def count(self):
+        return self.conn.execute("select count(*) from inaccessible").fetchone()[0]
+
+    def test_records_are_batched(self):
+        self.writer.execute("insert into inaccessible (id) values(?)", (1,))
+        self.writer.execute("insert into inaccessible (id) values(?)", (2,))
+        self.assertEqual(self.count(), 0, "Records were written before the batch was full")
+        self.writer.execute("insert into inaccessible (id) values(?)", (3,))
+        self.assertEqual(self.count(), 3, "Full batch was not written")
+
+    def test_close_flushes_pending_records(self):
+        with self.writer.record() as rec:
+            rec.executemany("insert into inaccessible (id) values(?)", [(1,), (2,)])
+        self.writer.close()
+        self.assertEqual(self.count(), 2, "Pending records were lost on close")
+
+    def test_failed_record_is_rolled_back_alone(self):
+        with self.writer.record() as rec:
+            rec.execute("insert into inaccessible (id) values(?)", (1,))
+        with self.writer.record() as rec:
+            rec.execute("insert into inaccessible (id) values(?)", (2,))
+            rec.execute("insert into inaccessible (id) values(?)", (1,))
+        self.writer.close()
+        self.assertEqual(self.count(), 1, "Failed record was not rolled back on its own")
+        self.assertEqual(len(self.errors), 1, "Failed record was not reported")
+
+    def test_names_are_interned(self):
+        conn = self.conn
+        with conn:
+            db_handler.DBHandler.create_tables(conn.cursor())
+        with self.writer.record() as rec:
+            dimensions.insert_names(rec, "tags", [("Indie", 1), ("RPG", 1)])
+        with self.writer.record() as rec:
+            dimensions.insert_names(rec, "tags", [("Action", 2)])
+            rec.execute("insert into missing_table values(1)")
+        with self.writer.record() as rec:
+            dimensions.insert_names(rec, "tags", [("Indie", 2), ("Action", 3)])
+        self.writer.flush()
+        self.assertEqual(self.writer.name_ids["tag_names"], {"Indie": 1, "RPG": 2, "Action": 3},
+                         "Names rolled back are still cached")
+        self.assertEqual(conn.execute("select name, gameid from tags order by gameid, name").fetchall(),
+                         [("Indie", 1), ("RPG", 1), ("Indie", 2), ("Action", 3)], "Names not linked properly")
+
+    def test_interrupted_flush_forgets_names(self):
+        with self.conn:
+            db_handler.DBHandler.create_tables(self.conn.cursor())
+        name_id = self.writer.name_id
+
+        def interrupted(dimension, name, interned):
+            nameid = name_id(dimension, name, interned)
+            if name == "RPG":
+                raise KeyboardInterrupt()
+            return nameid
+        self.writer.name_id = interrupted
+        with self.writer.record() as rec:
+            dimensions.insert_names(rec, "tags", [("Action", 1), ("RPG", 1)])
+        with self.assertRaises(KeyboardInterrupt):
+            self.writer.flush()
+        del self.writer.name_id
+        with self.writer.record() as rec:
+            dimensions.insert_names(rec, "tags", [("RPG", 2)])
+        self.writer.close()
+        self.assertEqual(self.conn.execute("select name, gameid from tags order by gameid, name").fetchall(),
+                         [("Action", 1), ("RPG", 1), ("RPG", 2)], "Names rolled back by an interruption still cached")
+
+    def test_close_calls_on_flush_once(self):
+        flushes = []
+        self.writer.on_flush = lambda: flushes.append(self.count())
+        self.writer.execute("insert into inaccessible (id) values(?)", (1,))
+        self.writer.close()
+        self.assertEqual(flushes, [1], "on_flush not called once on close")
+
+    def test_record_is_discarded_on_exception(self):
+        with self.assertRaises(KeyError):
+            with self.writer.record() as rec:
+                rec.execute("insert into inaccessible (id) values(?)", (1,))
+                raise KeyError()
+        self.writer.close()
+        self.assertEqual(self.count(), 0, "Record interrupted by an exception was written")
+
+    def tearDown(self):
+        self.writer.close()
+        self.conn.close()
+        os.remove(TESTING_FOLDER+"testing_database.db")
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = rate_limiter.AdaptiveTokenBucket(2, min_rate=0.5, max_rate=4, increase=1,
+                                                       clock=self.clock, sleep=self.clock.sleep)
+
+    def test_endpoint_families(self):
+        self.assertEqual(rate_limiter.endpoint_family("https://store.steampowered.com/api/appdetails?appids=10"),
+                         rate_limiter.APPDETAILS, "appdetails url not recognised")
+        self.assertEqual(rate_limiter.endpoint_family("https://store.steampowered.com/app/10"),
+                         rate_limiter.STORE_PAGE, "store page url not recognised")
+
+    def test_requests_are_spaced_by_rate(self):
+        first = self.bucket.acquire()
+        second = self.bucket.acquire()
+        self.assertAlmostEqual(second - first, 0.5, msg="Token bucket is not pacing requests")
+
+    def test_backs_off_once_per_burst_and_honours_retry_after(self):
+        issued = [self.bucket.acquire(), self.bucket.acquire()]
+        for issued_at in issued:
+            self.bucket.on_throttled(issued_at, 30)
+        self.assertEqual(self.bucket.rate, 1, "Rate was not decreased exactly once for a burst of 429s")
+        self.assertGreaterEqual(self.bucket.acquire(), issued[-1] + 30, "Retry-After was not honoured")
+
+    def test_probes_upward_on_success(self):
+        for i in range(100):
+            self.bucket.on_success()
+        self.assertEqual(self.bucket.rate, 4, "Rate is not increased on success up to max_rate")
+
+    def test_parse_retry_after(self):
+        self.assertEqual(rate_limiter.parse_retry_after("120"), 120, "Retry-After seconds not parsed")
+        self.assertEqual(rate_limiter.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0,
+                         "Retry-After date in the past not parsed")
+        self.assertIsNone(rate_limiter.parse_retry_after("soon"), "Malformed Retry-After not ignored")
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render(self):
+        m = metrics.Metrics()
+        m.inc("http_requests_total", {"endpoint": "appdetails", "status": "200"})
+        m.inc("http_requests_total", {"status": "429", "endpoint": "appdetails"}, 2)
+        m.observe("stage_duration_seconds", 0.003, {"stage": "fetch"})
+        m.observe("stage_duration_seconds", 100, {"stage": "fetch"})
+        m.add_collector(lambda registry: registry.set("records_remaining", 7))
+        text = m.render()
+        self.assertIn('steam_scraper_http_requests_total{endpoint="appdetails",status="429"} 2\n', text,
+                      "Counter not rendered")
+        self.assertIn('steam_scraper_stage_duration_seconds_bucket{stage="fetch",le="0.001"} 0\n', text,
+                      "Histogram bucket not rendered")
+        self.assertIn('steam_scraper_stage_duration_seconds_bucket{stage="fetch",le="0.005"} 1\n', text,
+                      "Histogram buckets are not cumulative")
+        self.assertIn('steam_scraper_stage_duration_seconds_bucket{stage="fetch",le="+Inf"} 2\n', text,
+                      "Values above every bucket not counted")
+        self.assertIn("steam_scraper_stage_duration_seconds_count{stage=\"fetch\"} 2\n", text, "Count not rendered")
+        self.assertIn("steam_scraper_records_remaining 7\n", text, "Collector not called")
+        self.assertIn("# TYPE steam_scraper_stage_duration_seconds histogram\n", text, "Type not declared")
+        self.assertNotIn("db_flush_duration_seconds", text, "Metrics without values rendered")
+
+    def test_exporters(self):
+        m = metrics.Metrics()
+        m.inc("records_total", {"runtype": "test"})
+        filename = TESTING_FOLDER + "metrics.prom"
+        exporter = metrics.FileExporter(m, filename, 60)
+        exporter.stop()
+        with open(filename, "r") as f:
+            self.assertEqual(f.read(), m.render(), "Metrics file not written")
+        os.remove(filename)
+        server = metrics.HTTPExporter(m, 0)
+        try:
+            with urllib.request.urlopen("http://127.0.0.1:%d/metrics" % server.port) as resp:
+                self.assertEqual(resp.read().decode("utf-8"), m.render(), "Metrics not served")
+        finally:
+            server.stop()
+
+
+class TestTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.connections = 0
+        self.cookies = []
+        self.bodies = []  # Bodies of the next responses to /api/ requests
+        test = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                test.connections += 1
+
+            def do_GET(self):
+                test.cookies.append(self.headers.get("Cookie", ""))
+                if self.path.startswith("/app/") and "birthtime=" not in self.headers.get("Cookie", ""):
+                    self.send_response(302)
+                    self.send_header("Location", "/agecheck" + self.path)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = b'{"applist": {"apps": []}}'
+                if self.path.startswith("/api/"):
+                    body = test.bodies.pop(0)
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_reused_and_age_gate_passed(self):
+        t = transport.Transport(self.url, connections_per_host=2)
+        for appid in (10, 20, 30):
+            resp = t.get(self.url + "/app/" + str(appid))
+            self.assertEqual((resp.status_code, resp.url), (200, self.url + "/app/" + str(appid)),
+                             "Store page redirected to the age check")
+        self.assertEqual(self.connections, 1, "Connection not kept alive")
+        self.assertIn("birthtime=" + transport.BIRTHTIME, self.cookies[0], "Age gate cookies not sent")
+
+    def test_overloaded_response_not_cached(self):
+        folder = tempfile.mkdtemp()
+        cache_file = os.path.join(folder, "cache.db")
+        s = OutOfOrderScraper(write_scraper_config(folder, os.path.join(folder, "db")), False)
+        s.transport = transport.Transport(self.url)
+        s.rate_limiter = rate_limiter.RateLimiter({rate_limiter.DEFAULT: 1000})
+        s.cache = http_cache.ResponseCache(cache_file, ttl=3600, max_size=1024 * 1024)
+        self.bodies = [b"null", b'{"10": {"success": false}}']
+        url = self.url + "/api/appdetails?appids=10"
+        try:
+            self.assertEqual(s.fetch(url, validate=app_details.is_response).content, b"null", "Response not returned")
+            for attempt in range(2):
+                self.assertEqual(s.fetch(url, validate=app_details.is_response).content,
+                                 b'{"10": {"success": false}}', "Overloaded response cached or valid one not cached")
+        finally:
+            s.cache.close()
+            shutil.rmtree(folder)
+
+    def test_download(self):
+        filename = TESTING_FOLDER + "download.json"
+        transport.Transport(self.url).download(self.url + "/ISteamApps/GetAppList/v0002/", filename)
+        with open(filename, "r") as f:
+            self.assertEqual(json.load(f), {"applist": {"apps": []}}, "Download not saved")
+        os.remove(filename)
+
+
+class TestPriceScraper(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db = TESTING_FOLDER+"testing_database.db"
+        self.conn = sqlite3.connect(self.test_db)
+        with self.conn:
+            db_handler.DBHandler.create_tables(self.conn.cursor())
+            self.conn.executemany("insert into games (id, name, price) values (?, ?, ?)", [(10, "A", 0), (20, "B", 0)])
+        self.folder = tempfile.mkdtemp()
+        self.price_scraper = price_scraper.PriceScraper(write_scraper_config(self.folder, self.test_db), False)
+        self.price_scraper.writer = DBWriter(self.test_db)
+        self.price_scraper.total = 1
+
+    def test_parse_price(self):
+        data = {"price_overview": {"currency": "USD", "initial": 999, "final": 499, "discount_percent": 50}}
+        self.assertEqual(price_scraper.PriceScraper.parse_price(data), ("USD", 999, 499, 50),
+                         "Price overview not parsed correctly")
+        self.assertEqual(price_scraper.PriceScraper.parse_price([]), (None, 0, 0, 0),
+                         "Game without a price not parsed correctly")
+
+    def test_only_changed_prices_are_recorded(self):
+        self.price_scraper.last_prices = {10: ("USD", 999, 999, 0)}
+        self.price_scraper.new_record({10: ("USD", 999, 999, 0), 20: ("USD", 1999, 1999, 0)}, (10, 20))
+        self.price_scraper.new_record({10: ("USD", 999, 499, 50), 20: ("USD", 1999, 1999, 0)}, (10, 20))
+        self.price_scraper.writer.close()
+        rows = self.conn.execute("select gameid, final from price_history order by gameid").fetchall()
+        self.assertEqual(rows, [(10, 499), (20, 1999)], "Unchanged prices were recorded")
+        self.assertEqual(self.conn.execute("select price from games where id = 20").fetchone()[0], 1999,
+                         "Game price was not updated")
+
+    def tearDown(self):
+        self.price_scraper.writer.close()
+        self.conn.close()
+        os.remove(TESTING_FOLDER+"testing_database.db")
+        shutil.rmtree(self.folder)
+
+
+class FakeResponse:
+
+    def __init__(self, content, headers=None):
+        self.status_code = 200
+        self.content = content
+        self.headers = headers if headers is not None else {}
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_file = TESTING_FOLDER+"testing_cache.db"
+        self.cache = http_cache.ResponseCache(self.cache_file, ttl=3600, max_size=10 * 1024)
+
+    def test_fresh_response_is_served(self):
+        self.cache.store("http://a", FakeResponse(b'{"key": "value"}', {"ETag": "abc"}))
+        response, fresh = self.cache.get("http://a")
+        self.assertTrue(fresh, "Cached response is not fresh")
+        self.assertEqual(response.json(), {"key": "value"}, "Cached body was not restored")
+        self.assertEqual(http_cache.ResponseCache.conditional_headers(response), {"If-None-Match": "abc"},
+                         "Conditional request headers not built from the ETag")
+
+    def test_stale_response_is_revalidated(self):
+        self.cache.ttl = 0
+        self.cache.store("http://a", FakeResponse(b"body"))
+        response, fresh = self.cache.get("http://a")
+        self.assertFalse(fresh, "Response older than the TTL is served as fresh")
+        self.cache.ttl = 3600
+        self.cache.revalidate("http://a")
+        response, fresh = self.cache.get("http://a")
+        self.assertTrue(fresh, "Revalidated response is not fresh")
+
+    def test_empty_filename_disables_cache(self):
+        folder = tempfile.mkdtemp()
+        shared = http_cache._shared
+        http_cache._shared = None
+        try:
+            config = common.read_config_file(write_scraper_config(folder, os.path.join(folder, "db"),
+                                                                  CACHE_FILENAME="# left empty"))
+            self.assertEqual(config["CACHE_FILENAME"], "", "Empty value not read as an empty string")
+            self.assertIsNone(http_cache.get_shared_cache(config), "Cache enabled with an empty CACHE_FILENAME")
+        finally:
+            http_cache._shared = shared
+            shutil.rmtree(folder)
+
+    def test_least_recently_used_are_evicted(self):
+        for i in range(30):
+            self.cache.store("http://" + str(i), FakeResponse(os.urandom(1024)))
+        self.assertLessEqual(self.cache.size, self.cache.max_size, "Cache grew over its maximum size")
+        self.assertIsNone(self.cache.get("http://0")[0], "Least recently used response was not evicted")
+        self.assertIsNotNone(self.cache.get("http://29")[0], "Most recently used response was evicted")
+
     def tearDown(self):
+        self.cache.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.cache_file + suffix):
+                os.remove(self.cache_file + suffix)
+
+
+class TestUpdateGamesScraper(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db = TESTING_FOLDER+"testing_database.db"
+        self.conn = sqlite3.connect(self.test_db)
+        with self.conn:
+            db_handler.DBHandler.create_tables(self.conn.cursor())
+            self.conn.execute("insert into games (id, name) values (10, 'Game')")
+            self.conn.executemany("insert into languages (name, gameid) values (?, 10)", [("English",), ("French",)])
+        self.folder = tempfile.mkdtemp()
+        self.scraper = games_update_scraper.UpdateGamesScraper(write_scraper_config(self.folder, self.test_db), False)
+        self.scraper.conn = sqlite3.connect(self.test_db)
+        self.scraper.writer = DBWriter(self.test_db)
+        self.scraper.fingerprints = {}
+        self.scraper.total = 1
+        self.data = {"name": "Game", "is_free": False, "supported_languages": "French, German"}
+
+    def update(self):
+        body = json.dumps({"10": {"success": True, "data": self.data}}).encode()
+        self.scraper.new_record(app_details.parse_response(body, self.scraper.date_formatter), 10)
+
+    def languages(self):
+        return self.conn.execute("select rowid, name from languages order by name").fetchall()
+
+    def test_only_changed_rows_are_rewritten(self):
+        french = self.languages()[1]
+        self.update()
+        self.scraper.writer.flush()
+        languages = self.languages()
+        self.assertEqual([name for rowid, name in languages], ["French", "German"], "Languages not updated")
+        self.assertEqual(languages[0], french, "Unchanged row was deleted and inserted again")
+        self.assertEqual(self.scraper.new, 1, "Record without a fingerprint not counted as new")
+
+    def test_unchanged_record_is_skipped(self):
+        self.update()
+        self.update()
+        self.scraper.writer.flush()
+        self.data["supported_languages"] = "German"
+        self.update()
+        self.scraper.writer.flush()
+        self.assertEqual((self.scraper.new, self.scraper.unchanged, self.scraper.changed), (1, 1, 1),
+                         "Unchanged/changed/new records not counted properly")
+        self.assertEqual([name for rowid, name in self.languages()], ["German"], "Languages not updated")
+
+    def test_descriptions_are_stored_once(self):
+        description = "<p>" + "A game about games. " * 50 + "</p>"
+        self.data.update({"detailed_description": description, "about_the_game": description,
+                          "short_description": "Short"})
+        self.update()
+        self.scraper.writer.flush()
+        descriptions.register(self.conn)
+        self.assertEqual(self.conn.execute("select detailed_description, about_the_game, short_description "
+                                           "from game_descriptions where gameid=10").fetchone(),
+                         (description, description, "Short"), "Descriptions not read back through the view")
+        blobs = self.conn.execute("select codec, length(data) from description_blobs order by id").fetchall()
+        self.assertEqual(len(blobs), 2, "Identical descriptions not stored once")
+        self.assertEqual(blobs[0][0], compression.CODEC, "Description not compressed")
+        self.assertLess(blobs[0][1], len(description) / 4, "Description not compressed")
+        self.assertEqual(blobs[1], (compression.NONE, 5), "Short description stored compressed although larger")
+
+        self.data["short_description"] = "Shorter"
+        self.update()
+        self.scraper.writer.flush()
+        self.assertEqual(descriptions.delete_unreferenced(self.conn), 1, "Previous description not deleted")
+        self.assertEqual(self.conn.execute("select short_description from game_descriptions").fetchone(),
+                         ("Shorter",), "Description not updated")
+
+    def tearDown(self):
+        self.scraper.writer.close()
+        self.scraper.conn.close()
+        self.conn.close()
         os.remove(TESTING_FOLDER+"testing_database.db")
+        shutil.rmtree(self.folder)
+
+
+class TestProgressJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.file = TESTING_FOLDER+"testing_journal.json"
+        self.folder = tempfile.mkdtemp()
+
+    def test_watermark_and_out_of_order_completions(self):
+        journal = ProgressJournal(self.file, "test")
+        journal.save()
+        self.assertFalse(os.path.exists(self.file), "Journal saved before the run started")
+        journal.start([10, 20, 30, 40])
+        journal.mark_done(20)
+        journal.mark_done(10)
+        journal.mark_done(40)
+        self.assertEqual(journal.watermark, 20, "Watermark not advanced over contiguous completions")
+        self.assertEqual(journal.completed, {40}, "Out of order completion not kept")
+        journal.save()
+        resumed = ProgressJournal(self.file, "test")
+        self.assertTrue(resumed.resumed, "Saved journal was not resumed")
+        self.assertEqual([key for key in (10, 20, 30, 40) if not resumed.is_done(key)], [30],
+                         "Resumed journal does not skip completed records")
+        self.assertFalse(ProgressJournal(self.file, "other").resumed, "Journal of another runtype was resumed")
+
+    def test_finished_journal_is_removed(self):
+        journal = ProgressJournal(self.file, "test")
+        journal.start([10])
+        journal.save()
+        journal.finish()
+        journal.save()
+        self.assertFalse(os.path.exists(self.file), "Journal of a finished run was kept")
+
+    def test_empty_filename_disables_journal(self):
+        config = write_scraper_config(self.folder, os.path.join(self.folder, "db"), JOURNAL_FILENAME="# left empty")
+        self.assertIsNone(InterruptedScraper(config, False).journal, "Journal enabled with an empty JOURNAL_FILENAME")
+
+    def test_interrupted_run_is_resumed(self):
+        config = write_scraper_config(self.folder, os.path.join(self.folder, "db"),
+                                      JOURNAL_FILENAME=os.path.join(self.folder, "progress"))
+        interrupted = InterruptedScraper(config, False)
+        interrupted.journal.filename = self.file
+        with self.assertRaises(KeyboardInterrupt):
+            interrupted.start_scraping()
+        resumed = InterruptedScraper(config, False)
+        resumed.journal = ProgressJournal(self.file, "test")
+        resumed.interrupt_at = None
+        resumed.start_scraping()
+        recorded = [appid for appid, data in interrupted.recorded + resumed.recorded]
+        self.assertEqual(sorted(recorded), [1, 2, 4, 5, 6], "Records were lost or scraped twice on resume")
+        self.assertFalse(os.path.exists(self.file), "Journal was kept after the run completed")
+
+    def test_interrupted_update_is_resumed(self):
+        database = os.path.join(self.folder, "db")
+        conn = sqlite3.connect(database)
+        migrations.migrate(conn, log=lambda message: None)
+        with conn:
+            conn.executemany("insert into games (id, name) values (?, 'Game')", [(appid,) for appid in range(10, 60, 10)])
+        config = write_scraper_config(self.folder, database, JOURNAL_FILENAME=os.path.join(self.folder, "progress"))
+        interrupted = InterruptedUpdateScraper(config, False)
+        self.assertEqual(list(interrupted.games_list), [50, 40, 30, 20, 10], "Games not ordered stalest first")
+        with self.assertRaises(KeyboardInterrupt):
+            interrupted.start_scraping()
+        resumed = InterruptedUpdateScraper(config, False)
+        resumed.interrupt_at = None
+        resumed.start_scraping()
+        self.assertEqual(resumed.fetched, [30, 20, 10], "Games refreshed before the interruption fetched again")
+        self.assertEqual(conn.execute("select count(*) from fetch_log where fetches = 1").fetchone(), (5,),
+                         "Games not refreshed once each")
+        self.assertEqual(glob.glob(os.path.join(self.folder, "progress*")), [],
+                         "Journal was kept after the run completed")
+        conn.close()
+
+    def tearDown(self):
+        if os.path.exists(self.file):
+            os.remove(self.file)
+        shutil.rmtree(self.folder)
+
+
+class TestAppList(unittest.TestCase):
+
+    def setUp(self):
+        self.content = '{"applist": {"apps": [{"appid": 30, "name": "Game \\"3\\" ]"}, {"appid": 10, "name": "A"},' \
+                       ' {"appid": 30, "name": "Game \\"3\\" ]"}, {"appid": 2000, "name": ""}]}}'
+
+    def test_iter_apps_across_chunks(self):
+        for chunk_size in (1, 7, 4096):
+            apps = list(app_list.iter_apps(io.StringIO(self.content), chunk_size))
+            self.assertEqual(apps, [(30, 'Game "3" ]'), (10, "A"), (30, 'Game "3" ]'), (2000, "")],
+                             "App list not parsed properly with chunks of " + str(chunk_size))
+
+    def test_load_appids_sorted_and_unique(self):
+        file = TESTING_FOLDER+"testing_allgames.json"
+        with open(file, "w") as f:
+            f.write(self.content)
+        try:
+            self.assertEqual(list(app_list.load_appids(file)), [10, 30, 2000], "Appids not sorted or unique")
+        finally:
+            os.remove(file)
+
+    def test_snapshot_roundtrip(self):
+        file = TESTING_FOLDER+"testing_allgames.json"
+        snapshot = TESTING_FOLDER+"testing_allgames.snapshot"
+        with open(file, "w") as f:
+            f.write(self.content)
+        try:
+            apps = app_list.load_apps(file)
+            self.assertEqual(list(apps[0]), [10, 30, 2000], "Apps not sorted or unique")
+            self.assertEqual(apps[1][2], 0, "Empty names should hash to 0")
+            self.assertIsNone(app_list.load_snapshot(snapshot), "Missing snapshot should load as None")
+            app_list.save_snapshot(snapshot, apps)
+            self.assertEqual(app_list.load_snapshot(snapshot), apps, "Snapshot not loaded back properly")
+        finally:
+            os.remove(file)
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+
+    def test_diff(self):
+        hashes = dict((name, app_list.name_hash(name)) for name in ("A", "B", "C"))
+        previous = (array("l", [1, 2, 3]), array("L", [hashes["A"], hashes["B"], hashes["C"]]))
+        current = (array("l", [2, 3, 4]), array("L", [hashes["B"], hashes["A"], hashes["C"]]))
+        delta = app_list.diff(previous, current)
+        self.assertEqual((list(delta.added), list(delta.removed), list(delta.renamed)), ([4], [1], [3]),
+                         "Delta between snapshots not computed properly")
+
+
+class TestHtmlExtractor(unittest.TestCase):
+
+    def setUp(self):
+        self.pages = {}
+        for filename in sorted(glob.glob(TESTING_FOLDER+"store_pages/*.html")):
+            with open(filename, "rb") as f:
+                self.pages[os.path.basename(filename)] = f.read()
+
+    def test_backends_match_beautifulsoup(self):
+        for name, page in self.pages.items():
+            expected = html_extractor.bs4_extract(page)
+            for backend in html_extractor.available_backends() + [html_extractor.AUTO]:
+                self.assertEqual(html_extractor.extract(page, backend), expected,
+                                 backend + " backend differs from BeautifulSoup on " + name)
+
+    def test_store_page(self):
+        page = self.pages["game.html"]
+        self.assertEqual(html_extractor.extract(page)["tags"], ["Metroidvania", "Souls-like", "Indie",
+                                                                "Great Soundtrack"], "Tags not extracted properly")
+        self.assertEqual(html_extractor.rating_from_rows(html_extractor.extract(page)["reviews"]), "97",
+                         "Rating not extracted properly")
+
+    def test_page_without_rating(self):
+        reviews = html_extractor.extract(self.pages["no_reviews.html"])["reviews"]
+        self.assertIsNone(html_extractor.rating_from_rows(reviews), "Missing rating not detected")
+        self.assertEqual(html_extractor.extract(self.pages["agecheck.html"]),
+                         {"tags": [], "reviews": [], "dlc": [], "features": []}, "Age check page not handled")
+
+
+    def test_auto_without_fallback_backend(self):
+        page = b'<div class="glance_tags popular_tags"><a class="app_tag">Indie</div>'  # Unclosed tag
+        self.assertIsNone(html_extractor.regex_extract(page), "Page no longer needs a fallback backend")
+        lxml, beautiful_soup = html_extractor.lxml, html_extractor.BeautifulSoup
+        html_extractor.lxml = html_extractor.BeautifulSoup = None
+        try:
+            with self.assertRaisesRegex(ValueError, "lxml or BeautifulSoup4"):
+                html_extractor.extract(page)
+        finally:
+            html_extractor.lxml, html_extractor.BeautifulSoup = lxml, beautiful_soup
+
+
+class TestStoreExtractors(unittest.TestCase):
+
+    def setUp(self):
+        with open(TESTING_FOLDER+"store_pages/game.html", "rb") as f:
+            self.page = f.read()
+
+    def test_extractors_from_config(self):
+        folder = tempfile.mkdtemp()
+        database = os.path.join(folder, "db")
+        conn = sqlite3.connect(database)
+        migrations.migrate(conn, log=lambda message: None)
+        conn.close()
+        try:
+            for value, expected in [("# left empty", list(store_extractors.REGISTRY)),
+                                    ("tags, , rating,", ["tags", "rating"])]:
+                config = write_scraper_config(folder, database, STORE_PAGE_EXTRACTORS=value)
+                self.assertEqual(store_page_scraper.StorePageScraper(config, False).extractor_names, expected,
+                                 "Extractors not read from STORE_PAGE_EXTRACTORS: " + value)
+        finally:
+            shutil.rmtree(folder)
+
+    def test_all_extractors(self):
+        data = store_extractors.parse_page(self.page)
+        self.assertEqual(data["rating"], "97", "Rating not extracted properly")
+        self.assertEqual(data["reviews"], [("Recent Reviews", "Very Positive", 91, 2107),
+                                           ("All Reviews", "Overwhelmingly Positive", 97, 183521)],
+                         "Review counts not extracted properly")
+        self.assertEqual(data["dlc"], [(105610, "Hollow Crawler - Original Soundtrack"),
+                                       (105620, "Hollow Crawler: Gods & Nightmares")], "DLC not extracted properly")
+        self.assertEqual(data["controller_support"], "full", "Controller support not extracted properly")
+
+    def test_only_selected_extractors_run(self):
+        data = store_extractors.parse_page(self.page, ("rating", "dlc"))
+        self.assertEqual(sorted(data), ["dlc", "rating"], "Extractors not selected properly")
+        with self.assertRaises(ValueError):
+            store_extractors.get_extractors(("rating", "nonexistent"))
+
+    def test_extractors_write_their_tables(self):
+        db_file = TESTING_FOLDER+"testing_database.db"
+        if os.path.isfile(db_file):
+            os.remove(db_file)
+        conn = sqlite3.connect(db_file)
+        with conn:
+            db_handler.DBHandler.create_tables(conn.cursor())
+            conn.execute("insert into games (id, name) values(105600, 'Hollow Crawler')")
+            conn.execute("insert into tags (name, gameid) values('Old tag', 105600)")
+        writer = DBWriter(db_file)
+        data = store_extractors.parse_page(self.page)
+        with writer.record() as rec:
+            for extractor in store_extractors.get_extractors():
+                extractor.write(rec, 105600, data[extractor.NAME])
+        writer.close()
+        c = conn.cursor()
+        self.assertEqual([row[0] for row in c.execute("select name from tags where gameid=105600")],
+                         ["Metroidvania", "Souls-like", "Indie", "Great Soundtrack"], "Tags not replaced")
+        self.assertEqual(c.execute("select rating from games").fetchone()[0], 97, "Rating not written")
+        self.assertEqual(c.execute("select count(*) from reviews").fetchone()[0], 2, "Reviews not written")
+        self.assertEqual(c.execute("select count(*) from dlc").fetchone()[0], 2, "DLC not written")
+        self.assertEqual(c.execute("select support from controller_support").fetchone()[0], "full",
+                         "Controller support not written")
+        conn.close()
+        os.remove(db_file)
+
+
+class TestConsole(unittest.TestCase):
+
+    def test_progress_bar_throttled(self):
+        stream = io.StringIO()
+        progress = console.ProgressBar(stream, refresh_rate=1, enabled=True)
+        for current in range(1, 101):
+            progress.update(current, 100)
+        self.assertEqual(stream.getvalue().count("%"), 1, "Progress bar redrawn faster than its refresh rate")
+        progress.finish()
+        self.assertTrue(stream.getvalue().endswith("] 100%" + common.Color.ENDC), "Final progress not drawn")
+
+    def test_progress_bar_off_without_terminal(self):
+        stream = io.StringIO()
+        progress = console.ProgressBar(stream)
+        progress.update(50, 100)
+        progress.write_line("Message")
+        self.assertEqual(stream.getvalue(), "Message\n", "Progress bar drawn on a stream that is not a terminal")
+
+    def test_logfile(self):
+        logfile = TESTING_FOLDER + "test.log"
+        with open(logfile, "w") as f:
+            f.write("Previous run\n")
+        logger = console.create_logger("test", False, logfile, console.ProgressBar(io.StringIO()), logging.INFO)
+        logger.debug("Running ID 10...")
+        logger.info("Record #10 inserted.")
+        logger.warning("Too many requests, waiting... #1")
+        console.flush_logger(logger)
+        with open(logfile, "r") as f:
+            lines = f.read().splitlines()
+        console.close_logger(logger)
+        os.remove(logfile)
+        self.assertEqual([line.split(" ", 2)[2] for line in lines],
+                         ["INFO    Record #10 inserted.", "WARNING Too many requests, waiting... #1"],
+                         "Logfile not truncated, or messages below the level written")
+
+
+class TestScheduler(unittest.TestCase):
+
+    NOW = 1700000000.0
+    DAY = 86400
+
+    def setUp(self):
+        self.test_db = TESTING_FOLDER + "testing_database.db"
+        self.conn = sqlite3.connect(self.test_db)
+        migrations.migrate(self.conn, log=lambda message: None)
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.test_db)
+
+    def test_staleness_weights(self):
+        base = scheduler.staleness(self.NOW, self.NOW - 10 * self.DAY, 10, 0, "2010-05-01", 10)
+        self.assertEqual(scheduler.staleness(self.NOW, None, 0, 0, "2010-05-01", 10), float("inf"),
+                         "Games never fetched don't come first")
+        self.assertGreater(scheduler.staleness(self.NOW, self.NOW - 20 * self.DAY, 10, 0, "2010-05-01", 10), base,
+                           "Older fetches are not staler")
+        self.assertGreater(scheduler.staleness(self.NOW, self.NOW - 10 * self.DAY, 10, 8, "2010-05-01", 10), base,
+                           "Frequently changing games are not staler")
+        self.assertGreater(scheduler.staleness(self.NOW, self.NOW - 10 * self.DAY, 10, 0, "2010-05-01", 10 ** 5),
+                           base, "Popular games are not staler")
+        self.assertGreater(scheduler.staleness(self.NOW, self.NOW - 10 * self.DAY, 10, 0, "2023-11-01", 10), base,
+                           "Recent releases are not staler")
+        self.assertGreater(base, 0, "Games that never changed are never refreshed")
+
+    def test_fetch_log_and_order(self):
+        self.conn.executemany("insert into games (id, name, release_date, recommendations) values(?,?,?,?)",
+                              [(10, "Dead", "2009-01-01", 5), (20, "Hit", "2023-10-01", 50000),
+                               (30, "New", "2009-01-01", 5), (40, "Popular", "2015-01-01", 100000)])
+        self.conn.commit()
+        writer = DBWriter(self.test_db)
+        for appid, fingerprints in ((10, ("a", "a", "a")), (20, ("a", "b", "c"))):
+            for days_ago, fingerprint in zip((30, 20, 10), fingerprints):
+                with writer.record() as rec:
+                    scheduler.log_fetch(rec, scheduler.APPDETAILS, appid, fingerprint, self.NOW - days_ago * self.DAY)
+        with writer.record() as rec:
+            scheduler.log_fetch(rec, scheduler.RATING, 30, "a", self.NOW)
+        writer.close()
+        self.assertEqual(self.conn.execute("select gameid, fetches, changes from fetch_log where source=? "
+                                           "order by gameid", (scheduler.APPDETAILS,)).fetchall(),
+                         [(10, 3, 0), (20, 3, 2)], "Fetches or changes not counted")
+        self.assertEqual(scheduler.stale_first(self.conn, scheduler.APPDETAILS, self.NOW), [40, 30, 20, 10],
+                         "Games not ordered by staleness")
 
 
 class TestSecondsToString(unittest.TestCase):
@@ -147,6 +1052,11 @@ class TestSecondsToString(unittest.TestCase):
         result = common.seconds_to_string(10)
         self.assertEqual(result, "0:00:10", "Seconds to String not outputting desired result")
 
+    def test_parse_duration(self):
+        self.assertEqual([common.parse_duration(value) for value in ("4h", "1h30m", "90s", "2d", "120")],
+                         [14400, 5400, 90, 172800, 120], "Durations not parsed properly")
+        self.assertRaises(ValueError, common.parse_duration, "soon")
+
 
 class TestDateFormatter(unittest.TestCase):
 
@@ -178,6 +1088,470 @@ class TestDateFormatter(unittest.TestCase):
             self.assertEqual(result, value, "Date Formatting testing failed")
 
 
+    def test_fast_path_matches_strptime(self):
+        self.df.add_input_format("%b %Y")
+
+        def strptime_only(entry):
+            for input_format in self.df.input_formats:
+                try:
+                    return datetime.datetime.strptime(self.df.trim(entry), input_format).strftime("%Y-%m-%d")
+                except ValueError:
+                    pass
+            return entry
+
+        for entry in ("Oct 18, 2026", "18 Oct, 2026", "Oct 2026", "OCT  18,   2026", "october 18 2026", " 5 Oct 2019",
+                      "1st Jan, 2020", "May 2020", "Feb 30, 2018", "31 Apr 2018", "Feb 29, 2020", "Sept 5, 2019",
+                      "Oct 18, 2026 ", "Q4 2026", "Coming soon", "2018", "", "18 Oct, 26"):
+            for i in range(2):  # Second pass goes through the memo
+                self.assertEqual(self.df.format_date(entry), strptime_only(entry), "Wrong date for " + repr(entry))
+
+    def test_pickled_formatter_is_shared(self):
+        self.assertIs(pickle.loads(pickle.dumps(self.df)), pickle.loads(pickle.dumps(self.df)),
+                      "Unpickled formatters don't share their memo")
+        self.assertEqual(pickle.loads(pickle.dumps(self.df)).format_date("Dec 20, 2018"), "2018-12-20",
+                         "Unpickled formatter lost its formats")
+
+
+class OutOfOrderScraper(scraper.Scraper):
+    """Scraper stub whose records complete in reverse order."""
+
+    def __init__(self, config_filename, verbose):
+        self.recorded = []
+        scraper.Scraper.__init__(self, config_filename, verbose)
+
+    def get_records_list(self):
+        return [1, 2, 3, 4, 5, 6]
+
+    def get_record(self, appid):
+        time.sleep(0.01 * (7 - appid))
+        if appid == 3:
+            return None
+        return appid * 10
+
+    def new_record(self, data, appid):
+        self.recorded.append((appid, data))
+
+    def on_finished(self):
+        pass
+
+
+def parse_body(body, factor):
+    """Parser of ParsingScraper, module level so that it can be sent to the parse processes."""
+    if body == b"broken":
+        raise ValueError("Broken body")
+    return int(body) * factor
+
+
+class ParsingScraper(OutOfOrderScraper):
+    """Scraper stub returning raw bodies that have to go through a parser."""
+
+    def get_record(self, appid):
+        if appid == 3:
+            return None
+        return b"broken" if appid == 5 else str(appid).encode()
+
+    def get_parser(self):
+        return parse_body, (10,)
+
+
+class InterruptedScraper(OutOfOrderScraper):
+    """Scraper stub interrupted with Ctrl-C when it reaches a given appid."""
+
+    RUNTYPE = "test"
+
+    def __init__(self, config_filename, verbose):
+        self.interrupt_at = 4
+        OutOfOrderScraper.__init__(self, config_filename, verbose)
+
+    def get_record(self, appid):
+        return appid * 10 if appid != 3 else None
+
+    def new_record(self, data, appid):
+        if appid == self.interrupt_at:
+            raise KeyboardInterrupt()
+        OutOfOrderScraper.new_record(self, data, appid)
+
+
+class InterruptedUpdateScraper(games_update_scraper.UpdateGamesScraper):
+    """Update scraper answered by a canned appdetails response, interrupted with Ctrl-C at a given appid."""
+
+    def __init__(self, config_filename, verbose):
+        self.interrupt_at = 30
+        self.fetched = []
+        games_update_scraper.UpdateGamesScraper.__init__(self, config_filename, verbose)
+
+    def get_record(self, appid):
+        self.fetched.append(appid)
+        data = {"name": "Game " + str(appid), "is_free": False}
+        return json.dumps({str(appid): {"success": True, "data": data}}).encode()
+
+    def new_record(self, data, appid):
+        if appid == self.interrupt_at:
+            raise KeyboardInterrupt()
+        games_update_scraper.UpdateGamesScraper.new_record(self, data, appid)
+
+
+class TestConcurrentScraping(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.config = write_scraper_config(self.folder, os.path.join(self.folder, "db"), CONCURRENT_REQUESTS=4)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_all_records_completed(self):
+        s = OutOfOrderScraper(self.config, False)
+        s.CONCURRENT_REQUESTS = 3
+        s.start_scraping()
+        self.assertEqual(s.current, s.total, "Not every record was counted as completed")
+        self.assertEqual(sorted(s.recorded), [(1, 10), (2, 20), (4, 40), (5, 50), (6, 60)],
+                         "Records were lost or duplicated when completing out of order")
+
+    def test_starting_appid_skips_records(self):
+        s = OutOfOrderScraper(self.config, False)
+        s.starting_number = 4
+        s.start_scraping()
+        self.assertEqual(s.current, s.total, "Skipped records are not counted as completed")
+        self.assertEqual(sorted(s.recorded), [(4, 40), (5, 50), (6, 60)], "Records below STARTING_APPID were scraped")
+
+    def test_budget(self):
+        s = OutOfOrderScraper(self.config, False)
+        s.start_scraping(budget=0)
+        self.assertEqual((s.current, s.recorded), (0, []), "Records started after the budget was exhausted")
+
+    def test_bodies_parsed_on_processes(self):
+        for processes in (0, 2):
+            s = ParsingScraper(self.config, False)
+            s.PARSE_PROCESSES = processes
+            s.PARSE_QUEUE_SIZE = 1
+            s.start_scraping()
+            self.assertEqual(s.current, s.total, "Not every record was counted as completed")
+            self.assertEqual(sorted(s.recorded), [(1, 10), (2, 20), (4, 40), (6, 60)],
+                             "Records were not parsed properly with " + str(processes) + " processes")
+            self.assertEqual((s.stats.stages["fetch"].items, s.stats.stages["parse"].items,
+                              s.stats.stages["write"].items), (6, 4, 4), "Stage throughput not counted properly")
+
+    def test_report(self):
+        s = OutOfOrderScraper(self.config, False)
+        s.start_scraping()
+        report = s.report()
+        self.assertEqual((report["records"], report["stages"]["write"]["items"]), (6, 5),
+                         "Report doesn't count every record")
+        self.assertLessEqual(report["latency_p50"], report["latency_p99"], "Latency percentiles out of order")
+        self.assertGreater(report["latency_p50"], 0, "Latency of the records not measured")
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db = TESTING_FOLDER + "testing_database.db"
+        self.directory = TESTING_FOLDER + "export"
+        self.conn = sqlite3.connect(self.test_db)
+        migrations.migrate(self.conn, log=lambda message: None)
+        with self.conn:
+            self.conn.executemany("insert into games (id, name, is_free, price) values(?,?,?,?)",
+                                  [(10, "A", 1, 0), (20, "B", 0, "999"), (30, "C", None, None)])
+            self.conn.executemany("insert into tags (name, gameid) values(?,?)",
+                                  [("Indie", 10), ("RPG", 10), ("Indie", 30)])
+            self.conn.executemany("insert into platforms (name, status, gameid) values(?,?,?)",
+                                  [("windows", 1, 20), ("linux", 0, 20)])
+            self.conn.execute("insert into dlc (dlcid, name, gameid) values(5, 'Orphan', 25)")
+            c = self.conn.cursor()
+            c.execute("update games set short_description_blob=%s where id=10" % descriptions.BLOB_ID,
+                      (descriptions.store(c, "Short"),))
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.test_db)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def read_csv(self, table):
+        with gzip.open(os.path.join(self.directory, table + ".csv.gz"), "rt", encoding="utf-8", newline="") as f:
+            return list(csv.reader(f))
+
+    def test_csv_in_chunks(self):
+        rows = export.Exporter(self.test_db, self.directory, export.CSV, chunk_size=2).export()
+        self.assertEqual((rows["games"], rows["tags"], rows["dlc"]), (3, 3, 1), "Rows not all exported")
+        games = self.read_csv("games")
+        self.assertEqual([row[:2] for row in games], [["id", "name"], ["10", "A"], ["20", "B"], ["30", "C"]],
+                         "Games not exported in order")
+        self.assertNotIn("short_description_blob", games[0], "Blob references exported")
+        self.assertEqual([row[games[0].index("short_description")] for row in games[1:]], ["Short", "", ""],
+                         "Descriptions not read from their blobs")
+        self.assertEqual(self.read_csv("tags")[1:], [["10", "Indie"], ["10", "RPG"], ["30", "Indie"]],
+                         "Child table not exported properly")
+        self.assertEqual(self.read_csv("dlc")[1:], [["25", "5", "Orphan"]],
+                         "Child rows between two chunks not exported")
+
+    def test_csv_joined(self):
+        rows = export.Exporter(self.test_db, self.directory, export.CSV, chunk_size=2, join=True).export()
+        self.assertEqual(list(rows.keys()), ["games"], "Child tables exported on their own when joined")
+        games = self.read_csv("games")
+        header = games[0]
+        self.assertEqual([json.loads(row[header.index("tags")]) for row in games[1:]], [["Indie", "RPG"], [], ["Indie"]],
+                         "Tags not joined as lists")
+        self.assertEqual(json.loads(games[2][header.index("platforms")]),
+                         [{"name": "windows", "status": True}, {"name": "linux", "status": False}],
+                         "Child tables with several columns not joined as records")
+
+    def test_failed_export_leaves_no_partial_files(self):
+        export.Exporter(self.test_db, self.directory, export.CSV).export()
+        failing = export.Exporter(self.test_db, self.directory, export.CSV, chunk_size=2)
+
+        def read_children(conn, table, columns, lower, upper):
+            if lower > export.MIN_ID:
+                raise sqlite3.OperationalError("disk I/O error")
+            return export.Exporter.read_children(conn, table, columns, lower, upper)
+        failing.read_children = read_children
+        with self.assertRaises(sqlite3.OperationalError):
+            failing.export()
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith(".part")], [],
+                         "Partly written files left behind")
+        self.assertEqual(len(self.read_csv("games")), 4, "Previous export not kept")
+
+    @unittest.skipIf(export.pyarrow is None, "pyarrow is not installed")
+    def test_parquet_joined(self):
+        export.Exporter(self.test_db, self.directory, export.PARQUET, chunk_size=2, join=True).export()
+        table = export.pyarrow.parquet.read_table(os.path.join(self.directory, "games.parquet"))
+        games = table.to_pylist()
+        self.assertEqual([game["price"] for game in games], [0, 999, None], "Values not converted to the column type")
+        self.assertEqual([game["tags"] for game in games], [["Indie", "RPG"], [], ["Indie"]], "Tags not joined")
+
+    def test_unavailable_format(self):
+        if export.pyarrow is None:
+            self.assertEqual(export.resolve_format(export.AUTO), export.CSV, "auto doesn't fall back to csv")
+            self.assertRaises(ValueError, export.resolve_format, export.PARQUET)
+        else:
+            self.assertEqual(export.resolve_format(export.AUTO), export.PARQUET, "auto doesn't prefer parquet")
+        self.assertRaises(ValueError, export.resolve_format, "xlsx")
+
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db = TESTING_FOLDER + "testing_database.db"
+        self.conn = sqlite3.connect(self.test_db)
+        migrations.migrate(self.conn, log=lambda message: None)
+        with self.conn:
+            c = self.conn.cursor()
+            for game in [(10, "Dungeon Café", "A <b>roguelike</b>", "<p>Crawl &amp; loot</p>"),
+                         (20, "Farm Life", "Farming", "<img src=\"roguelike.png\"><p>Not a dungeon</p>")]:
+                c.execute("insert into games (id, name, short_description_blob, detailed_description_blob) "
+                          "values(?,?,%s,%s)" % (descriptions.BLOB_ID, descriptions.BLOB_ID),
+                          game[:2] + (descriptions.store(c, game[2]), descriptions.store(c, game[3])))
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.test_db)
+
+    def test_strip_html(self):
+        self.assertEqual(search.strip_html("<p>Crawl &amp;\n<br>loot</p>"), "Crawl & loot", "HTML not stripped")
+        self.assertIsNone(search.strip_html(None), "Missing descriptions should stay missing")
+
+    def test_match_query(self):
+        self.assertEqual(search.match_query('rogue* "dungeon AND'), '"rogue"* """dungeon" "AND"',
+                         "Query syntax not escaped")
+
+    def test_index_and_search(self):
+        self.assertTrue(search.create_index(self.conn, log=lambda message: None), "Search index not created")
+        self.assertEqual([appid for appid, name, score in search.search(self.conn, "dungeon")], [10, 20],
+                         "Matches in names don't rank first")
+        self.assertEqual(search.search(self.conn, "roguelike png"), [], "Markup indexed")
+        self.assertEqual([appid for appid, name, score in search.search(self.conn, "cafe loot")], [10],
+                         "Accents or entities not handled")
+
+        writer = DBWriter(self.test_db)
+        with writer.record() as rec:
+            search.index_game(rec, 20, {"name": "Farm Life", "short_description": "A cosy <i>farming</i> sim"})
+        writer.close()
+        self.assertEqual([appid for appid, name, score in search.search(self.conn, "cosy farm*")], [20],
+                         "Game not reindexed")
+        self.assertEqual(search.search(self.conn, "dungeon")[0][0], 10, "Previous document of a game still indexed")
+        self.assertEqual(len(search.search(self.conn, "dungeon")), 1, "Previous document of a game still indexed")
+
+    def test_interrupted_build_leaves_no_index(self):
+        def interrupt(message):
+            raise KeyboardInterrupt()
+        with self.assertRaises(KeyboardInterrupt):
+            search.create_index(self.conn, log=interrupt)
+        self.assertFalse(search.has_index(self.conn), "Partial index left behind")
+        self.assertTrue(search.create_index(self.conn, log=lambda message: None), "Search index not created")
+        self.assertEqual(len(search.search(self.conn, "dungeon")), 2, "Index not filled")
+
+    def test_recreate_database(self):
+        search.create_index(self.conn, log=lambda message: None)
+        db_handler.DBHandler.create_tables(self.conn.cursor())
+        self.assertFalse(search.has_index(self.conn), "Search index not dropped with the database")
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.archive = archive.Archive(self.folder)
+
+    def tearDown(self):
+        self.archive.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def segment_sizes(self):
+        return [os.path.getsize(self.archive.segment_path(segment)) for segment in self.archive.segments()]
+
+    def test_append_and_read(self):
+        self.archive.append(archive.APPDETAILS, 20, b'{"20": {"success": false}}', fetched_at=2)
+        self.archive.append(archive.APPDETAILS, 10, b"{}" * 100, fetched_at=1)
+        self.archive.append(archive.STORE_PAGE, 10, b"<html></html>")
+        self.assertEqual(self.archive.read(archive.APPDETAILS, 10), b"{}" * 100, "Payload not read back")
+        self.assertEqual(self.archive.read(archive.STORE_PAGE, 10), b"<html></html>", "Sources mixed up")
+        self.assertIsNone(self.archive.read(archive.STORE_PAGE, 20), "Missing payload found")
+        self.archive.close()
+        reopened = archive.Archive(self.folder)
+        self.assertEqual(reopened.entries(archive.APPDETAILS), [(20, 2), (10, 1)], "Entries not in storage order")
+        self.assertEqual(reopened.read(archive.APPDETAILS, 20), b'{"20": {"success": false}}',
+                         "Payload not read back after reopening")
+        reopened.close()
+
+    def test_identical_response_not_stored_twice(self):
+        self.archive.append(archive.APPDETAILS, 10, b"first", fetched_at=1)
+        size = self.segment_sizes()
+        self.archive.append(archive.APPDETAILS, 10, b"first", fetched_at=2)
+        self.assertEqual(self.segment_sizes(), size, "Identical response appended again")
+        self.assertEqual(self.archive.entries(archive.APPDETAILS), [(10, 2)], "Time of the response not updated")
+        self.archive.append(archive.APPDETAILS, 10, b"second", fetched_at=3)
+        self.assertEqual(self.archive.read(archive.APPDETAILS, 10), b"second", "Latest response not read")
+
+    def test_segments_roll_over(self):
+        self.archive.segment_size = 300
+        payloads = {appid: os.urandom(100) for appid in range(10)}
+        for appid, payload in payloads.items():
+            self.archive.append(archive.APPDETAILS, appid, payload)
+        self.assertEqual(len(self.archive.segments()), 5, "Segments not rolled over")
+        self.assertTrue(all(size <= 300 for size in self.segment_sizes()), "Segment larger than segment_size")
+        for appid, payload in payloads.items():
+            self.assertEqual(self.archive.read(archive.APPDETAILS, appid), payload, "Payload not read back")
+
+    def test_uncommitted_records_are_recovered(self):
+        self.archive.commit_interval = 3600
+        self.archive.append(archive.APPDETAILS, 10, b"committed")
+        self.archive.commit()
+        self.archive.append(archive.APPDETAILS, 20, b"not committed")
+        size = self.segment_sizes()[-1]
+        # Crash: the index loses its last transaction and a record is cut off halfway
+        self.archive.conn.close()
+        self.archive.conn = None
+        self.archive.file.write(archive.RECORD_HEADER.pack(archive.RECORD_MAGIC, 0, 0, 30, 0, 100) + b"cut")
+        self.archive.close()
+        self.archive = archive.Archive(self.folder)
+        self.assertEqual(self.archive.read(archive.APPDETAILS, 20), b"not committed", "Record not indexed again")
+        self.assertIsNone(self.archive.read(archive.APPDETAILS, 30), "Partly written record indexed")
+        self.assertEqual(self.segment_sizes()[-1], size, "Partly written record not cut off")
+
+    def test_records_of_rolled_over_segments_are_recovered(self):
+        self.archive.segment_size = 300
+        self.archive.commit_interval = 3600
+        self.archive.append(archive.APPDETAILS, 0, os.urandom(100))
+        self.archive.commit()
+        payloads = {appid: os.urandom(100) for appid in range(1, 6)}
+        for appid, payload in payloads.items():
+            self.archive.append(archive.APPDETAILS, appid, payload)
+        self.assertEqual(len(self.archive.segments()), 3, "Segments not rolled over")
+        self.archive.conn.close()  # Crash, the index loses its last transaction
+        self.archive.conn = None
+        self.archive.close()
+        self.archive = archive.Archive(self.folder)
+        for appid, payload in payloads.items():
+            self.assertEqual(self.archive.read(archive.APPDETAILS, appid), payload, "Record not indexed again")
+        self.assertEqual(len(self.archive.entries(archive.APPDETAILS)), 6, "Records indexed twice or lost")
+
+    def test_rebuild_index(self):
+        self.archive.segment_size = 300
+        for appid in range(5):
+            self.archive.append(archive.APPDETAILS, appid, os.urandom(100))
+        self.archive.append(archive.APPDETAILS, 3, b"latest")
+        self.archive.close()
+        os.remove(os.path.join(self.folder, archive.INDEX_FILENAME))
+        self.archive = archive.Archive(self.folder)
+        self.assertEqual(self.archive.rebuild_index(), 6, "Records not indexed")
+        self.assertEqual(len(self.archive.entries(archive.APPDETAILS)), 5, "Older records of an app still indexed")
+        self.assertEqual(self.archive.read(archive.APPDETAILS, 3), b"latest", "Latest record of an app not indexed")
+
+
+class TestReprocessGamesScraper(unittest.TestCase):
+
+    def setUp(self):
+        self.test_db = TESTING_FOLDER + "testing_database.db"
+        self.conn = sqlite3.connect(self.test_db)
+        migrations.migrate(self.conn, log=lambda message: None)
+        self.responses = {10: {"success": True, "data": {"name": "New", "is_free": True,
+                                                        "supported_languages": "English"}},
+                          20: {"success": False},
+                          30: {"success": True, "data": {"name": "New name", "is_free": False}}}
+        with self.conn:
+            self.conn.execute("insert into games (id, name) values (30, 'Old name')")
+        self.folder = tempfile.mkdtemp()
+        self.archive = archive.Archive(os.path.join(self.folder, "archive"))
+        for appid, data in self.responses.items():
+            self.archive.append(archive.APPDETAILS, appid, json.dumps({str(appid): data}).encode())
+        self.scraper = reprocess_scraper.ReprocessGamesScraper(write_scraper_config(self.folder, self.test_db), False)
+        self.scraper.archive = self.archive  # Not the archive shared by the process, it would outlive the test
+        self.scraper.conn = sqlite3.connect(self.test_db)
+        self.scraper.writer = DBWriter(self.test_db)
+
+    def tearDown(self):
+        self.scraper.writer.close()
+        self.scraper.conn.close()
+        self.conn.close()
+        self.archive.close()
+        os.remove(self.test_db)
+        shutil.rmtree(self.folder)
+
+    def test_games_rebuilt_from_archive(self):
+        appids = self.scraper.get_records_list()
+        self.assertEqual(appids, [10, 20, 30], "Archived responses not listed in storage order")
+        for appid in appids:
+            body = self.scraper.get_record(appid)
+            self.scraper.new_record(app_details.parse_response(body, self.scraper.date_formatter), appid)
+        self.scraper.writer.flush()
+        self.assertEqual(self.conn.execute("select id, name from games order by id").fetchall(),
+                         [(10, "New"), (30, "New name")], "Games not inserted or updated")
+        self.assertEqual(self.conn.execute("select gameid, name from languages").fetchall(), [(10, "English")],
+                         "Child rows not inserted")
+        self.assertEqual(self.conn.execute("select id from inaccessible").fetchall(), [(20,)],
+                         "Failed response not recorded")
+        self.assertEqual(self.conn.execute("select count(*) from fetch_log").fetchone()[0], 0,
+                         "Reprocessing logged as a fetch")
+        self.assertEqual((self.scraper.new, self.scraper.changed), (2, 0), "Records not counted")
+
+    def reprocess(self):
+        for appid in self.scraper.get_records_list():
+            body = self.scraper.get_record(appid)
+            self.scraper.new_record(app_details.parse_response(body, self.scraper.date_formatter), appid)
+        self.scraper.writer.flush()
+
+    def test_unchanged_response_repairs_rows(self):
+        # Rows written by a buggy parser from the same response as the archived one
+        self.responses[30]["data"]["supported_languages"] = "French, German"
+        self.archive.append(archive.APPDETAILS, 30, json.dumps({"30": self.responses[30]}).encode())
+        with self.conn:
+            self.conn.execute("insert into fingerprints (gameid, hash) values (30, ?)",
+                              (app_details.fingerprint(self.responses[30]["data"]),))
+            self.conn.executemany("insert into languages (name, gameid) values (?, 30)", [("French, German",)])
+        self.reprocess()
+        self.assertEqual(self.conn.execute("select name from languages where gameid=30 order by name").fetchall(),
+                         [("French",), ("German",)], "Rows of a game with an unchanged response not repaired")
+        self.assertEqual(self.conn.execute("select name from games where id=30").fetchone(), ("New name",),
+                         "Game with an unchanged response not rewritten")
+        self.assertEqual((self.scraper.new, self.scraper.changed, self.scraper.unchanged), (1, 1, 0),
+                         "Records not counted")
+
+    def test_failed_response_of_recorded_game(self):
+        self.archive.append(archive.APPDETAILS, 30, b'{"30": {"success": false}}')
+        self.reprocess()
+        self.assertEqual(self.conn.execute("select id from inaccessible").fetchall(), [(20,)],
+                         "Recorded game flagged as inaccessible")
+        self.assertEqual(self.conn.execute("select name from games where id=30").fetchone(), ("Old name",),
+                         "Recorded game changed by a failed response")
 
 
 if __name__ == '__main__':